@@ -42,6 +42,58 @@ class Settings:
 	upload_dir: Optional[str] = os.getenv("UPLOAD_DIR", "uploads")
 	web_base_url: Optional[str] = os.getenv("WEB_BASE_URL")
 
+	# Кэш лемм для сопоставления наименований (путь относительно корня проекта; пусто — без сохранения)
+	lemma_cache_path: Optional[str] = os.getenv("LEMMA_CACHE_PATH", "storage/lemma_cache.json")
+	lemma_cache_size: int = int(os.getenv("LEMMA_CACHE_SIZE", "100000"))
+	# Параллельный расчёт совпадений: число процессов (1 — без пула, 0 — по числу ядер; пул
+	# постоянный, процессы держат копию предложений) и минимальное число пар-кандидатов,
+	# начиная с которого пул оправдан
+	match_workers: int = int(os.getenv("MATCH_WORKERS", "1"))
+	match_parallel_min_pairs: int = int(os.getenv("MATCH_PARALLEL_MIN_PAIRS", "50000"))
+	# Размер кэша сходства пар токенов в пределах одного расчёта
+	match_token_memo_size: int = int(os.getenv("MATCH_TOKEN_MEMO_SIZE", "500000"))
+	# Ограничения отчёта ежедневной задачи: лучших пар на спрос и пар всего (0 — без ограничения)
+	match_top_k_per_demand: int = int(os.getenv("MATCH_TOP_K_PER_DEMAND", "0"))
+	match_max_pairs: int = int(os.getenv("MATCH_MAX_PAIRS", "0"))
+	# Кэш компонент score для /web/matches: число наборов и предельный размер D×S
+	match_component_cache_size: int = int(os.getenv("MATCH_COMPONENT_CACHE_SIZE", "4"))
+	match_component_max_cells: int = int(os.getenv("MATCH_COMPONENT_MAX_CELLS", "4000000"))
+	# Кэш результатов совпадений (веб, экспорт, бот, ежедневная задача): число наборов параметров
+	match_result_cache_size: int = int(os.getenv("MATCH_RESULT_CACHE_SIZE", "16"))
+	# Отбор кандидатов: "index" — индекс лемм в приложении, "pg_trgm" — в PostgreSQL
+	# (оператор % по GIN-индексу listings.title; без расширения — как "index")
+	match_candidates: str = os.getenv("MATCH_CANDIDATES", "index")
+	match_trgm_min_similarity: float = float(os.getenv("MATCH_TRGM_MIN_SIMILARITY", "0.2"))
+	match_trgm_same_location: bool = os.getenv("MATCH_TRGM_SAME_LOCATION", "false").lower() in ("1", "true", "yes")
+	# не более N кандидатов на запись (0 — все, кто прошёл порог similarity)
+	match_trgm_limit: int = int(os.getenv("MATCH_TRGM_LIMIT", "0"))
+	# iter_matches / потоковый экспорт: сколько спросов считать за один блок
+	match_iter_block: int = int(os.getenv("MATCH_ITER_BLOCK", "2000"))
+	# Движок "tfidf": сколько ближайших по наименованию предложений учитывать на спрос (0 — все)
+	match_tfidf_top_k: int = int(os.getenv("MATCH_TFIDF_TOP_K", "50"))
+	# Таблица matches: минимальный сохраняемый score (веса по умолчанию) и порог уведомления
+	# админ-чата о новых парах (0 — не уведомлять)
+	match_store_min_score: float = float(os.getenv("MATCH_STORE_MIN_SCORE", "0.3"))
+	match_notify_min_score: float = float(os.getenv("MATCH_NOTIFY_MIN_SCORE", "0.8"))
+	# Реализация расстояния Левенштейна: auto | rapidfuzz | levenshtein | python
+	edit_distance_backend: str = os.getenv("EDIT_DISTANCE_BACKEND", "auto")
+	# Диагностика: порог оценки сходства (MinHash) для групп похожих записей
+	diag_duplicate_min_similarity: float = float(os.getenv("DIAG_DUPLICATE_MIN_SIMILARITY", "0.8"))
+	# Список /web: записей на странице по умолчанию и наибольшее допустимое число; сколько
+	# секунд кэшировать число записей по фильтру
+	web_page_size: int = int(os.getenv("WEB_PAGE_SIZE", "50"))
+	web_max_page_size: int = int(os.getenv("WEB_MAX_PAGE_SIZE", "500"))
+	web_count_cache_seconds: float = float(os.getenv("WEB_COUNT_CACHE_SECONDS", "30"))
+	# Поиск по записям (веб, /найти): сколько лучших по ts_rank записей полнотекстового поиска
+	# PostgreSQL перепроверять нечётким сходством наименований (0 — все найденные)
+	search_fulltext_candidates: int = int(os.getenv("SEARCH_FULLTEXT_CANDIDATES", "300"))
+	# Сжатие HTML- и JSON-ответов (br/gzip): минимальный размер тела в байтах
+	compress_min_size: int = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+	# Пулы для тяжёлых участков обработчиков: потоки (БД, файлы, сеть) и процессы (чистые
+	# вычисления; 0 — по числу ядер)
+	executor_io_workers: int = int(os.getenv("EXECUTOR_IO_WORKERS", "8"))
+	executor_cpu_workers: int = int(os.getenv("EXECUTOR_CPU_WORKERS", "0"))
+
 	# Admin credentials for basic-auth (dev: simple, prod: use secrets)
 	admin_username: str = os.getenv("ADMIN_USERNAME", "admin")
 	admin_password: str = os.getenv("ADMIN_PASSWORD", "admin")
@@ -55,6 +107,11 @@ class Settings:
 		db = self.postgres_db
 		return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
 
+	@property
+	def async_database_url(self) -> str:
+		# та же база через asyncpg — для async_session_scope
+		return self.database_url.replace("+psycopg2", "+asyncpg", 1)
+
 
 def get_settings() -> Settings:
 	return Settings()
\ No newline at end of file
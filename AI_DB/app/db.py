@@ -1,26 +1,81 @@
-from contextlib import contextmanager
-from typing import Iterator
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, Optional
+from zoneinfo import ZoneInfo
 
-from sqlalchemy import create_engine
+import structlog
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 from app.config import get_settings
 
 
+logger = structlog.get_logger(__name__)
 settings = get_settings()
 engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False, class_=Session, future=True)
 Base = declarative_base()
 
+# Асинхронный движок (asyncpg) для обработчиков веба и бота. Создаётся при первом обращении:
+# соединения его пула привязаны к циклу событий процесса, а синхронным задачам (планировщик,
+# пулы run_io, скрипты) он не нужен
+_async_engine: AsyncEngine | None = None
+_AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
 
 def create_database_schema() -> None:
     # Импортировать модели перед созданием таблиц
     from app.models import users, listings, photos, reminders, audit_log  # noqa: F401
     from app.models import chat_messages  # noqa: F401
     from app.models import access_tokens  # noqa: F401
+    from app.models import listing_features  # noqa: F401
+    from app.models import listing_signatures  # noqa: F401
+    from app.models import matches  # noqa: F401
     Base.metadata.create_all(bind=engine)
 
 
+def ensure_trigram_index() -> bool:
+    """Расширение pg_trgm и GIN-индекс по listings.title (для MATCH_CANDIDATES=pg_trgm).
+    Идемпотентно, вызывается после create_database_schema. False — не PostgreSQL или
+    расширение недоступно (нет пакета/прав): кандидаты тогда отбираются в приложении.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_listings_title_trgm ON listings USING gin (title gin_trgm_ops)"))
+    except Exception as exc:
+        logger.warning("pg_trgm_unavailable", error=str(exc))
+        return False
+    return True
+
+
+def ensure_search_index() -> bool:
+    """Полнотекстовый поиск: генерируемый столбец listings.search_vector (русская конфигурация;
+    наименование — вес A, описание — B, значения характеристик — C) и GIN-индекс по нему.
+    Столбец пересчитывается самой СУБД при каждой записи. Идемпотентно; False — не PostgreSQL
+    или не удалось создать: поиск тогда идёт по леммам наименований в приложении.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE listings ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('russian', coalesce(description, '')), 'B') || "
+                "setweight(jsonb_to_tsvector('russian', coalesce(characteristics::jsonb, '{}'), '[\"string\", \"numeric\"]'), 'C')"
+                ") STORED"
+            ))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_listings_search_vector ON listings USING gin (search_vector)"))
+    except Exception as exc:
+        logger.warning("fulltext_search_unavailable", error=str(exc))
+        return False
+    return True
+
+
 @contextmanager
 def session_scope() -> Iterator[Session]:
     session = SessionLocal()
@@ -31,4 +86,67 @@ def session_scope() -> Iterator[Session]:
         session.rollback()
         raise
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+
+def _naive(value: Any, tz: Optional[ZoneInfo]) -> Any:
+    if not isinstance(value, datetime) or value.tzinfo is None:
+        return value
+    return (value.astimezone(tz) if tz is not None else value).replace(tzinfo=None)
+
+
+def _remember_session_timezone(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SHOW TIME ZONE")
+        name = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    try:
+        connection_record.info["session_tz"] = ZoneInfo(name)
+    except Exception:
+        logger.warning("db_session_timezone_unknown", timezone=name)
+
+
+def _naive_datetime_params(conn, cursor, statement, parameters, context, executemany):
+    # Столбцы DateTime — без часового пояса, а значения по умолчанию — datetime.now(ZoneInfo(...)).
+    # psycopg2 передаёт их как timestamptz, и PostgreSQL сохраняет время в часовом поясе сеанса;
+    # asyncpg такие значения отклоняет — приводим к тому же поясу сеанса и убираем tzinfo
+    tz = conn.info.get("session_tz")
+    if executemany:
+        return statement, [tuple(_naive(v, tz) for v in row) for row in parameters]
+    return statement, tuple(_naive(v, tz) for v in parameters)
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        _async_engine = create_async_engine(settings.async_database_url, pool_pre_ping=True)
+        if _async_engine.dialect.name == "postgresql":
+            event.listen(_async_engine.sync_engine, "connect", _remember_session_timezone)
+        event.listen(_async_engine.sync_engine, "before_cursor_execute", _naive_datetime_params, retval=True)
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+    return _async_engine
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """То же, что session_scope, но запросы не блокируют цикл событий."""
+    get_async_engine()
+    session = _AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine() -> None:
+    """Закрывает соединения асинхронного пула (при остановке приложения или бота)."""
+    global _async_engine, _AsyncSessionLocal
+    engine_, _async_engine, _AsyncSessionLocal = _async_engine, None, None
+    if engine_ is not None:
+        await engine_.dispose()
\ No newline at end of file
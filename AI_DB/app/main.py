@@ -2,13 +2,20 @@ import logging
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
-from app.db import create_database_schema
+from app.db import create_database_schema, dispose_async_engine, ensure_search_index, ensure_trigram_index, session_scope
+from app.repositories.listing_features import refresh_stale_features
 from app.routers.health import router as health_router
 from app.routers.ai import router as ai_router
 from app.routers.web import router as web_router
 from app.scheduler import start_scheduler
 from app.logging_config import setup_logging
 from app.services.storage import get_upload_dir
+from app.services.matching import warm_up as matching_warm_up
+from app.services.executor import cpu_executor, shutdown_executors
+from app.services.matching_parallel import shutdown_pool as shutdown_matching_pool
+from app.services.compression import CompressionMiddleware
+from app.services.static_assets import AssetStaticFiles
+from app.config import get_settings
 import structlog
 
 
@@ -16,6 +23,7 @@ setup_logging()
 logger = structlog.get_logger(__name__)
 
 app = FastAPI(title="AI DB Service")
+app.add_middleware(CompressionMiddleware, minimum_size=get_settings().compress_min_size)
 
 
 @app.on_event("startup")
@@ -23,14 +31,34 @@ def on_startup() -> None:
 	logger.info("app_startup_started")
 	create_database_schema()
 	logger.info("database_schema_created")
+	logger.info("pg_trgm_checked", available=ensure_trigram_index())
+	logger.info("fulltext_search_checked", available=ensure_search_index())
+	matching_warm_up()
+	logger.info("matching_warmed_up")
+	with session_scope() as session:
+		refreshed = refresh_stale_features(session)
+	logger.info("listing_features_refreshed", count=refreshed)
+	# таблица matches (устаревшая после обновления признаков, пустая или посчитанная с другими
+	# параметрами) пересчитывается задачей планировщика matches_rebuild, в фоне
 	start_scheduler()
 	logger.info("scheduler_started_from_main")
+	# воркеры пула процессов стартуют (spawn) заранее, а не на первом запросе
+	cpu_executor().warm_up()
 	logger.info("app_started", status="startup_completed")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+	shutdown_executors()
+	shutdown_matching_pool()
+	logger.info("executors_shut_down")
+	await dispose_async_engine()
+
+
 # Static and uploads
 app.mount("/uploads", StaticFiles(directory=str(get_upload_dir())), name="uploads")
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# сборка статики (python -m app.services.static_assets) — файлы с хэшем в имени и их .gz/.br
+app.mount("/static", AssetStaticFiles(directory="app/static"), name="static")
 
 app.include_router(health_router, prefix="/health", tags=["health"])
 app.include_router(ai_router, prefix="/ai", tags=["ai"])
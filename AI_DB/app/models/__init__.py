@@ -1,9 +1,12 @@
 from app.models.users import User
 from app.models.photos import Photo
 from app.models.listings import Listing
+from app.models.listing_features import ListingFeatures
+from app.models.listing_signatures import ListingSignature
+from app.models.matches import Match, MatchStoreState
 from app.models.reminders import Reminder
 from app.models.chat_messages import ChatMessage
 from app.models.access_tokens import AccessToken
 from app.models.audit_log import AuditLog
 
-__all__ = [User, Photo, Listing, Reminder, ChatMessage, AuditLog, AccessToken]
+__all__ = [User, Photo, Listing, ListingFeatures, ListingSignature, Match, MatchStoreState, Reminder, ChatMessage, AuditLog, AccessToken]
@@ -0,0 +1,20 @@
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import String, Integer, DateTime, Numeric, JSON, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class ListingFeatures(Base):
+    """Предрасчитанные признаки записи для сопоставления спроса и предложений."""
+    __tablename__ = "listing_features"
+
+    listing_id: Mapped[int] = mapped_column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True)
+    title_lemmas: Mapped[list[str]] = mapped_column(JSON, nullable=False, default=list)
+    location_key: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
+    characteristics_norm: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    price: Mapped[Decimal | None] = mapped_column(Numeric(14, 2), nullable=True)
+
+    # updated_at записи, по которой посчитаны признаки (для проверки актуальности)
+    listing_updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
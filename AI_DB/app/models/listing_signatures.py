@@ -0,0 +1,17 @@
+from datetime import datetime
+from sqlalchemy import Integer, DateTime, JSON, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class ListingSignature(Base):
+    """MinHash-подпись наименования и характеристик записи (похожие записи в диагностике)."""
+    __tablename__ = "listing_signatures"
+
+    listing_id: Mapped[int] = mapped_column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True)
+    # пустой список — у записи нет ни наименования, ни характеристик
+    minhash: Mapped[list[int]] = mapped_column(JSON, nullable=False, default=list)
+
+    # updated_at записи, по которой посчитана подпись (для проверки актуальности)
+    listing_updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
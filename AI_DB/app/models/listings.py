@@ -1,7 +1,7 @@
 from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import String, Integer, DateTime, Text, Numeric, Enum, JSON, func
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 from zoneinfo import ZoneInfo
 
 from app.db import Base
@@ -30,4 +30,7 @@ class Listing(Base):
     type: Mapped[str] = mapped_column(Enum(ListingTypeEnum.SALE, ListingTypeEnum.DEMAND, ListingTypeEnum.CONTRACT, name="listing_type"), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Asia/Tashkent")))
-    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Asia/Tashkent")), onupdate=lambda: datetime.now(ZoneInfo("Asia/Tashkent")))
\ No newline at end of file
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Asia/Tashkent")), onupdate=lambda: datetime.now(ZoneInfo("Asia/Tashkent")))
+
+    # Признаки для сопоставления; грузятся вместе с записью, т.к. сессии закрываются до расчёта совпадений
+    features: Mapped["ListingFeatures | None"] = relationship("ListingFeatures", uselist=False, lazy="selectin", cascade="all, delete-orphan", passive_deletes=True)
\ No newline at end of file
@@ -0,0 +1,42 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import Integer, Float, DateTime, ForeignKey, Index, JSON, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db import Base
+
+
+class Match(Base):
+    """Сохранённая пара спрос/предложение со score по весам по умолчанию.
+    Обновляется при создании, изменении и импорте записей (см. services.match_store).
+    """
+    __tablename__ = "matches"
+    __table_args__ = (
+        UniqueConstraint("demand_id", "sale_id", name="uq_matches_pair"),
+        Index("ix_matches_score", "score"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    demand_id: Mapped[int] = mapped_column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), nullable=False, index=True)
+    sale_id: Mapped[int] = mapped_column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), nullable=False, index=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Asia/Tashkent")))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Asia/Tashkent")), onupdate=lambda: datetime.now(ZoneInfo("Asia/Tashkent")))
+    # когда пара отправлена в админ-чат (None — ещё не отправлялась)
+    notified_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    demand: Mapped["Listing"] = relationship("Listing", foreign_keys=[demand_id], lazy="selectin")
+    sale: Mapped["Listing"] = relationship("Listing", foreign_keys=[sale_id], lazy="selectin")
+
+
+class MatchStoreState(Base):
+    """Параметры, с которыми посчитана таблица matches (одна строка, id=1): порог, веса, допуски.
+    params = None — таблица не посчитана или устарела; запросы тогда считаются без неё
+    (см. services.match_store.covers).
+    """
+    __tablename__ = "match_store_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    params: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    built_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
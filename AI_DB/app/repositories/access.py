@@ -4,6 +4,8 @@ from secrets import token_urlsafe
 from typing import Optional, List
 from zoneinfo import ZoneInfo
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.access_tokens import AccessToken
@@ -42,4 +44,31 @@ def cleanup_expired(session: Session) -> int:
 	for t in q.all():
 		session.delete(t)
 	session.commit()
-	return count
\ No newline at end of file
+	return count
+
+# Асинхронные версии (async_session_scope) — для обработчиков веба и бота
+
+
+async def create_token_async(session: AsyncSession, expires_at: Optional[datetime]) -> AccessToken:
+	entry = AccessToken(token=token_urlsafe(32), expires_at=expires_at)
+	session.add(entry)
+	await session.commit()
+	await session.refresh(entry)
+	return entry
+
+
+async def get_token_async(session: AsyncSession, value: str) -> Optional[AccessToken]:
+	return (await session.execute(select(AccessToken).filter_by(token=value).limit(1))).scalars().first()
+
+
+async def revoke_token_async(session: AsyncSession, value: str) -> bool:
+	entry = await get_token_async(session, value)
+	if not entry:
+		return False
+	await session.delete(entry)
+	await session.commit()
+	return True
+
+
+async def list_tokens_async(session: AsyncSession) -> List[AccessToken]:
+	return list((await session.execute(select(AccessToken).order_by(AccessToken.id.desc()))).scalars().all())
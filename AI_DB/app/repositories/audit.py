@@ -2,6 +2,8 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.audit_log import AuditLog
@@ -21,4 +23,30 @@ def list_audit(session: Session, date_from: Optional[datetime] = None, date_to:
 		q = q.filter(AuditLog.created_at >= date_from)
 	if date_to is not None:
 		q = q.filter(AuditLog.created_at <= date_to)
-	return q.order_by(AuditLog.id.desc()).all()
\ No newline at end of file
+	return q.order_by(AuditLog.id.desc()).all()
+
+
+async def log_event_async(session: AsyncSession, action: str, resource: Optional[str] = None, actor: Optional[str] = None, payload: Optional[Dict[str, Any]] = None, result: Optional[str] = None) -> AuditLog:
+	entry = AuditLog(action=action, resource=resource, actor=actor, payload=payload, result=result)
+	session.add(entry)
+	await session.commit()
+	await session.refresh(entry)
+	return entry
+
+
+async def list_audit_async(session: AsyncSession, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> List[AuditLog]:
+	q = select(AuditLog)
+	if date_from is not None:
+		q = q.filter(AuditLog.created_at >= date_from)
+	if date_to is not None:
+		q = q.filter(AuditLog.created_at <= date_to)
+	return list((await session.execute(q.order_by(AuditLog.id.desc()))).scalars().all())
+
+
+async def audit_version_async(session: AsyncSession) -> tuple[int, int, Optional[datetime]]:
+	"""Версия журнала для ETag: наименьший и наибольший id (записи только добавляются; удаление
+	старых меняет наименьший) и created_at последней записи — для Last-Modified. Всё — по
+	первичному ключу."""
+	last_at = select(AuditLog.created_at).order_by(AuditLog.id.desc()).limit(1).scalar_subquery()
+	min_id, max_id, last_created_at = (await session.execute(select(func.min(AuditLog.id), func.max(AuditLog.id), last_at))).one()
+	return int(min_id or 0), int(max_id or 0), last_created_at
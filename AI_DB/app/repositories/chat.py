@@ -1,6 +1,8 @@
 from __future__ import annotations
 from typing import List
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.chat_messages import ChatMessage
@@ -24,3 +26,16 @@ def get_last_messages(session: Session, telegram_id: int, limit: int = 10) -> Li
 		.all()
 	)[::-1]
 
+
+async def add_message_async(session: AsyncSession, telegram_id: int, role: str, text: str) -> ChatMessage:
+	msg = ChatMessage(telegram_id=str(telegram_id), role=role, text=text)
+	session.add(msg)
+	await session.commit()
+	await session.refresh(msg)
+	return msg
+
+
+async def get_last_messages_async(session: AsyncSession, telegram_id: int, limit: int = 10) -> List[ChatMessage]:
+	limit = max(1, min(limit, 50))
+	q = select(ChatMessage).filter(ChatMessage.telegram_id == str(telegram_id)).order_by(ChatMessage.id.desc()).limit(limit)
+	return list((await session.execute(q)).scalars().all())[::-1]
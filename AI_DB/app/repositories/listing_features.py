@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from sqlalchemy.orm import Session
+
+from app.models.listings import Listing
+from app.models.listing_features import ListingFeatures
+from app.services.match_cache import invalidate_match_caches
+from app.services.match_store import mark_matches_stale, update_listing_matches
+from app.services.matching import compute_features
+
+
+def upsert_listing_features(session: Session, listing: Listing, update_matches: bool = True) -> ListingFeatures:
+	"""Пересчитывает признаки сопоставления записи. Вызывать после изменения полей записи.
+	update_matches — заодно пересчитать пары записи в таблице matches и сбросить кэши совпадений;
+	с update_matches=False это делает вызывающий (один раз на группу записей).
+	"""
+	# flush: у новой записи появится id, у изменённой — актуальный updated_at
+	session.flush()
+	f = compute_features(listing)
+	row = session.get(ListingFeatures, listing.id)
+	if row is None:
+		row = ListingFeatures(listing_id=listing.id)
+	row.title_lemmas = list(f.lemmas)
+	row.location_key = f.location_key
+	row.characteristics_norm = f.characteristics
+	row.price = f.price
+	row.listing_updated_at = listing.updated_at
+	listing.features = row
+	if update_matches:
+		update_listing_matches(session, listing)
+		# запись создана/изменена — прежние результаты совпадений больше не годятся
+		invalidate_match_caches()
+	return row
+
+
+def refresh_stale_features(session: Session) -> int:
+	"""Досчитывает отсутствующие и устаревшие признаки. Возвращает число обновлённых записей."""
+	count = 0
+	for listing in session.query(Listing).all():
+		row = listing.features
+		if row is None or row.listing_updated_at != listing.updated_at:
+			# таблица matches после этого устарела: её пересчитывают целиком (см. match_store.ensure_matches)
+			upsert_listing_features(session, listing, update_matches=False)
+			count += 1
+	if count:
+		mark_matches_stale(session)
+	session.commit()
+	if count:
+		invalidate_match_caches()
+	return count
@@ -0,0 +1,35 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Collection, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.models.listing_signatures import ListingSignature
+
+
+def get_signatures(session: Session) -> Dict[int, ListingSignature]:
+	return {row.listing_id: row for row in session.query(ListingSignature).all()}
+
+
+def save_signature(
+	session: Session,
+	listing_id: int,
+	minhash: List[int],
+	listing_updated_at: datetime | None,
+	existing: ListingSignature | None = None,
+) -> ListingSignature:
+	"""Сохраняет подпись записи; existing — уже загруженная строка (без повторного запроса)."""
+	row = existing if existing is not None else session.get(ListingSignature, listing_id)
+	if row is None:
+		row = ListingSignature(listing_id=listing_id)
+		session.add(row)
+	row.minhash = list(minhash)
+	row.listing_updated_at = listing_updated_at
+	return row
+
+
+def delete_signatures(session: Session, listing_ids: Collection[int]) -> int:
+	"""Удаляет подписи удалённых записей (там, где нет ON DELETE CASCADE)."""
+	if not listing_ids:
+		return 0
+	return session.query(ListingSignature).filter(ListingSignature.listing_id.in_(list(listing_ids))).delete(synchronize_session=False)
@@ -1,12 +1,21 @@
 from __future__ import annotations
-from typing import Iterable, Optional, List
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional, List, Tuple
 from decimal import Decimal
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, select, text
 
 from app.models.listings import Listing
+from app.models.listing_features import ListingFeatures
 from app.models.photos import Photo
+from app.repositories.listing_features import upsert_listing_features
+from app.repositories.matches import delete_listing_matches, delete_listing_matches_async
+from app.services.match_cache import invalidate_match_caches
 from app.schemas.listing_parse import ParsedListing
 
 
@@ -36,6 +45,7 @@ def create_listing_from_parsed(session: Session, parsed: ParsedListing) -> Listi
 			photo = Photo(listing_id=listing.id, s3_key=link, url=link)
 			session.add(photo)
 
+	upsert_listing_features(session, listing)
 	session.commit()
 	session.refresh(listing)
 	return listing
@@ -50,8 +60,11 @@ def delete_listing_by_id(session: Session, listing_id: int) -> bool:
 	listing = session.get(Listing, listing_id)
 	if not listing:
 		return False
+	# в PostgreSQL пары удалит и ON DELETE CASCADE; явно — чтобы не зависеть от СУБД
+	delete_listing_matches(session, listing_id)
 	session.delete(listing)
 	session.commit()
+	invalidate_match_caches()
 	return True
 
 
@@ -59,6 +72,168 @@ def get_all_listings(session: Session) -> List[Listing]:
 	return session.query(Listing).order_by(Listing.id.asc()).all()
 
 
+def listings_data_version(session: Session) -> Tuple[Optional[datetime], int]:
+	"""Версия данных для кэшей совпадений: последнее изменение и число записей."""
+	last_updated, count = session.query(func.max(Listing.updated_at), func.count(Listing.id)).one()
+	return last_updated, int(count or 0)
+
+
+def _filter_listings(query, city: Optional[str], listing_type: Optional[str]):
+	# фильтры списка /web: точное совпадение города и тип (enum)
+	if city:
+		query = query.filter(Listing.location == city)
+	if listing_type:
+		query = query.filter(Listing.type == listing_type)
+	return query
+
+
+def page_listings(
+	session: Session,
+	*,
+	city: Optional[str] = None,
+	listing_type: Optional[str] = None,
+	limit: int = 50,
+	offset: int = 0,
+	before_id: Optional[int] = None,
+) -> List[Listing]:
+	"""Страница записей по убыванию id. before_id — курсор (id последней записи предыдущей
+	страницы): WHERE id < before_id по первичному ключу вместо OFFSET, который на дальних
+	страницах перебирает все пропущенные строки.
+	"""
+	query = _filter_listings(session.query(Listing), city, listing_type)
+	if before_id is not None:
+		query = query.filter(Listing.id < before_id)
+	query = query.order_by(Listing.id.desc())
+	if before_id is None and offset > 0:
+		query = query.offset(offset)
+	return query.limit(max(1, limit)).all()
+
+
+def get_listings_by_ids(session: Session, ids: List[int]) -> List[Listing]:
+	"""Записи в порядке ids (отсутствующие пропускаются)."""
+	if not ids:
+		return []
+	by_id = {l.id: l for l in session.query(Listing).filter(Listing.id.in_(ids)).all()}
+	return [by_id[i] for i in ids if i in by_id]
+
+
+def listing_title_lemmas(session: Session, *, city: Optional[str] = None, listing_type: Optional[str] = None) -> List[Tuple[int, List[str]]]:
+	"""(id, леммы наименования) по убыванию id — без загрузки записей целиком. Леммы берутся
+	из listing_features, устаревшие или отсутствующие считаются заново.
+	"""
+	query = session.query(Listing.id, Listing.title, Listing.updated_at, ListingFeatures.title_lemmas, ListingFeatures.listing_updated_at).outerjoin(
+		ListingFeatures, ListingFeatures.listing_id == Listing.id
+	)
+	rows = _filter_listings(query, city, listing_type).order_by(Listing.id.desc()).all()
+	return [(lid, _row_lemmas(title, updated, lemmas, feat_updated)) for lid, title, updated, lemmas, feat_updated in rows]
+
+
+def _row_lemmas(title: str, updated: Optional[datetime], lemmas: Optional[List[str]], feat_updated: Optional[datetime]) -> List[str]:
+	from app.services.matching import title_lemmas
+	if lemmas is not None and feat_updated is not None and feat_updated == updated:
+		return list(lemmas)
+	return title_lemmas(title)
+
+
+_fulltext_available: bool | None = None
+
+
+def fulltext_search_available(session: Session) -> bool:
+	"""Есть ли столбец listings.search_vector (см. ensure_search_index; проверяется один раз на процесс)."""
+	global _fulltext_available
+	if _fulltext_available is None:
+		if session.get_bind().dialect.name != "postgresql":
+			_fulltext_available = False
+		else:
+			_fulltext_available = session.execute(
+				text("SELECT 1 FROM information_schema.columns WHERE table_name = 'listings' AND column_name = 'search_vector'")
+			).first() is not None
+	return _fulltext_available
+
+
+def fulltext_candidates(
+	session: Session,
+	query: str,
+	*,
+	city: Optional[str] = None,
+	listing_type: Optional[str] = None,
+	limit: int = 300,
+) -> List[Tuple[int, List[str], bool]]:
+	"""Полнотекстовый отбор в PostgreSQL: (id, леммы наименования, найдены ли все слова запроса)
+	для записей, где есть хотя бы одно слово запроса (по префиксу, с учётом словоформ) в
+	наименовании, описании или характеристиках. Сначала записи со всеми словами, внутри — по
+	ts_rank; limit — не более N записей (0 — без ограничения).
+	"""
+	# только буквы и цифры: остальное в to_tsquery — операторы
+	terms = re.findall(r"\w+", (query or "").lower())
+	if not terms:
+		return []
+	conds = ["l.search_vector @@ to_tsquery('russian', :any_terms)"]
+	params: Dict[str, object] = {
+		"any_terms": " | ".join(f"{t}:*" for t in terms),
+		"all_terms": " & ".join(f"{t}:*" for t in terms),
+	}
+	if city:
+		conds.append("l.location = :city")
+		params["city"] = city
+	if listing_type:
+		conds.append("l.type = :listing_type")
+		params["listing_type"] = listing_type
+	limit_sql = "LIMIT :limit" if limit and limit > 0 else ""
+	if limit_sql:
+		params["limit"] = limit
+	rows = session.execute(
+		text(f"""
+			SELECT l.id, l.title, l.updated_at, f.title_lemmas, f.listing_updated_at,
+				l.search_vector @@ to_tsquery('russian', :all_terms) AS all_matched
+			FROM listings l
+			LEFT JOIN listing_features f ON f.listing_id = l.id
+			WHERE {" AND ".join(conds)}
+			ORDER BY all_matched DESC, ts_rank(l.search_vector, to_tsquery('russian', :any_terms)) DESC, l.id DESC
+			{limit_sql}
+		"""),
+		params,
+	).all()
+	# json-столбец psycopg2 отдаёт уже разобранным
+	return [
+		(lid, _row_lemmas(title, updated, lemmas, feat_updated), bool(all_matched))
+		for lid, title, updated, lemmas, feat_updated, all_matched in rows
+	]
+
+
+# Число записей по фильтру: COUNT(*) в PostgreSQL читает всю таблицу, поэтому результат
+# кэшируется в процессе на WEB_COUNT_CACHE_SECONDS и сбрасывается при изменении записей
+_count_cache: Dict[Tuple[Optional[str], Optional[str]], Tuple[float, int]] = {}
+_count_lock = threading.Lock()
+
+
+def _cached_count(key: Tuple[Optional[str], Optional[str]], ttl: float) -> Optional[int]:
+	with _count_lock:
+		cached = _count_cache.get(key)
+	if cached is not None and time.monotonic() - cached[0] < ttl:
+		return cached[1]
+	return None
+
+
+def _store_count(key: Tuple[Optional[str], Optional[str]], count: int) -> int:
+	with _count_lock:
+		_count_cache[key] = (time.monotonic(), count)
+	return count
+
+
+def count_listings(session: Session, *, city: Optional[str] = None, listing_type: Optional[str] = None, ttl: float = 0.0) -> int:
+	key = (city, listing_type)
+	cached = _cached_count(key, ttl)
+	if cached is not None:
+		return cached
+	return _store_count(key, int(_filter_listings(session.query(func.count(Listing.id)), city, listing_type).scalar() or 0))
+
+
+def invalidate_listing_counts() -> None:
+	with _count_lock:
+		_count_cache.clear()
+
+
 def get_listings_filtered(
 	session: Session,
 	city: Optional[str] = None,
@@ -78,4 +253,149 @@ def get_listings_filtered(
 		conds.append(Listing.price <= price_max)
 	if conds:
 		q = q.filter(and_(*conds))
-	return q.order_by(Listing.id.asc()).all()
\ No newline at end of file
+	return q.order_by(Listing.id.asc()).all()
+
+
+_trigram_available: bool | None = None
+
+
+def trigram_search_available(session: Session) -> bool:
+	"""Есть ли в БД расширение pg_trgm (проверяется один раз на процесс)."""
+	global _trigram_available
+	if _trigram_available is None:
+		if session.get_bind().dialect.name != "postgresql":
+			_trigram_available = False
+		else:
+			_trigram_available = session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+	return _trigram_available
+
+
+def trigram_candidates(
+	session: Session,
+	listing_ids: List[int],
+	*,
+	target_type: str,
+	min_similarity: float,
+	same_location: bool = False,
+	limit: int = 0,
+) -> Dict[int, List[int]]:
+	"""Отбор кандидатов в PostgreSQL (pg_trgm): для каждой записи из listing_ids — id записей типа
+	target_type с похожим наименованием (оператор % по GIN-индексу ix_listings_title_trgm,
+	порог — min_similarity), по убыванию similarity(). same_location — только из того же города;
+	limit — не более N кандидатов на запись (0 — без ограничения).
+	"""
+	if not listing_ids:
+		return {}
+	# порог оператора % — только для текущей транзакции
+	session.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :t, true)"), {"t": str(min_similarity)})
+	location = "AND lower(trim(c.location)) = lower(trim(l.location))" if same_location else ""
+	limit_sql = "LIMIT :limit" if limit and limit > 0 else ""
+	rows = session.execute(
+		text(f"""
+			SELECT l.id AS listing_id, m.id AS candidate_id
+			FROM listings l
+			CROSS JOIN LATERAL (
+				SELECT c.id, similarity(c.title, l.title) AS sim
+				FROM listings c
+				WHERE c.type = :target_type AND c.title % l.title {location}
+				ORDER BY sim DESC, c.id
+				{limit_sql}
+			) m
+			WHERE l.id = ANY(:ids)
+		"""),
+		{"ids": list(listing_ids), "target_type": target_type, "limit": limit},
+	).all()
+	result: Dict[int, List[int]] = {}
+	for listing_id, candidate_id in rows:
+		result.setdefault(listing_id, []).append(candidate_id)
+	return result
+
+
+# Асинхронные версии (async_session_scope) — для обработчиков веба и бота
+
+
+async def get_listing_async(session: AsyncSession, listing_id: int) -> Optional[Listing]:
+	return await session.get(Listing, listing_id)
+
+
+async def listings_version_async(session: AsyncSession) -> Tuple[Optional[datetime], int, int]:
+	"""Версия данных для ETag страниц /web: последнее изменение, наибольший id и число записей
+	(одним запросом; меняется при создании, изменении и удалении записи)."""
+	last_updated, max_id, count = (await session.execute(select(func.max(Listing.updated_at), func.max(Listing.id), func.count(Listing.id)))).one()
+	return last_updated, int(max_id or 0), int(count or 0)
+
+
+async def listing_updated_at_async(session: AsyncSession, listing_id: int) -> Optional[datetime]:
+	return (await session.execute(select(Listing.updated_at).where(Listing.id == listing_id))).scalar()
+
+
+async def list_recent_listings_async(session: AsyncSession, limit: int = 10) -> List[Listing]:
+	q = select(Listing).order_by(Listing.id.desc()).limit(max(1, limit))
+	return list((await session.execute(q)).scalars().all())
+
+
+async def page_listings_async(
+	session: AsyncSession,
+	*,
+	city: Optional[str] = None,
+	listing_type: Optional[str] = None,
+	limit: int = 50,
+	offset: int = 0,
+	before_id: Optional[int] = None,
+) -> List[Listing]:
+	"""См. page_listings."""
+	q = _filter_listings(select(Listing), city, listing_type)
+	if before_id is not None:
+		q = q.filter(Listing.id < before_id)
+	q = q.order_by(Listing.id.desc())
+	if before_id is None and offset > 0:
+		q = q.offset(offset)
+	return list((await session.execute(q.limit(max(1, limit)))).scalars().all())
+
+
+async def listing_ids_async(
+	session: AsyncSession,
+	*,
+	city: Optional[str] = None,
+	listing_type: Optional[str] = None,
+	above: Optional[int] = None,
+	below: Optional[int] = None,
+	limit: int = 50,
+) -> List[int]:
+	"""id записей с фильтрами списка: больше above — по возрастанию, иначе (меньше below или
+	все) — по убыванию. Только индекс id — для курсоров ссылок на соседние страницы."""
+	q = _filter_listings(select(Listing.id), city, listing_type)
+	if above is not None:
+		q = q.filter(Listing.id > above).order_by(Listing.id.asc())
+	else:
+		if below is not None:
+			q = q.filter(Listing.id < below)
+		q = q.order_by(Listing.id.desc())
+	return list((await session.execute(q.limit(max(1, limit)))).scalars().all())
+
+
+async def get_listings_by_ids_async(session: AsyncSession, ids: List[int]) -> List[Listing]:
+	if not ids:
+		return []
+	rows = (await session.execute(select(Listing).filter(Listing.id.in_(ids)))).scalars().all()
+	by_id = {l.id: l for l in rows}
+	return [by_id[i] for i in ids if i in by_id]
+
+
+async def count_listings_async(session: AsyncSession, *, city: Optional[str] = None, listing_type: Optional[str] = None, ttl: float = 0.0) -> int:
+	key = (city, listing_type)
+	cached = _cached_count(key, ttl)
+	if cached is not None:
+		return cached
+	return _store_count(key, int((await session.execute(_filter_listings(select(func.count(Listing.id)), city, listing_type))).scalar() or 0))
+
+
+async def delete_listing_by_id_async(session: AsyncSession, listing_id: int) -> bool:
+	listing = await session.get(Listing, listing_id)
+	if not listing:
+		return False
+	await delete_listing_matches_async(session, listing_id)
+	await session.delete(listing)
+	await session.commit()
+	invalidate_match_caches()
+	return True
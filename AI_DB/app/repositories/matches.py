@@ -0,0 +1,119 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.matches import Match, MatchStoreState
+
+
+def replace_listing_matches(session: Session, listing_id: int, pairs: Iterable[Tuple[int, int, float]]) -> List[Match]:
+	"""Заменяет пары записи listing_id (как спроса или предложения) на pairs = (demand_id, sale_id, score).
+	Сохранившиеся пары обновляются на месте (с отметкой об отправке). Возвращает новые пары.
+	"""
+	return replace_listings_matches(session, [listing_id], pairs)
+
+
+def replace_listings_matches(session: Session, listing_ids: Iterable[int], pairs: Iterable[Tuple[int, int, float]]) -> List[Match]:
+	"""Как replace_listing_matches, но для группы записей: все их пары заменяются на pairs."""
+	ids = list(listing_ids)
+	existing: Dict[Tuple[int, int], Match] = {
+		(m.demand_id, m.sale_id): m
+		for m in session.query(Match).filter(or_(Match.demand_id.in_(ids), Match.sale_id.in_(ids))).all()
+	}
+	created: List[Match] = []
+	for demand_id, sale_id, score in pairs:
+		row = existing.pop((demand_id, sale_id), None)
+		if row is not None:
+			if row.score != score:
+				row.score = score
+			continue
+		row = Match(demand_id=demand_id, sale_id=sale_id, score=score)
+		session.add(row)
+		created.append(row)
+	for row in existing.values():
+		session.delete(row)
+	return created
+
+
+def delete_listing_matches(session: Session, listing_id: int) -> int:
+	return session.query(Match).filter(or_(Match.demand_id == listing_id, Match.sale_id == listing_id)).delete(synchronize_session=False)
+
+
+async def delete_listing_matches_async(session: AsyncSession, listing_id: int) -> int:
+	result = await session.execute(delete(Match).where(or_(Match.demand_id == listing_id, Match.sale_id == listing_id)).execution_options(synchronize_session=False))
+	return result.rowcount
+
+
+def replace_all_matches(session: Session, pairs: Iterable[Tuple[int, int, float]], notified: bool = True) -> int:
+	"""Полная перезапись таблицы. notified=True — не слать эти пары в админ-чат."""
+	session.query(Match).delete(synchronize_session=False)
+	now = datetime.now(ZoneInfo("Asia/Tashkent")) if notified else None
+	count = 0
+	for demand_id, sale_id, score in pairs:
+		session.add(Match(demand_id=demand_id, sale_id=sale_id, score=score, notified_at=now))
+		count += 1
+	return count
+
+
+def count_matches(session: Session) -> int:
+	return session.query(Match).count()
+
+
+def get_match_store_params(session: Session) -> Optional[dict]:
+	"""Параметры, с которыми посчитана таблица matches (None — не посчитана или устарела)."""
+	row = session.get(MatchStoreState, 1)
+	return row.params if row is not None else None
+
+
+def set_match_store_params(session: Session, params: Optional[dict]) -> None:
+	row = session.get(MatchStoreState, 1)
+	if row is None:
+		row = MatchStoreState(id=1)
+		session.add(row)
+	row.params = params
+	row.built_at = datetime.now(ZoneInfo("Asia/Tashkent")) if params is not None else None
+
+
+def list_matches(session: Session, min_score: float, limit: Optional[int] = None) -> List[Match]:
+	"""Пары со score >= min_score: по убыванию score, при равенстве — по id спроса и предложения."""
+	q = (
+		session.query(Match)
+		.filter(Match.score >= min_score)
+		.order_by(Match.score.desc(), Match.demand_id.asc(), Match.sale_id.asc())
+	)
+	if limit:
+		q = q.limit(limit)
+	return q.all()
+
+
+def iter_matches_rows(session: Session, min_score: float, batch: int = 1000) -> Iterator[Match]:
+	"""То же, что list_matches, но строки читаются из БД порциями по batch."""
+	return (
+		session.query(Match)
+		.filter(Match.score >= min_score)
+		.order_by(Match.score.desc(), Match.demand_id.asc(), Match.sale_id.asc())
+		.yield_per(batch)
+	)
+
+
+def list_unnotified_matches(session: Session, min_score: float, limit: int = 20) -> List[Match]:
+	return (
+		session.query(Match)
+		.filter(Match.notified_at.is_(None), Match.score >= min_score)
+		.order_by(Match.score.desc(), Match.id.asc())
+		.limit(limit)
+		.all()
+	)
+
+
+def mark_matches_notified(session: Session, match_ids: Iterable[int]) -> None:
+	ids = list(match_ids)
+	if not ids:
+		return
+	now = datetime.now(ZoneInfo("Asia/Tashkent"))
+	session.query(Match).filter(Match.id.in_(ids)).update({Match.notified_at: now}, synchronize_session=False)
+	session.commit()
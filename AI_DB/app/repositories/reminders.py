@@ -2,6 +2,8 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.reminders import Reminder
@@ -42,4 +44,26 @@ def delete_sent_before(session: Session, before: datetime) -> int:
 	count = q.count()
 	q.delete(synchronize_session=False)
 	session.commit()
-	return count
\ No newline at end of file
+	return count
+
+
+async def create_reminder_async(session: AsyncSession, text: str, remind_at: datetime, user_id: Optional[int]) -> Reminder:
+	rem = Reminder(text=text, remind_at=remind_at, user_id=user_id, is_sent=False)
+	session.add(rem)
+	await session.commit()
+	await session.refresh(rem)
+	return rem
+
+
+async def list_active_reminders_async(session: AsyncSession) -> List[Reminder]:
+	q = select(Reminder).filter_by(is_sent=False).order_by(Reminder.remind_at.asc())
+	return list((await session.execute(q)).scalars().all())
+
+
+async def cancel_reminder_async(session: AsyncSession, reminder_id: int) -> bool:
+	rem = await session.get(Reminder, reminder_id)
+	if not rem or rem.is_sent:
+		return False
+	await session.delete(rem)
+	await session.commit()
+	return True
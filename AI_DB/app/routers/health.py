@@ -4,6 +4,11 @@ from sqlalchemy import text
 from app.db import session_scope
 from app.scheduler import _scheduler, daily_matches_job, weekly_backup_job, weekly_stats_job, weekly_diagnostics_job, test_message_job
 from app.config import get_settings
+from app.services.edit_distance import available_backends, backend_name
+from app.services.executor import executor_stats
+from app.services.lemma_cache import get_lemma_cache
+from app.services.match_cache import get_match_cache
+from app.services.match_components import get_component_cache
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
@@ -86,6 +91,21 @@ async def test_scheduler_jobs() -> dict:
     return {"test_results": results}
 
 
+@router.get("/matching", summary="Matching caches statistics")
+def health_matching() -> dict:
+    return {
+        "lemma_cache": get_lemma_cache().stats(),
+        "edit_distance": {"backend": backend_name(), "available": available_backends()},
+        "component_cache": get_component_cache().stats(),
+        "result_cache": get_match_cache().stats(),
+    }
+
+
+@router.get("/executors", summary="Thread/process pool queue statistics")
+def health_executors() -> dict:
+    return executor_stats()
+
+
 @router.get("/time", summary="Current time and timezone info")
 def health_time() -> dict:
     """Показывает текущее время и настройки таймзоны"""
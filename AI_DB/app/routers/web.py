@@ -1,26 +1,33 @@
 from __future__ import annotations
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from math import ceil
-from typing import Optional
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
 import os
 import json
 from decimal import Decimal
 from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, Query, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, Response
 from starlette.background import BackgroundTask
 from starlette.status import HTTP_303_SEE_OTHER
 from fastapi.templating import Jinja2Templates
 
-from app.db import session_scope
+from app.db import async_session_scope, session_scope
 from app.models.listings import Listing
 from app.services.storage import get_upload_dir
-from app.repositories.listings import delete_listing_by_id
-from app.repositories.audit import list_audit, log_event
-from app.repositories.access import list_tokens as access_list, create_token as access_create, revoke_token as access_revoke
+from app.repositories.listings import count_listings_async, delete_listing_by_id_async, get_listing_async, get_listings_by_ids_async, list_recent_listings_async, listing_ids_async, listing_updated_at_async, listings_version_async, page_listings_async
+from app.repositories.listing_features import upsert_listing_features
+from app.repositories.audit import audit_version_async, list_audit_async, log_event_async
+from app.repositories.access import list_tokens_async as access_list, create_token_async as access_create, revoke_token_async as access_revoke
 from app.config import get_settings
 from app.security import require_web_access
-from app.services.export import export_matches_to_excel
+from app.services.export import write_matches_xlsx
+from app.services.executor import run_io
+from app.services.static_assets import assets_mtime, static_url
 
 
 templates = Jinja2Templates(directory="app/templates")
@@ -54,6 +61,7 @@ def _loc_resource(val: str | None) -> str:
 templates.env.filters["loc_type"] = _loc_type
 templates.env.filters["loc_action"] = _loc_action
 templates.env.filters["loc_resource"] = _loc_resource
+templates.env.globals["static_url"] = static_url
 
 def _format_datetime(dt) -> str:
     if dt is None:
@@ -157,94 +165,194 @@ def _normalize_ltype(value: str | None) -> str | None:
     }
     return mapping.get(v)
 
+
+# Ограничение из формы: пусто, 0 или мусор — без ограничения
+def _parse_limit(value: str | None) -> int | None:
+	try:
+		n = int(str(value).strip()) if value is not None and str(value).strip() != "" else 0
+	except ValueError:
+		return None
+	return n if n > 0 else None
+
+def _normalize_engine(value: str | None) -> str:
+	# в форме — только попарный расчёт ("python") и TF-IDF; прочее считается как "python"
+	return "tfidf" if (value or "").strip().lower() == "tfidf" else "python"
+
+# ETag страниц: хэш версии данных и параметров запроса; 304 отдаётся до тяжёлого запроса и
+# отрисовки шаблона. Шаблоны и статика входят в хэш по времени изменения — после их правки или
+# новой сборки (ссылки на файлы с хэшем меняются) кэш браузера не покажет старую разметку.
+# Страницы закрыты авторизацией — только private-кэш
+_TEMPLATES_VERSION = max((f.stat().st_mtime_ns for f in Path("app/templates").glob("*.html")), default=0)
+_CACHE_CONTROL = "private, no-cache"
+
+
+def _etag(*parts) -> str:
+	return 'W/"%s"' % hashlib.sha1(repr((_TEMPLATES_VERSION, assets_mtime(), *parts)).encode("utf-8")).hexdigest()[:24]
+
+
+def _last_modified(*stamps: Optional[datetime]) -> datetime:
+	"""Last-Modified страницы: самое позднее из времён изменения данных (naive — UTC, как их
+	хранит БД), шаблонов и статики, с точностью до секунды (как в HTTP-дате)."""
+	result = datetime.fromtimestamp(max(_TEMPLATES_VERSION / 1e9, assets_mtime()), tz=timezone.utc)
+	for stamp in stamps:
+		if stamp is None:
+			continue
+		if stamp.tzinfo is None:
+			stamp = stamp.replace(tzinfo=timezone.utc)
+		result = max(result, stamp.astimezone(timezone.utc))
+	return result.replace(microsecond=0)
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime | None = None) -> Response | None:
+	header = request.headers.get("if-none-match")
+	if header:
+		# сравнение слабое: префикс W/ не учитывается
+		tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+		if "*" not in tags and etag.removeprefix("W/") not in tags:
+			return None
+	else:
+		# If-Modified-Since проверяется, только если клиент не прислал If-None-Match (RFC 9110)
+		since = request.headers.get("if-modified-since")
+		if last_modified is None or not since:
+			return None
+		try:
+			since_dt = parsedate_to_datetime(since)
+		except (TypeError, ValueError):
+			return None
+		if since_dt.tzinfo is None:
+			since_dt = since_dt.replace(tzinfo=timezone.utc)
+		if last_modified > since_dt:
+			return None
+	return _with_etag(Response(status_code=304), etag, last_modified)
+
+
+def _with_etag(response: Response, etag: str, last_modified: datetime | None = None) -> Response:
+	response.headers["ETag"] = etag
+	if last_modified is not None:
+		response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+	response.headers["Cache-Control"] = _CACHE_CONTROL
+	return response
+
+
+async def _page_cursors(session, *, city: Optional[str], listing_type: Optional[str], items: List[Listing], page: int, pages: int, total: int, per_page: int, after: Optional[int]) -> Dict[int, int]:
+	"""Курсоры after для ссылок пагинации: соседние страницы (±2), стрелки и последняя страница
+	открываются по индексу id, а не через OFFSET. Первой странице курсор не нужен."""
+	cursors: Dict[int, int] = {}
+	if not items:
+		return cursors
+	if after is not None:
+		cursors[page] = after
+	# назад: id выше первой записи по возрастанию; курсор страницы page-k — первый id над ней
+	back = min(2, page - 2)
+	if back > 0:
+		up = await listing_ids_async(session, city=city, listing_type=listing_type, above=items[0].id, limit=back * per_page + 1)
+		for k in range(1, back + 1):
+			if len(up) > k * per_page:
+				cursors[page - k] = up[k * per_page]
+	# вперёд: страница page+1 начинается после последней записи этой, page+2 — после page+1
+	if page < pages:
+		cursors[page + 1] = items[-1].id
+	if page + 2 <= pages:
+		down = await listing_ids_async(session, city=city, listing_type=listing_type, below=items[-1].id, limit=per_page)
+		if len(down) == per_page:
+			cursors[page + 2] = down[-1]
+	# последняя: на ней total - (pages-1)*per_page самых старых записей
+	if pages > page and pages not in cursors:
+		rest = total - (pages - 1) * per_page
+		bottom = await listing_ids_async(session, city=city, listing_type=listing_type, above=0, limit=rest + 1)
+		if len(bottom) > rest:
+			cursors[pages] = bottom[rest]
+	return cursors
+
+
 @router.get("/", response_class=HTMLResponse)
-async def list_view(request: Request, city: Optional[str] = None, ltype: Optional[str] = Query(None, alias="type"), q: Optional[str] = None, fuzzy_token_threshold: float = 0.6, page: int = 1, per_page: Optional[str] = Query("0", alias="per_page"), _=Depends(require_web_access)):
+async def list_view(request: Request, city: Optional[str] = None, ltype: Optional[str] = Query(None, alias="type"), q: Optional[str] = None, fuzzy_token_threshold: float = 0.6, page: int = 1, per_page: Optional[str] = Query(None, alias="per_page"), after: Optional[int] = None, _=Depends(require_web_access)):
+	settings = get_settings()
 	page = max(1, page)
-	
-	# Обрабатываем per_page: пустая строка или "0" означает "показать все"
-	try:
-		if per_page is None or per_page.strip() == "" or per_page == "0":
-			per_page_int = 0
+	# per_page: пусто, 0 или мусор — размер по умолчанию; сверху ограничен WEB_MAX_PAGE_SIZE
+	per_page_int = min(_parse_limit(per_page) or settings.web_page_size, max(1, settings.web_max_page_size))
+	# приведём русские варианты типа к enum
+	norm_ltype = _normalize_ltype(ltype)
+	async with async_session_scope() as session:
+		version = await listings_version_async(session)
+	etag = _etag("list", version, city, norm_ltype, (q or "").strip(), fuzzy_token_threshold, page, per_page_int, after)
+	# удаление записи не оставляет времени изменения — список проверяется только по ETag,
+	# Last-Modified отдаётся для сведения
+	last_modified = _last_modified(version[0])
+	cached = _not_modified(request, etag)
+	if cached is not None:
+		return cached
+	if q:
+		from app.services.search import search_listing_ids
+		# Поиск: полнотекстовый отбор в БД и нечёткое сходство наименований для лучших кандидатов;
+		# записи целиком загружаются для одной страницы
+		found = await search_listing_ids(q, city=city, listing_type=norm_ltype, fuzzy_token_threshold=fuzzy_token_threshold)
+		total = len(found)
+		pages = max(1, ceil(total / per_page_int))
+		page = min(page, pages)
+		start = (page - 1) * per_page_int
+		page_ids = found[start:start + per_page_int]
+		after = None
+	async with async_session_scope() as session:
+		if q:
+			items = await get_listings_by_ids_async(session, page_ids)
 		else:
-			per_page_int = int(per_page)
-	except (ValueError, AttributeError):
-		per_page_int = 0
-	from app.services.matching import title_similarity
-	with session_scope() as session:
-		query = session.query(Listing)
-		if city:
-			query = query.filter(Listing.location == city)
-		# приведём русские варианты типа к enum
-		norm_ltype = _normalize_ltype(ltype)
-		if norm_ltype:
-			query = query.filter(Listing.type == norm_ltype)
-		total = query.count()
-		items = query.order_by(Listing.id.desc()).all()
+			total = await count_listings_async(session, city=city, listing_type=norm_ltype, ttl=settings.web_count_cache_seconds)
+			# ссылки пагинации передают курсор after (id, после которого начинается страница) —
+			# страницы читаются по индексу id; OFFSET — только для ?page=N без курсора
+			pages = max(1, ceil(total / per_page_int))
+			page = min(page, pages)
+			offset = 0 if after is not None else (page - 1) * per_page_int
+			items = await page_listings_async(session, city=city, listing_type=norm_ltype, limit=per_page_int, offset=offset, before_id=after)
+			cursors = await _page_cursors(session, city=city, listing_type=norm_ltype, items=items, page=page, pages=pages, total=total, per_page=per_page_int, after=after)
 		# Подборки: последние 10 записей без фильтров (для карусели)
-		featured = session.query(Listing).order_by(Listing.id.desc()).limit(10).all()
-	# Фильтр по наименованию с Левенштейном на приложении
+		featured = await list_recent_listings_async(session, 10)
 	if q:
-		needle = q.strip()
-		scored = []
-		for it in items:
-			score = title_similarity(needle, it.title, fuzzy_token_threshold=fuzzy_token_threshold)
-			if score >= 0.6:  # отсечка по умолчанию
-				scored.append((score, it))
-		scored.sort(key=lambda t: t[0], reverse=True)
-		items = [it for _, it in scored]
-		total = len(items)
-	# Пагинация после фильтра
-	page = max(1, page)
-	
-	# Если per_page не указан или 0, показываем все записи
-	if not per_page_int or per_page_int <= 0:
-		per_page_int = total
-		pages = 1
-		start = 0
-		end = total
-	else:
-		per_page_int = max(1, per_page_int)  # Убираем ограничение в 50 записей
-		pages = ceil(total / per_page_int) if per_page_int else 1
-		start = (page - 1) * per_page_int
-		end = start + per_page_int
-	
-	items = items[start:end]
-	# в поле ввода вернём исходное значение пользователя (пустая строка для "показать все")
-	per_page_display = "" if per_page_int == total else str(per_page_int)
-	return templates.TemplateResponse("list.html", {"request": request, "items": items, "featured": featured, "total": total, "page": page, "pages": pages, "per_page": per_page_display, "city": city, "ltype": ltype, "q": q, "fuzzy_token_threshold": fuzzy_token_threshold})
+		cursors = {}
+	pages = max(1, ceil(total / per_page_int))
+	page = min(page, pages)
+	return _with_etag(templates.TemplateResponse("list.html", {"request": request, "items": items, "featured": featured, "total": total, "page": page, "pages": pages, "per_page": per_page_int, "cursors": cursors, "city": city, "ltype": ltype, "q": q, "fuzzy_token_threshold": fuzzy_token_threshold}), etag, last_modified)
 
 
 @router.get("/detail/{listing_id}", response_class=HTMLResponse)
 async def detail_view(request: Request, listing_id: int, _=Depends(require_web_access)):
-	with session_scope() as session:
-		item = session.get(Listing, listing_id)
-		if not item:
-			return templates.TemplateResponse("not_found.html", {"request": request, "id": listing_id}, status_code=404)
-		# Разрешим ссылки на фото: file:// → /uploads/<имя>, если файл существует в каталоге загрузок
-		photos = []
-		upload_dir = get_upload_dir()
-		for link in (item.photo_links or []):
-			try:
-				if isinstance(link, str) and link.startswith("file://"):
-					fname = link.split("/")[-1]
-					candidate = upload_dir / fname
-					if candidate.exists():
-						photos.append(f"/uploads/{fname}")
-					else:
-						photos.append(link)
+	async with async_session_scope() as session:
+		# версия — updated_at самой записи (прикрепление фото его тоже меняет)
+		updated_at = await listing_updated_at_async(session, listing_id)
+		etag = _etag("detail", listing_id, updated_at)
+		last_modified = _last_modified(updated_at)
+		if updated_at is not None:
+			cached = _not_modified(request, etag, last_modified)
+			if cached is not None:
+				return cached
+		item = await get_listing_async(session, listing_id)
+	if not item:
+		return templates.TemplateResponse("not_found.html", {"request": request, "id": listing_id}, status_code=404)
+	# Разрешим ссылки на фото: file:// → /uploads/<имя>, если файл существует в каталоге загрузок
+	photos = []
+	upload_dir = get_upload_dir()
+	for link in (item.photo_links or []):
+		try:
+			if isinstance(link, str) and link.startswith("file://"):
+				fname = link.split("/")[-1]
+				candidate = upload_dir / fname
+				if candidate.exists():
+					photos.append(f"/uploads/{fname}")
 				else:
 					photos.append(link)
-			except Exception:
+			else:
 				photos.append(link)
-	return templates.TemplateResponse("detail.html", {"request": request, "item": item, "photos": photos})
+		except Exception:
+			photos.append(link)
+	return _with_etag(templates.TemplateResponse("detail.html", {"request": request, "item": item, "photos": photos}), etag, last_modified)
 
 
 @router.get("/detail/{listing_id}/edit", response_class=HTMLResponse)
 async def edit_view(request: Request, listing_id: int, _=Depends(require_web_access)):
-	with session_scope() as session:
-		item = session.get(Listing, listing_id)
-		if not item:
-			return templates.TemplateResponse("not_found.html", {"request": request, "id": listing_id}, status_code=404)
+	async with async_session_scope() as session:
+		item = await get_listing_async(session, listing_id)
+	if not item:
+		return templates.TemplateResponse("not_found.html", {"request": request, "id": listing_id}, status_code=404)
 	return templates.TemplateResponse("edit.html", {"request": request, "item": item})
 
 
@@ -272,33 +380,39 @@ async def edit_submit(request: Request, listing_id: int, _=Depends(require_web_a
 			return int(v)
 		except Exception:
 			return None
-	with session_scope() as session:
-		item = session.get(Listing, listing_id)
-		if not item:
-			return RedirectResponse(url="/web", status_code=HTTP_303_SEE_OTHER)
-		item.type = _none_if_empty(form.get("type")) or item.type
-		item.title = _none_if_empty(form.get("title")) or item.title
-		item.description = _none_if_empty(form.get("description"))
-		item.quantity = _to_int(form.get("quantity"))
-		item.price = _to_decimal(form.get("price"))
-		item.location = _none_if_empty(form.get("location"))
-		item.contact = _none_if_empty(form.get("contact"))
-		chars_raw = _none_if_empty(form.get("characteristics"))
-		if chars_raw:
-			try:
-				item.characteristics = json.loads(chars_raw)
-			except Exception:
-				pass
+	# пересчёт признаков и пар записи — вычисления, поэтому в пуле потоков с синхронной сессией
+	def _save() -> bool:
+		with session_scope() as session:
+			item = session.get(Listing, listing_id)
+			if not item:
+				return False
+			item.type = _none_if_empty(form.get("type")) or item.type
+			item.title = _none_if_empty(form.get("title")) or item.title
+			item.description = _none_if_empty(form.get("description"))
+			item.quantity = _to_int(form.get("quantity"))
+			item.price = _to_decimal(form.get("price"))
+			item.location = _none_if_empty(form.get("location"))
+			item.contact = _none_if_empty(form.get("contact"))
+			chars_raw = _none_if_empty(form.get("characteristics"))
+			if chars_raw:
+				try:
+					item.characteristics = json.loads(chars_raw)
+				except Exception:
+					pass
+			upsert_listing_features(session, item)
+		return True
+	if not await run_io(_save):
+		return RedirectResponse(url="/web", status_code=HTTP_303_SEE_OTHER)
 	return RedirectResponse(url=f"/web/detail/{listing_id}", status_code=HTTP_303_SEE_OTHER)
 
 
 @router.post("/detail/{listing_id}/delete")
 async def delete_submit(request: Request, listing_id: int, _=Depends(require_web_access)):
-	with session_scope() as session:
-		ok = delete_listing_by_id(session, listing_id)
+	async with async_session_scope() as session:
+		ok = await delete_listing_by_id_async(session, listing_id)
 		if ok:
 			client = request.client.host if request.client else None
-			log_event(session, action="delete", resource="listing", actor=client or "web", payload={"listing_id": listing_id})
+			await log_event_async(session, action="delete", resource="listing", actor=client or "web", payload={"listing_id": listing_id})
 	return RedirectResponse(url="/web", status_code=HTTP_303_SEE_OTHER)
 
 
@@ -315,14 +429,21 @@ async def audit_view(request: Request, date_from: Optional[str] = None, date_to:
 		_dt = datetime.strptime(date_to, "%Y-%m-%d") if date_to else None
 	except Exception:
 		_dt = None
-	with session_scope() as session:
-		rows = list_audit(session, date_from=_df, date_to=_dt)
-	return templates.TemplateResponse("audit.html", {"request": request, "rows": rows, "date_from": date_from, "date_to": date_to})
+	async with async_session_scope() as session:
+		version = await audit_version_async(session)
+		etag = _etag("audit", version, _df, _dt)
+		# журнал только пополняется — время последней записи и есть время изменения
+		last_modified = _last_modified(version[2])
+		cached = _not_modified(request, etag, last_modified)
+		if cached is not None:
+			return cached
+		rows = await list_audit_async(session, date_from=_df, date_to=_dt)
+	return _with_etag(templates.TemplateResponse("audit.html", {"request": request, "rows": rows, "date_from": date_from, "date_to": date_to}), etag, last_modified)
 
 
 @router.get("/matches", response_class=HTMLResponse)
-async def matches_view(request: Request, threshold: float = 0.45, w_title: float = 0.6, w_char: float = 0.2, w_loc: float = 0.15, w_price: float = 0.05, price_tolerance_abs: str | None = None, price_tolerance_pct: str | None = None, fuzzy_token_threshold: float = 0.6, _=Depends(require_web_access)):
-	from app.services.matching import group_listings, find_matches
+async def matches_view(request: Request, threshold: float = 0.45, w_title: float = 0.6, w_char: float = 0.2, w_loc: float = 0.15, w_price: float = 0.05, price_tolerance_abs: str | None = None, price_tolerance_pct: str | None = None, fuzzy_token_threshold: float = 0.6, top_k_per_demand: str | None = None, max_pairs: str | None = None, engine: str = "python", _=Depends(require_web_access)):
+	from app.services.match_cache import get_matches
 	from decimal import Decimal as _Dec
 	# Безопасное приведение пустых значений к None
 	pta_dec = None
@@ -337,26 +458,34 @@ async def matches_view(request: Request, threshold: float = 0.45, w_title: float
 			ptp_float = float(str(price_tolerance_pct).replace(",", ".").replace(" ", ""))
 	except Exception:
 		ptp_float = None
-	with session_scope() as session:
-		items = session.query(Listing).all()
-	demands, sales = group_listings(items)
-	pairs = find_matches(
-		demands,
-		sales,
-		threshold=threshold,
-		w_title=w_title,
-		w_char=w_char,
-		w_loc=w_loc,
-		w_price=w_price,
-		price_tolerance_abs=pta_dec,
-		price_tolerance_pct=ptp_float,
-		fuzzy_token_threshold=fuzzy_token_threshold,
-	)
-	return templates.TemplateResponse("matches.html", {"request": request, "pairs": pairs, "threshold": threshold, "w_title": w_title, "w_char": w_char, "w_loc": w_loc, "w_price": w_price, "price_tolerance_abs": pta_dec, "price_tolerance_pct": ptp_float, "fuzzy_token_threshold": fuzzy_token_threshold})
+	top_k_int = _parse_limit(top_k_per_demand)
+	max_pairs_int = _parse_limit(max_pairs)
+	engine = _normalize_engine(engine)
+	# кэш результатов (тот же набор параметров при тех же данных — без пересчёта);
+	# при промахе смена весов/порога не пересчитывает сходство (кэш компонент).
+	# Кэши — в памяти процесса, поэтому расчёт в пуле потоков, а не процессов
+	def _compute():
+		with session_scope() as session:
+			return get_matches(
+				session,
+				threshold=threshold,
+				w_title=w_title,
+				w_char=w_char,
+				w_loc=w_loc,
+				w_price=w_price,
+				price_tolerance_abs=pta_dec,
+				price_tolerance_pct=ptp_float,
+				fuzzy_token_threshold=fuzzy_token_threshold,
+				top_k_per_demand=top_k_int,
+				max_pairs=max_pairs_int,
+				engine=engine,
+			).pairs
+	pairs = await run_io(_compute)
+	return templates.TemplateResponse("matches.html", {"request": request, "pairs": pairs, "threshold": threshold, "w_title": w_title, "w_char": w_char, "w_loc": w_loc, "w_price": w_price, "price_tolerance_abs": pta_dec, "price_tolerance_pct": ptp_float, "fuzzy_token_threshold": fuzzy_token_threshold, "top_k_per_demand": top_k_int, "max_pairs": max_pairs_int, "engine": engine})
 
 @router.get("/matches/export")
-async def matches_export(request: Request, threshold: float = 0.45, w_title: float = 0.6, w_char: float = 0.2, w_loc: float = 0.15, w_price: float = 0.05, price_tolerance_abs: str | None = None, price_tolerance_pct: str | None = None, fuzzy_token_threshold: float = 0.6, _=Depends(require_web_access)):
-	from app.services.matching import group_listings, find_matches
+async def matches_export(request: Request, threshold: float = 0.45, w_title: float = 0.6, w_char: float = 0.2, w_loc: float = 0.15, w_price: float = 0.05, price_tolerance_abs: str | None = None, price_tolerance_pct: str | None = None, fuzzy_token_threshold: float = 0.6, top_k_per_demand: str | None = None, max_pairs: str | None = None, engine: str = "python", _=Depends(require_web_access)):
+	from app.services.match_cache import stream_matches
 	from datetime import datetime as _dt
 	from decimal import Decimal as _Dec
 	# Безопасное приведение пустых значений к None
@@ -372,39 +501,31 @@ async def matches_export(request: Request, threshold: float = 0.45, w_title: flo
 			ptp_float = float(str(price_tolerance_pct).replace(",", ".").replace(" ", ""))
 	except Exception:
 		ptp_float = None
-	with session_scope() as session:
-		items = session.query(Listing).all()
-	demands, sales = group_listings(items)
-	pairs = find_matches(
-		demands,
-		sales,
-		threshold=threshold,
-		w_title=w_title,
-		w_char=w_char,
-		w_loc=w_loc,
-		w_price=w_price,
-		price_tolerance_abs=pta_dec,
-		price_tolerance_pct=ptp_float,
-		fuzzy_token_threshold=fuzzy_token_threshold,
-	)
-	rows = []
-	for p in pairs:
-		rows.append({
-			"demand_id": p.Demand.id,
-			"demand_title": p.Demand.title,
-			"demand_location": p.Demand.location,
-			"demand_price": float(p.Demand.price) if p.Demand.price is not None else None,
-			"demand_contact": p.Demand.contact,
-			"sale_id": p.Sale.id,
-			"sale_title": p.Sale.title,
-			"sale_location": p.Sale.location,
-			"sale_price": float(p.Sale.price) if p.Sale.price is not None else None,
-			"sale_contact": p.Sale.contact,
-			"score": round(p.score, 3),
-		})
+	top_k_int = _parse_limit(top_k_per_demand)
+	max_pairs_int = _parse_limit(max_pairs)
+	engine = _normalize_engine(engine)
 	stamp = _dt.now(ZoneInfo("Asia/Tashkent")).strftime("%Y%m%d_%H%M%S")
 	filepath = os.path.abspath(f"matches_{stamp}.xlsx")
-	export_matches_to_excel(rows, filepath)
+	# после просмотра /web/matches с теми же параметрами пары берутся из кэша;
+	# в любом случае они пишутся в файл потоком, без списка строк и DataFrame
+	def _export():
+		with session_scope() as session:
+			pairs = stream_matches(
+				session,
+				threshold=threshold,
+				w_title=w_title,
+				w_char=w_char,
+				w_loc=w_loc,
+				w_price=w_price,
+				price_tolerance_abs=pta_dec,
+				price_tolerance_pct=ptp_float,
+				fuzzy_token_threshold=fuzzy_token_threshold,
+				top_k_per_demand=top_k_int,
+				max_pairs=max_pairs_int,
+				engine=engine,
+			)
+			write_matches_xlsx(pairs, filepath)
+	await run_io(_export)
 	def _cleanup(path: str) -> None:
 		try:
 			os.remove(path)
@@ -415,8 +536,8 @@ async def matches_export(request: Request, threshold: float = 0.45, w_title: flo
 
 @router.get("/tokens", response_class=HTMLResponse)
 async def tokens_view(request: Request, _=Depends(require_web_access)):
-	with session_scope() as session:
-		items = access_list(session)
+	async with async_session_scope() as session:
+		items = await access_list(session)
 	settings = get_settings()
 	base = settings.web_base_url.strip() if settings.web_base_url else f"http://localhost:{settings.app_port}"
 	return templates.TemplateResponse("tokens.html", {"request": request, "items": items, "base": base})
@@ -433,14 +554,14 @@ async def tokens_create(request: Request, _=Depends(require_web_access)):
 			expires_at = datetime.now(ZoneInfo("Asia/Tashkent")) + timedelta(minutes=m)
 	except Exception:
 		pass
-	with session_scope() as session:
-		access_create(session, expires_at)
+	async with async_session_scope() as session:
+		await access_create(session, expires_at)
 	return RedirectResponse(url="/web/tokens", status_code=HTTP_303_SEE_OTHER)
 
 @router.post("/tokens/revoke")
 async def tokens_revoke(request: Request, _=Depends(require_web_access)):
 	form = await request.form()
 	value = (form.get("token") or "").strip()
-	with session_scope() as session:
-		access_revoke(session, value)
+	async with async_session_scope() as session:
+		await access_revoke(session, value)
 	return RedirectResponse(url="/web/tokens", status_code=HTTP_303_SEE_OTHER)
\ No newline at end of file
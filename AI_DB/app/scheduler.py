@@ -3,7 +3,7 @@ import asyncio
 from datetime import datetime, timedelta
 import os
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 from zoneinfo import ZoneInfo
 
 # ВНИМАНИЕ: ПРОИЗВОДСТВЕННОЕ РАСПИСАНИЕ
@@ -12,6 +12,7 @@ from zoneinfo import ZoneInfo
 # - weekly_backup: по пятницам в 17:00  
 # - weekly_stats: по понедельникам в 9:00
 # - weekly_diagnostics: по средам в 18:00
+# - match_notifications: раз в минуту (новые пары из таблицы matches)
 
 from aiogram import Bot
 from aiogram.types import FSInputFile
@@ -20,12 +21,16 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.config import get_settings
 from app.db import session_scope
 from app.models.listings import Listing
-from app.repositories.listings import get_all_listings
+from app.repositories.listings import get_all_listings, listings_data_version
 from app.repositories.reminders import list_active_reminders, mark_sent
-from app.services.matching import group_listings, find_matches
-from app.services.export import export_matches_to_excel, export_listings_to_excel, export_stats_to_excel
+from app.repositories.matches import list_unnotified_matches, mark_matches_notified
+from app.services.match_cache import stream_matches
+from app.services.match_store import ensure_matches, format_match_notice
+from app.services.export import write_matches_xlsx, export_listings_to_excel, export_stats_to_excel
 from app.services.emailer import send_email
 from app.services.diagnostics import run_diagnostics
+from app.services.near_duplicates import DuplicateCluster, find_near_duplicates
+from app.services.executor import run_io
 from app.repositories.audit import log_event
 import structlog
 
@@ -34,6 +39,17 @@ _scheduler: AsyncIOScheduler | None = None
 logger = structlog.get_logger(__name__)
 
 
+def _load_listings() -> List[Listing]:
+	with session_scope() as session:
+		return get_all_listings(session)
+
+
+def _load_listings_with_duplicates() -> Tuple[List[Listing], List[DuplicateCluster]]:
+	with session_scope() as session:
+		items = get_all_listings(session)
+		return items, find_near_duplicates(session, items)
+
+
 async def _send_document(bot: Bot, chat_id: int, filepath: Path, caption: str) -> None:
 	await bot.send_document(chat_id=chat_id, document=FSInputFile(path=filepath), caption=caption)
 
@@ -46,10 +62,28 @@ async def daily_matches_job() -> None:
 	if not settings.telegram_bot_token or not settings.admin_chat_id:
 		logger.warning("daily_matches_job_skipped", reason="missing_telegram_config", has_token=bool(settings.telegram_bot_token), has_chat_id=bool(settings.admin_chat_id))
 		return
-	with session_scope() as session:
-		items: List[Listing] = get_all_listings(session)
-	
-	if not items:
+	now = datetime.now(ZoneInfo(settings.timezone))
+	stamp = now.strftime('%Y%m%d_%H%M%S')
+	filename = f"matches_{stamp}.xlsx"
+	out_path = Path.cwd() / filename
+
+	def _export() -> Tuple[int, int]:
+		# пары пишутся в файл по мере расчёта (или чтения из кэша/таблицы matches), без копий в памяти
+		with session_scope() as session:
+			listings_count = listings_data_version(session)[1]
+			if not listings_count:
+				return 0, 0
+			pairs = stream_matches(
+				session,
+				workers=settings.match_workers,
+				top_k_per_demand=settings.match_top_k_per_demand,
+				max_pairs=settings.match_max_pairs,
+			)
+			return listings_count, write_matches_xlsx(pairs, out_path)
+
+	# расчёт — вне event loop (и, для больших таблиц, в пуле процессов)
+	listings_count, pairs_count = await run_io(_export)
+	if not listings_count:
 		# Отправляем сообщение о том, что данных нет
 		bot = Bot(token=settings.telegram_bot_token)
 		try:
@@ -59,9 +93,8 @@ async def daily_matches_job() -> None:
 			await bot.session.close()
 		return
 	
-	demands, sales = group_listings(items)
-	pairs = find_matches(demands, sales)
-	if not pairs:
+	if not pairs_count:
+		out_path.unlink(missing_ok=True)
 		# Отправляем сообщение о том, что совпадений не найдено
 		bot = Bot(token=settings.telegram_bot_token)
 		try:
@@ -71,31 +104,11 @@ async def daily_matches_job() -> None:
 			await bot.session.close()
 		return
 	
-	now = datetime.now(ZoneInfo(settings.timezone))
-	stamp = now.strftime('%Y%m%d_%H%M%S')
-	rows = []
-	for p in pairs:
-		rows.append({
-			"demand_id": p.Demand.id,
-			"demand_title": p.Demand.title,
-			"demand_location": p.Demand.location,
-			"demand_price": float(p.Demand.price) if p.Demand.price is not None else None,
-			"demand_contact": p.Demand.contact,
-			"sale_id": p.Sale.id,
-			"sale_title": p.Sale.title,
-			"sale_location": p.Sale.location,
-			"sale_price": float(p.Sale.price) if p.Sale.price is not None else None,
-			"sale_contact": p.Sale.contact,
-			"score": round(p.score, 3),
-		})
-	filename = f"matches_{stamp}.xlsx"
-	out_path = Path.cwd() / filename
-	export_matches_to_excel(rows, out_path)
 	bot = Bot(token=settings.telegram_bot_token)
-	caption = f"🔍 Найдено совпадений: {len(rows)}\n📅 Дата: {now.strftime('%Y-%m-%d %H:%M')} (UTC+5)\n📊 Всего записей в БД: {len(items)}"
+	caption = f"🔍 Найдено совпадений: {pairs_count}\n📅 Дата: {now.strftime('%Y-%m-%d %H:%M')} (UTC+5)\n📊 Всего записей в БД: {listings_count}"
 	try:
 		await _send_document(bot, settings.admin_chat_id, out_path, caption)
-		logger.info("daily_matches_job_completed", pairs_count=len(rows), sent_to=settings.admin_chat_id)
+		logger.info("daily_matches_job_completed", pairs_count=pairs_count, sent_to=settings.admin_chat_id)
 	finally:
 		try:
 			out_path.unlink(missing_ok=True)
@@ -104,6 +117,24 @@ async def daily_matches_job() -> None:
 	await bot.session.close()
 
 
+async def matches_rebuild_job() -> None:
+	"""Пересчёт таблицы matches после старта, если она устарела или посчитана с другими параметрами.
+	Идёт в фоне: до его окончания запросы читают таблицу, только если её сохранённые параметры
+	подходят, иначе считают пары (см. match_store.covers).
+	"""
+
+	def _ensure() -> int:
+		with session_scope() as session:
+			return ensure_matches(session)
+
+	# записи, изменённые во время расчёта, оставляют таблицу устаревшей — тогда пересчёт повторяется
+	for attempt in range(1, 4):
+		stored = await run_io(_ensure)
+		if stored < 0:
+			break
+		logger.info("matches_rebuild_job_completed", rebuilt_pairs=stored, attempt=attempt)
+
+
 async def weekly_backup_job() -> None:
 	"""Задача создания бэкапа - запускается по пятницам в 17:00 (UTC+5)"""
 	logger.info("weekly_backup_job_started")
@@ -112,14 +143,13 @@ async def weekly_backup_job() -> None:
 	if not settings.smtp_host or not settings.smtp_username or not settings.smtp_password:
 		logger.warning("weekly_backup_job_skipped", reason="missing_smtp_config", has_host=bool(settings.smtp_host), has_username=bool(settings.smtp_username), has_password=bool(settings.smtp_password))
 		return
-	with session_scope() as session:
-		items: List[Listing] = get_all_listings(session)
+	items: List[Listing] = await run_io(_load_listings)
 	if not items:
 		logger.info("weekly_backup_job_skipped", reason="no_data")
 		# Отправляем email о том, что данных для бэкапа нет
 		try:
 			now = datetime.now(ZoneInfo(settings.timezone))
-			send_email(subject="Weekly DB backup - No data", body=f"Backup skipped at {now.strftime('%Y-%m-%d %H:%M:%S')} (UTC+5)\nNo data available\nTimezone: {settings.timezone}")
+			await run_io(send_email, subject="Weekly DB backup - No data", body=f"Backup skipped at {now.strftime('%Y-%m-%d %H:%M:%S')} (UTC+5)\nNo data available\nTimezone: {settings.timezone}")
 			logger.info("weekly_backup_job_completed", items_count=0, sent_to=settings.smtp_to)
 		except Exception as e:
 			logger.error("weekly_backup_job_email_failed", error=str(e))
@@ -127,11 +157,11 @@ async def weekly_backup_job() -> None:
 	now = datetime.now(ZoneInfo(settings.timezone))
 	stamp = now.strftime('%Y%m%d_%H%M%S')
 	out_path = Path.cwd() / f"backup_{stamp}.xlsx"
-	export_listings_to_excel(items, out_path)
+	await run_io(export_listings_to_excel, items, out_path)
 	try:
 		subject = f"Weekly DB backup - {len(items)} items"
 		body = f"Backup at {stamp} (UTC+5)\nTotal items: {len(items)}\nTimezone: {settings.timezone}\nGenerated: {now.strftime('%Y-%m-%d %H:%M:%S')}"
-		send_email(subject=subject, body=body, attachments=[out_path])
+		await run_io(send_email, subject=subject, body=body, attachments=[out_path])
 		logger.info("weekly_backup_job_completed", items_count=len(items), sent_to=settings.smtp_to)
 	finally:
 		try:
@@ -148,18 +178,17 @@ async def weekly_stats_job() -> None:
 	if not settings.smtp_host or not settings.smtp_username or not settings.smtp_password:
 		logger.warning("weekly_stats_job_skipped", reason="missing_smtp_config", has_host=bool(settings.smtp_host), has_username=bool(settings.smtp_username), has_password=bool(settings.smtp_password))
 		return
-	with session_scope() as session:
-		items: List[Listing] = get_all_listings(session)
+	items, duplicates = await run_io(_load_listings_with_duplicates)
 	
 	# Всегда отправляем статистику, даже если данных нет
 	now = datetime.now(ZoneInfo(settings.timezone))
 	stamp = now.strftime('%Y%m%d_%H%M%S')
 	out_path = Path.cwd() / f"stats_{stamp}.xlsx"
-	export_stats_to_excel(items, out_path)
+	await run_io(export_stats_to_excel, items, out_path, duplicates=duplicates)
 	try:
 		subject = f"Weekly stats - {len(items)} items"
 		body = f"Stats at {stamp} (UTC+5)\nTotal items: {len(items)}\nTimezone: {settings.timezone}\nGenerated: {now.strftime('%Y-%m-%d %H:%M:%S')}"
-		send_email(subject=subject, body=body, attachments=[out_path])
+		await run_io(send_email, subject=subject, body=body, attachments=[out_path])
 		logger.info("weekly_stats_job_completed", items_count=len(items), sent_to=settings.smtp_to)
 	finally:
 		try:
@@ -177,18 +206,34 @@ async def reminders_tick_job() -> None:
 		return
 	tz = ZoneInfo(settings.timezone)
 	now = datetime.now(tz)
-	with session_scope() as session:
-		reminders = list_active_reminders(session)
-		to_send = []
-		for r in reminders:
-			ra = r.remind_at
-			if ra is None:
-				continue
-			# Приводим naive к локальной тайзоне
-			if ra.tzinfo is None:
-				ra = ra.replace(tzinfo=tz)
-			if ra <= now and not r.is_sent:
-				to_send.append(r)
+
+	def _due() -> list:
+		with session_scope() as session:
+			reminders = list_active_reminders(session)
+			to_send = []
+			for r in reminders:
+				ra = r.remind_at
+				if ra is None:
+					continue
+				# Приводим naive к локальной тайзоне
+				if ra.tzinfo is None:
+					ra = ra.replace(tzinfo=tz)
+				if ra <= now and not r.is_sent:
+					to_send.append(r)
+			return to_send
+
+	def _mark_sent(reminder_id: int, text: str, chat: str) -> None:
+		with session_scope() as session:
+			mark_sent(session, reminder_id)
+			log_event(session, action="reminder_sent", resource="reminder", actor=chat, payload={"reminder_id": reminder_id, "text": text})
+
+	def _delete_old(cutoff: datetime) -> None:
+		from app.repositories.reminders import delete_sent_before as _del_old
+		with session_scope() as session:
+			_del_old(session, cutoff)
+
+	# запросы к БД — в пуле потоков, цикл событий не блокируется
+	to_send = await run_io(_due)
 	if not to_send:
 		return
 	logger.info("reminders_due", count=len(to_send), now=str(now))
@@ -202,18 +247,44 @@ async def reminders_tick_job() -> None:
 			current_time = datetime.now(ZoneInfo(settings.timezone))
 			message = f"⏰ Напоминание #{r.id}\n📝 {r.text}\n🕐 Время: {current_time.strftime('%H:%M:%S')} (UTC+5)"
 			await bot.send_message(chat_id=target_chat, text=message)
-			with session_scope() as session:
-				mark_sent(session, r.id)
-				log_event(session, action="reminder_sent", resource="reminder", actor=str(target_chat), payload={"reminder_id": r.id, "text": r.text})
+			await run_io(_mark_sent, r.id, r.text, str(target_chat))
 		except Exception as exc:
 			logger.warning("reminder_send_failed", reminder_id=r.id, error=str(exc))
 	await bot.session.close()
 	# Удалим отправленные напоминания старше 1 дня
 	from datetime import timedelta as _td
-	with session_scope() as session:
-		from app.repositories.reminders import delete_sent_before as _del_old
-		cutoff = now - _td(days=1)
-		_del_old(session, cutoff)
+	await run_io(_delete_old, now - _td(days=1))
+
+
+async def match_notifications_job() -> None:
+	"""Новые пары из таблицы matches со score не ниже MATCH_NOTIFY_MIN_SCORE — в админ-чат."""
+	settings = get_settings()
+	if not settings.telegram_bot_token or not settings.admin_chat_id or settings.match_notify_min_score <= 0:
+		return
+
+	def _pending() -> Tuple[List[int], str]:
+		with session_scope() as session:
+			rows = list_unnotified_matches(session, settings.match_notify_min_score)
+			if not rows:
+				return [], ""
+			return [m.id for m in rows], format_match_notice(rows)
+
+	def _mark_notified(ids: List[int]) -> None:
+		with session_scope() as session:
+			mark_matches_notified(session, ids)
+
+	ids, text = await run_io(_pending)
+	if not ids:
+		return
+	bot = Bot(token=settings.telegram_bot_token)
+	try:
+		await bot.send_message(chat_id=settings.admin_chat_id, text=text)
+		await run_io(_mark_notified, ids)
+		logger.info("match_notifications_sent", count=len(ids), sent_to=settings.admin_chat_id)
+	except Exception as exc:
+		logger.warning("match_notifications_failed", count=len(ids), error=str(exc))
+	finally:
+		await bot.session.close()
 
 
 async def weekly_diagnostics_job() -> None:
@@ -224,8 +295,12 @@ async def weekly_diagnostics_job() -> None:
 	if not settings.telegram_bot_token or not settings.admin_chat_id:
 		logger.warning("weekly_diagnostics_job_skipped", reason="missing_telegram_config", has_token=bool(settings.telegram_bot_token), has_chat_id=bool(settings.admin_chat_id))
 		return
-	with session_scope() as session:
-		text, _ = run_diagnostics(session)
+
+	def _diagnose() -> str:
+		with session_scope() as session:
+			return run_diagnostics(session)[0]
+
+	text = await run_io(_diagnose)
 	
 	# Добавляем информацию о времени выполнения
 	now = datetime.now(ZoneInfo(settings.timezone))
@@ -275,18 +350,17 @@ async def friday_test_report_job() -> None:
 		logger.warning("friday_test_report_job_skipped", reason="missing_smtp_config", has_host=bool(settings.smtp_host), has_username=bool(settings.smtp_username), has_password=bool(settings.smtp_password))
 		return
 	
-	with session_scope() as session:
-		items: List[Listing] = get_all_listings(session)
+	items, duplicates = await run_io(_load_listings_with_duplicates)
 	
 	now = datetime.now(ZoneInfo(settings.timezone))
 	stamp = now.strftime('%Y%m%d_%H%M%S')
 	out_path = Path.cwd() / f"test_report_{stamp}.xlsx"
-	export_stats_to_excel(items, out_path)
+	await run_io(export_stats_to_excel, items, out_path, duplicates=duplicates)
 	
 	try:
 		subject = f"Тестовый отчёт - {len(items)} items"
 		body = f"Тестовый отчёт сгенерирован {stamp} (UTC+5)\nTotal items: {len(items)}\nTimezone: {settings.timezone}\nGenerated: {now.strftime('%Y-%m-%d %H:%M:%S')}"
-		send_email(subject=subject, body=body, attachments=[out_path])
+		await run_io(send_email, subject=subject, body=body, attachments=[out_path])
 		logger.info("friday_test_report_job_completed", items_count=len(items), sent_to=settings.smtp_to)
 	except Exception as e:
 		logger.error("friday_test_report_job_failed", error=str(e))
@@ -322,9 +396,16 @@ def start_scheduler() -> None:
 	
 	_scheduler.add_job(reminders_tick_job, trigger='cron', second='0', id='reminders_tick')
 	logger.info("scheduler_job_added", job_id='reminders_tick', schedule='every second')
+
+	_scheduler.add_job(match_notifications_job, trigger='cron', second='30', id='match_notifications')
+	logger.info("scheduler_job_added", job_id='match_notifications', schedule='every minute at :30')
 	
 	_scheduler.add_job(weekly_diagnostics_job, trigger='cron', day_of_week='wed', hour=18, minute=0, id='weekly_diagnostics')
 	logger.info("scheduler_job_added", job_id='weekly_diagnostics', schedule='Wednesday 18:00 (UTC+5)')
+
+	# таблица matches проверяется (и при необходимости пересчитывается) сразу после старта, не задерживая его
+	_scheduler.add_job(matches_rebuild_job, trigger='date', id='matches_rebuild', misfire_grace_time=None)
+	logger.info("scheduler_job_added", job_id='matches_rebuild', schedule='once at startup')
 	
 	# Тестовая задача: отправляет сообщение 'ТЕСТ' каждую минуту (ОТКЛЮЧЕНО)
 	# _scheduler.add_job(test_message_job, trigger='cron', minute='*', id='test_message')
@@ -7,14 +7,14 @@ from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
 from app.config import get_settings
-from app.db import session_scope
-from app.repositories.access import get_token
+from app.db import async_session_scope
+from app.repositories.access import get_token_async
 
 
 basic = HTTPBasic()
 
 
-def require_web_access(request: Request, creds: Optional[HTTPBasicCredentials] = Depends(basic)) -> None:
+async def require_web_access(request: Request, creds: Optional[HTTPBasicCredentials] = Depends(basic)) -> None:
 	settings = get_settings()
 	# 1) basic-admin
 	if creds is not None and creds.username == settings.admin_username and creds.password == settings.admin_password:
@@ -22,8 +22,8 @@ def require_web_access(request: Request, creds: Optional[HTTPBasicCredentials] =
 	# 2) guest token in query (?token=...)
 	token = request.query_params.get("token")
 	if token:
-		with session_scope() as session:
-			entry = get_token(session, token)
+		async with async_session_scope() as session:
+			entry = await get_token_async(session, token)
 			if entry and (entry.expires_at is None or entry.expires_at > datetime.now(ZoneInfo("Asia/Tashkent"))):
 				return
 	raise HTTPException(status_code=401, detail="Unauthorized")
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""Замер производительности сопоставления на синтетических каталогах.
+
+Каталог строится из словаря дампа local_backup.sql (наименования, города, цены, год выпуска):
+наименования перемешиваются, в них меняются номера моделей и вносятся опечатки. Замеряются
+find_matches по каждому движку и title_similarity / score_pair по каждой доступной реализации
+расстояния Левенштейна; результат — JSON для сравнения между релизами.
+
+	python -m app.services.benchmark --sizes 1000,10000 --output bench.json
+
+Движок "python" на 100 000 записей считает долго — для больших размеров удобно
+--engines numpy,tfidf.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import structlog
+
+from app.models.listings import Listing
+from app.services import edit_distance
+from app.services.matching import ENGINES, MatchStats, find_matches, group_listings, score_pair, title_similarity, warm_up
+
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# Дамп лежит в корне репозитория, рядом с каталогом AI_DB
+DEFAULT_SOURCE = Path(__file__).resolve().parents[3] / "local_backup.sql"
+
+_COPY_RE = re.compile(r"^COPY public\.listings \((?P<columns>[^)]*)\) FROM stdin;$")
+_DIGITS_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"[\w\dа-яё]+", flags=re.IGNORECASE)
+_YEAR_RE = re.compile(r"^(19|20)\d\d$")
+_LETTERS = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+
+@dataclass
+class CatalogueVocabulary:
+	"""Словарь, из которого собираются синтетические записи."""
+	titles: List[str]
+	words: List[str]
+	locations: List[str]
+	prices: List[Decimal]
+	years: List[str]
+	demand_share: float
+	# доля записей с ценой и с характеристиками в исходных данных
+	price_share: float = 0.5
+	characteristics_share: float = 0.3
+	source: str = ""
+
+
+def _read_dump(path: Path) -> str:
+	raw = path.read_bytes()
+	if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+		text = raw.decode("utf-16")
+		# дамп, сохранённый через консоль Windows: UTF-8 прочитан как cp866 и записан в UTF-16
+		try:
+			return text.encode("cp866").decode("utf-8")
+		except (UnicodeEncodeError, UnicodeDecodeError):
+			return text
+	return raw.decode("utf-8")
+
+
+def _copy_rows(text: str) -> List[Dict[str, Optional[str]]]:
+	rows: List[Dict[str, Optional[str]]] = []
+	columns: List[str] | None = None
+	for line in text.splitlines():
+		if columns is None:
+			m = _COPY_RE.match(line)
+			if m:
+				columns = [c.strip() for c in m.group("columns").split(",")]
+			continue
+		if line == "\\.":
+			break
+		values = line.split("\t")
+		rows.append({c: (None if v == "\\N" else v) for c, v in zip(columns, values)})
+	return rows
+
+
+def load_vocabulary(path: Path | str = DEFAULT_SOURCE) -> CatalogueVocabulary:
+	"""Словарь из блока COPY public.listings дампа pg_dump."""
+	path = Path(path)
+	rows = _copy_rows(_read_dump(path))
+	if not rows:
+		raise ValueError(f"no listings in {path}")
+	titles = [r["title"].strip() for r in rows if r.get("title") and r["title"].strip()]
+	words = sorted({w for t in titles for w in _WORD_RE.findall(t) if len(w) >= 3 and not w.isdigit()})
+	locations = sorted({r["location"].strip() for r in rows if r.get("location") and r["location"].strip()})
+	prices: List[Decimal] = []
+	for r in rows:
+		try:
+			price = Decimal(r.get("price") or "0")
+		except ArithmeticError:
+			continue
+		if price > 1:
+			prices.append(price)
+	years = [r["characteristics"] for r in rows if r.get("characteristics") and _YEAR_RE.match(r["characteristics"])]
+	demands = sum(1 for r in rows if (r.get("type") or "").lower() == "demand")
+	return CatalogueVocabulary(
+		titles=titles,
+		words=words,
+		locations=locations or ["Москва"],
+		prices=prices or [Decimal(1000)],
+		years=years or ["2015"],
+		demand_share=demands / len(rows),
+		# в дампе цены и характеристики почти не заполнены — не меньше трети записей с ними
+		price_share=max(len(prices) / len(rows), 0.3),
+		characteristics_share=max(len(years) / len(rows), 0.3),
+		source=str(path),
+	)
+
+
+def _typo(word: str, rnd: random.Random) -> str:
+	if len(word) < 4:
+		return word
+	i = rnd.randrange(1, len(word) - 1)
+	kind = rnd.randrange(3)
+	if kind == 0:
+		return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+	if kind == 1:
+		return word[:i] + word[i + 1:]
+	return word[:i] + rnd.choice(_LETTERS) + word[i + 1:]
+
+
+def _synthetic_title(vocab: CatalogueVocabulary, rnd: random.Random) -> str:
+	words = rnd.choice(vocab.titles).split()
+	# номера моделей и размеров — свои у каждой записи, как в живом каталоге
+	words = [_DIGITS_RE.sub(lambda m: str(rnd.randrange(10 ** len(m.group()))), w) if rnd.random() < 0.5 else w for w in words]
+	if rnd.random() < 0.3:
+		words.insert(rnd.randrange(len(words) + 1), rnd.choice(vocab.words))
+	if rnd.random() < 0.1:
+		i = rnd.randrange(len(words))
+		words[i] = _typo(words[i], rnd)
+	return " ".join(words)
+
+
+def generate_catalogue(size: int, vocab: CatalogueVocabulary, *, seed: int = 1) -> List[Listing]:
+	"""size записей (спрос и предложение в пропорции дампа); при одном seed — один и тот же каталог."""
+	rnd = random.Random(seed)
+	updated_at = datetime(2025, 1, 1)
+	catalogue: List[Listing] = []
+	for i in range(size):
+		location = rnd.choice(vocab.locations)
+		if rnd.random() < 0.2:
+			# одинаковые города, записанные по-разному
+			location = location.lower() + " "
+		price = None
+		if rnd.random() < vocab.price_share:
+			price = (rnd.choice(vocab.prices) * Decimal(rnd.uniform(0.8, 1.2))).quantize(Decimal("1"))
+		characteristics = None
+		if rnd.random() < vocab.characteristics_share:
+			characteristics = {"год выпуска": rnd.choice(vocab.years)}
+		listing = Listing(
+			id=i + 1,
+			title=_synthetic_title(vocab, rnd),
+			characteristics=characteristics,
+			price=price,
+			location=location,
+			contact="0",
+			type="demand" if rnd.random() < vocab.demand_share else "sale",
+		)
+		listing.updated_at = updated_at
+		catalogue.append(listing)
+	return catalogue
+
+
+def _peak_mb(fn: Callable[[], Any]) -> float:
+	"""Пиковый объём памяти Python-аллокаций (в т.ч. массивов numpy) за вызов fn, МБ."""
+	was_tracing = tracemalloc.is_tracing()
+	if not was_tracing:
+		tracemalloc.start()
+	tracemalloc.reset_peak()
+	base = tracemalloc.get_traced_memory()[0]
+	try:
+		fn()
+		return round((tracemalloc.get_traced_memory()[1] - base) / 1e6, 2)
+	finally:
+		if not was_tracing:
+			tracemalloc.stop()
+
+
+def bench_find_matches(demands: List[Listing], sales: List[Listing], engine: str, *, memory: bool = True, **kwargs: Any) -> Dict[str, Any]:
+	stats = MatchStats()
+	started = time.perf_counter()
+	pairs = find_matches(demands, sales, engine=engine, stats=stats, **kwargs)
+	seconds = time.perf_counter() - started
+	result: Dict[str, Any] = {
+		"benchmark": "find_matches",
+		"engine": engine,
+		"seconds": round(seconds, 4),
+		"matches": len(pairs),
+		"candidate_pairs": stats.candidate_pairs,
+		"pairs_per_second": round(stats.candidate_pairs / seconds) if seconds > 0 else None,
+	}
+	del pairs
+	if memory:
+		# отдельный прогон: под tracemalloc время заметно больше
+		result["peak_mb"] = _peak_mb(lambda: find_matches(demands, sales, engine=engine, **kwargs))
+	return result
+
+
+def _bench_calls(name: str, backend: str, calls: List[Callable[[], float]], repeat: int, memory: bool) -> Dict[str, Any]:
+	def run() -> None:
+		for call in calls:
+			call()
+
+	# первый проход заполняет кэш лемм — замеряются сами сравнения
+	run()
+	best = float("inf")
+	for _ in range(max(1, repeat)):
+		started = time.perf_counter()
+		run()
+		best = min(best, time.perf_counter() - started)
+	result: Dict[str, Any] = {
+		"benchmark": name,
+		"backend": backend,
+		"calls": len(calls),
+		"seconds": round(best, 4),
+		"us_per_call": round(best / len(calls) * 1e6, 2) if calls else None,
+	}
+	if memory:
+		result["peak_mb"] = _peak_mb(run)
+	return result
+
+
+def _sample_pairs(demands: List[Listing], sales: List[Listing], n: int, rnd: random.Random) -> List[Tuple[Listing, Listing]]:
+	if not demands or not sales:
+		return []
+	return [(rnd.choice(demands), rnd.choice(sales)) for _ in range(n)]
+
+
+@dataclass
+class BenchmarkConfig:
+	sizes: Sequence[int] = DEFAULT_SIZES
+	engines: Sequence[str] = ENGINES
+	backends: Sequence[str] = field(default_factory=edit_distance.available_backends)
+	source: Path | str = DEFAULT_SOURCE
+	seed: int = 1
+	# число пар для title_similarity / score_pair и повторов (берётся лучший)
+	calls: int = 20000
+	repeat: int = 3
+	memory: bool = True
+	threshold: float = 0.45
+	workers: int | None = None
+
+
+def run_benchmark(config: BenchmarkConfig, *, log: Callable[[str], None] | None = None) -> Dict[str, Any]:
+	"""Все замеры по config; результат — словарь, пригодный для json.dump."""
+	log = log or (lambda message: None)
+	vocab = load_vocabulary(config.source)
+	warm_up()
+	results: List[Dict[str, Any]] = []
+	previous_backend = edit_distance.backend_name()
+	try:
+		for size in config.sizes:
+			demands, sales = group_listings(generate_catalogue(size, vocab, seed=config.seed))
+			base = {"size": size, "demands": len(demands), "sales": len(sales)}
+			pairs = _sample_pairs(demands, sales, config.calls, random.Random(config.seed))
+			for backend in config.backends:
+				edit_distance.select_backend(backend)
+				log(f"size={size} title_similarity/score_pair backend={backend}")
+				title_calls = [lambda d=d, s=s: title_similarity(d.title, s.title) for d, s in pairs]
+				score_calls = [lambda d=d, s=s: score_pair(d, s) for d, s in pairs]
+				results.append({**base, **_bench_calls("title_similarity", backend, title_calls, config.repeat, config.memory)})
+				results.append({**base, **_bench_calls("score_pair", backend, score_calls, config.repeat, config.memory)})
+			edit_distance.select_backend(previous_backend)
+			for engine in config.engines:
+				log(f"size={size} find_matches engine={engine}")
+				record = bench_find_matches(demands, sales, engine, memory=config.memory, threshold=config.threshold, workers=config.workers)
+				results.append({**base, **record, "backend": previous_backend})
+	finally:
+		edit_distance.select_backend(previous_backend)
+	return {"meta": _environment(config, vocab), "results": results}
+
+
+def _environment(config: BenchmarkConfig, vocab: CatalogueVocabulary) -> Dict[str, Any]:
+	try:
+		import numpy
+		numpy_version: str | None = numpy.__version__
+	except ImportError:  # pragma: no cover
+		numpy_version = None
+	try:
+		import scipy
+		scipy_version: str | None = scipy.__version__
+	except ImportError:
+		scipy_version = None
+	return {
+		"created_at": datetime.now().isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpu_count": os.cpu_count(),
+		"numpy": numpy_version,
+		"scipy": scipy_version,
+		"edit_distance_backends": edit_distance.available_backends(),
+		"seed": config.seed,
+		"threshold": config.threshold,
+		"workers": config.workers,
+		"source": vocab.source,
+		"vocabulary": {"titles": len(vocab.titles), "words": len(vocab.words), "locations": len(vocab.locations)},
+	}
+
+
+def _csv(value: str) -> List[str]:
+	return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m app.services.benchmark", description="Замер производительности сопоставления")
+	parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="размеры каталогов через запятую")
+	parser.add_argument("--engines", default=",".join(ENGINES), help="движки find_matches через запятую")
+	parser.add_argument("--backends", default=",".join(edit_distance.available_backends()), help="реализации расстояния Левенштейна")
+	parser.add_argument("--source", default=str(DEFAULT_SOURCE), help="дамп pg_dump со словарём (local_backup.sql)")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--calls", type=int, default=20000, help="пар для title_similarity и score_pair")
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--threshold", type=float, default=0.45)
+	parser.add_argument("--workers", type=int, default=None, help="процессов для find_matches (0 — по числу ядер)")
+	parser.add_argument("--no-memory", action="store_true", help="не замерять пиковую память (без повторного прогона)")
+	parser.add_argument("--output", default="-", help="файл для JSON (по умолчанию stdout)")
+	args = parser.parse_args(argv)
+	# журнал расчёта — в stderr, чтобы в stdout оставался только JSON
+	structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+	engines = _csv(args.engines)
+	backends = _csv(args.backends)
+	unknown = [e for e in engines if e not in ENGINES] + [b for b in backends if b not in edit_distance.available_backends()]
+	if unknown:
+		parser.error(f"недоступны: {', '.join(unknown)}")
+	if not Path(args.source).is_file():
+		parser.error(f"нет файла {args.source}")
+	config = BenchmarkConfig(
+		sizes=[int(s) for s in _csv(args.sizes)],
+		engines=engines,
+		backends=backends,
+		source=args.source,
+		seed=args.seed,
+		calls=args.calls,
+		repeat=args.repeat,
+		memory=not args.no_memory,
+		threshold=args.threshold,
+		workers=args.workers,
+	)
+	report = run_benchmark(config, log=lambda message: print(message, file=sys.stderr))
+	payload = json.dumps(report, ensure_ascii=False, indent=2)
+	if args.output == "-":
+		print(payload)
+	else:
+		Path(args.output).write_text(payload + "\n", encoding="utf-8")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
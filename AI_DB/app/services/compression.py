@@ -0,0 +1,106 @@
+from __future__ import annotations
+import gzip
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+	import brotli as _brotli
+except ImportError:  # pragma: no cover - библиотека необязательна
+	_brotli = None
+
+
+BROTLI_AVAILABLE = _brotli is not None
+# сжимаются только страницы и ответы API; статика отдаётся заранее сжатой (static_assets)
+COMPRESSIBLE_TYPES = ("text/html", "application/json")
+
+
+def compress(data: bytes, encoding: str, *, best: bool = False) -> bytes:
+	"""gzip или br. best — наибольшая степень (для сборки статики), иначе быстрая (для ответов)."""
+	if encoding == "br":
+		return _brotli.compress(data, quality=11 if best else 4)
+	# mtime=0 — одинаковые данные дают одинаковый результат
+	return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+	"""Поддерживаемые кодировки из Accept-Encoding в порядке предпочтения (br, затем gzip)."""
+	weights: Dict[str, float] = {}
+	for part in accept_encoding.lower().split(","):
+		name, _, params = part.strip().partition(";")
+		q = 1.0
+		params = params.strip()
+		if params.startswith("q="):
+			try:
+				q = float(params[2:])
+			except ValueError:
+				q = 0.0
+		weights[name.strip()] = q
+	star = weights.get("*", 0.0)
+	result = []
+	for enc in ("br", "gzip"):
+		if enc == "br" and not BROTLI_AVAILABLE:
+			continue
+		if weights.get(enc, star) > 0:
+			result.append(enc)
+	return result
+
+
+class CompressionMiddleware:
+	"""Сжатие HTML- и JSON-ответов (br или gzip по Accept-Encoding) размером от minimum_size байт.
+	Тело ответа собирается целиком: страницы и JSON здесь небольшие; файлы (выгрузки, статика)
+	с другим Content-Type передаются как есть, без буферизации.
+	"""
+
+	def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+		self.app = app
+		self.minimum_size = minimum_size
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		# HEAD: тела нет, а Content-Length должен остаться длиной ответа на GET
+		if scope["type"] != "http" or scope["method"] == "HEAD":
+			await self.app(scope, receive, send)
+			return
+		encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+		# без подходящей кодировки ответ не сжимается, но Vary ставится всё равно — для кэшей
+		encoding = encodings[0] if encodings else None
+		start: Optional[Message] = None
+		compressible: Optional[bool] = None
+		chunks: List[bytes] = []
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal start, compressible
+			if message["type"] == "http.response.start":
+				start = message
+				return
+			if message["type"] != "http.response.body" or start is None:
+				await send(message)
+				return
+			if compressible is None:
+				headers = Headers(raw=start["headers"])
+				media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+				compressible = (
+					media_type in COMPRESSIBLE_TYPES
+					and "content-encoding" not in headers
+					and start["status"] not in (204, 304)
+				)
+				if not compressible:
+					await send(start)
+			if not compressible:
+				await send(message)
+				return
+			chunks.append(message.get("body", b""))
+			if message.get("more_body", False):
+				return
+			body = b"".join(chunks)
+			headers = MutableHeaders(raw=start["headers"])
+			headers.add_vary_header("Accept-Encoding")
+			if encoding is not None and len(body) >= self.minimum_size:
+				body = compress(body, encoding)
+				headers["Content-Encoding"] = encoding
+				headers["Content-Length"] = str(len(body))
+			await send(start)
+			await send({"type": "http.response.body", "body": body})
+
+		await self.app(scope, receive, send_wrapper)
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 
 from app.models.listings import Listing
 from app.models.photos import Photo
+from app.services.near_duplicates import find_near_duplicates
 
 
 @dataclass
@@ -55,6 +56,12 @@ def run_diagnostics(session: Session) -> Tuple[str, List[DiagnosticIssue]]:
 		else:
 			seen[key] = l.id
 
+	# Похожие записи: MinHash по наименованию и характеристикам, кандидаты — по полосам LSH
+	found = find_near_duplicates(session, listings)
+	for c in found:
+		ids = ", ".join(f"#{x.id}" for x in c.listings)
+		issues.append(DiagnosticIssue("warn", f"Похожие записи ({len(c.listings)}, сходство от {c.similarity:.2f}): {ids}", c.listings[0].id))
+
 	# Фото: битые/пустые ссылки (только проверяем пустоту/формат)
 	for l in listings:
 		links = l.photo_links or []
@@ -71,6 +78,7 @@ def run_diagnostics(session: Session) -> Tuple[str, List[DiagnosticIssue]]:
 	lines.append("=== Диагностика ===")
 	lines.append(f"Всего записей: {len(listings)}")
 	lines.append(f"Найдено проблем: {len(issues)}")
+	lines.append(f"Групп похожих записей: {len(found)}")
 	for i in issues:
 		prefix = {"info": "[i]", "warn": "[!]", "error": "[x]"}.get(i.severity, "[?]")
 		if i.listing_id:
@@ -0,0 +1,117 @@
+from __future__ import annotations
+from typing import Callable, Dict, List
+
+import structlog
+
+from app.config import get_settings
+
+
+logger = structlog.get_logger(__name__)
+
+# Ограниченное расстояние: (a, b, k) → точное расстояние, если оно ≤ k, иначе k + 1
+BoundedDistance = Callable[[str, str, int], int]
+
+
+def levenshtein_bounded_python(a: str, b: str, k: int) -> int:
+	"""Левенштейн в полосе |i - j| ≤ k с выходом, как только вся строка матрицы превысила k."""
+	if a == b:
+		return 0
+	la, lb = len(a), len(b)
+	big = k + 1
+	if k < 0 or abs(la - lb) > k:
+		return big
+	if la > lb:
+		a, b, la, lb = b, a, lb, la
+	if la == 0:
+		return lb
+	# ячейки вне полосы заведомо больше k — храним их как k + 1
+	prev: List[int] = [j if j <= k else big for j in range(lb + 1)]
+	for i in range(1, la + 1):
+		ca = a[i - 1]
+		cur = [big] * (lb + 1)
+		cur[0] = i if i <= k else big
+		row_min = cur[0]
+		for j in range(max(1, i - k), min(lb, i + k) + 1):
+			v = prev[j - 1] if ca == b[j - 1] else prev[j - 1] + 1
+			if prev[j] + 1 < v:
+				v = prev[j] + 1
+			if cur[j - 1] + 1 < v:
+				v = cur[j - 1] + 1
+			if v > big:
+				v = big
+			cur[j] = v
+			if v < row_min:
+				row_min = v
+		if row_min > k:
+			return big
+		prev = cur
+	return prev[lb]
+
+
+_BACKENDS: Dict[str, BoundedDistance] = {"python": levenshtein_bounded_python}
+
+try:
+	from rapidfuzz.distance import Levenshtein as _rf_levenshtein
+
+	def _levenshtein_bounded_rapidfuzz(a: str, b: str, k: int) -> int:
+		if k < 0:
+			return k + 1
+		return _rf_levenshtein.distance(a, b, score_cutoff=k)
+
+	_BACKENDS["rapidfuzz"] = _levenshtein_bounded_rapidfuzz
+except ImportError:  # pragma: no cover - библиотека необязательна
+	pass
+
+try:
+	import Levenshtein as _py_levenshtein
+
+	def _levenshtein_bounded_levenshtein(a: str, b: str, k: int) -> int:
+		if k < 0:
+			return k + 1
+		return _py_levenshtein.distance(a, b, score_cutoff=k)
+
+	_BACKENDS["levenshtein"] = _levenshtein_bounded_levenshtein
+except ImportError:  # pragma: no cover - библиотека необязательна
+	pass
+
+# Порядок выбора в режиме auto: сначала C-реализации
+_PREFERRED = ("rapidfuzz", "levenshtein", "python")
+
+
+def available_backends() -> List[str]:
+	return [name for name in _PREFERRED if name in _BACKENDS]
+
+
+def register_backend(name: str, fn: BoundedDistance) -> None:
+	"""Регистрирует реализацию (например, для замера производительности)."""
+	global _selected
+	_BACKENDS[name] = fn
+	_selected = None
+
+
+_selected: str | None = None
+
+
+def backend_name() -> str:
+	"""Выбранная реализация: EDIT_DISTANCE_BACKEND или первая доступная из _PREFERRED."""
+	global _selected
+	if _selected is None:
+		wanted = (get_settings().edit_distance_backend or "auto").strip().lower()
+		if wanted != "auto" and wanted not in _BACKENDS:
+			logger.warning("edit_distance_backend_unavailable", wanted=wanted, available=available_backends())
+			wanted = "auto"
+		_selected = available_backends()[0] if wanted == "auto" else wanted
+		logger.info("edit_distance_backend_selected", backend=_selected)
+	return _selected
+
+
+def get_backend() -> BoundedDistance:
+	return _BACKENDS[backend_name()]
+
+
+def select_backend(name: str) -> None:
+	"""Выбирает реализацию явно, в обход EDIT_DISTANCE_BACKEND (замер производительности)."""
+	global _selected
+	if name not in _BACKENDS:
+		raise ValueError(f"unknown edit distance backend: {name}")
+	_selected = name
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+import structlog
+
+from app.config import get_settings
+
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+
+def _timed(fn: Callable[..., T], *args: Any, **kwargs: Any) -> Tuple[float, float, T]:
+	# время по time.time(): для пула процессов начало фиксируется в другом процессе
+	started = time.time()
+	result = fn(*args, **kwargs)
+	return started, time.time(), result
+
+
+def _noop() -> None:
+	return None
+
+
+class TrackedExecutor:
+	"""Пул с учётом очереди: сколько задач ждёт свободного воркера и сколько они ждали.
+	Пул создаётся при первой задаче.
+	"""
+
+	def __init__(self, name: str, max_workers: int, factory: Callable[[int], Executor]) -> None:
+		self.name = name
+		self.max_workers = max(1, max_workers)
+		self._factory = factory
+		self._pool: Executor | None = None
+		self._lock = threading.Lock()
+		self.submitted = 0
+		self.completed = 0
+		self.failed = 0
+		self.in_flight = 0
+		self.max_queue_depth = 0
+		self._wait_total = 0.0
+		self._wait_max = 0.0
+		self._run_total = 0.0
+
+	def _get_pool(self) -> Executor:
+		with self._lock:
+			if self._pool is None:
+				self._pool = self._factory(self.max_workers)
+				logger.info("executor_started", executor=self.name, max_workers=self.max_workers)
+			return self._pool
+
+	@property
+	def queue_depth(self) -> int:
+		"""Задачи, которым не хватило свободного воркера."""
+		return max(0, self.in_flight - self.max_workers)
+
+	async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+		pool = self._get_pool()
+		with self._lock:
+			self.submitted += 1
+			self.in_flight += 1
+			self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+		queued = time.time()
+		try:
+			started, finished, result = await asyncio.wrap_future(pool.submit(functools.partial(_timed, fn, *args, **kwargs)))
+		except BaseException as exc:
+			with self._lock:
+				self.in_flight -= 1
+				self.failed += 1
+				if isinstance(exc, BrokenExecutor) and self._pool is pool:
+					# воркер процесса упал (например, OOM) — следующая задача получит новый пул
+					self._pool = None
+			if isinstance(exc, BrokenExecutor):
+				logger.error("executor_broken", executor=self.name, error=str(exc))
+			raise
+		wait = max(0.0, started - queued)
+		with self._lock:
+			self.in_flight -= 1
+			self.completed += 1
+			self._wait_total += wait
+			self._wait_max = max(self._wait_max, wait)
+			self._run_total += finished - started
+		if wait >= 1.0:
+			logger.warning("executor_queue_wait", executor=self.name, wait_ms=round(wait * 1000, 1), fn=getattr(fn, "__name__", repr(fn)))
+		return result
+
+	def warm_up(self) -> None:
+		"""Запускает воркеры заранее (для пула процессов — чтобы первый запрос не ждал spawn)."""
+		self._get_pool().submit(_noop)
+
+	def shutdown(self) -> None:
+		with self._lock:
+			pool, self._pool = self._pool, None
+		if pool is not None:
+			pool.shutdown(wait=False, cancel_futures=True)
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			done = self.completed
+			return {
+				"max_workers": self.max_workers,
+				"started": self._pool is not None,
+				"submitted": self.submitted,
+				"completed": done,
+				"failed": self.failed,
+				"in_flight": self.in_flight,
+				"queue_depth": self.queue_depth,
+				"max_queue_depth": self.max_queue_depth,
+				"avg_wait_ms": round(self._wait_total / done * 1000, 2) if done else 0.0,
+				"max_wait_ms": round(self._wait_max * 1000, 2),
+				"avg_run_ms": round(self._run_total / done * 1000, 2) if done else 0.0,
+			}
+
+
+_io: TrackedExecutor | None = None
+_cpu: TrackedExecutor | None = None
+_init_lock = threading.Lock()
+
+
+def _thread_pool(n: int) -> Executor:
+	return ThreadPoolExecutor(max_workers=n, thread_name_prefix="io")
+
+
+def _process_pool(n: int) -> Executor:
+	# spawn, как в matching_parallel: fork процесса с потоками (uvicorn, aiogram) небезопасен
+	return ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context("spawn"))
+
+
+def io_executor() -> TrackedExecutor:
+	global _io
+	with _init_lock:
+		if _io is None:
+			_io = TrackedExecutor("io", get_settings().executor_io_workers, _thread_pool)
+		return _io
+
+
+def cpu_executor() -> TrackedExecutor:
+	global _cpu
+	with _init_lock:
+		if _cpu is None:
+			_cpu = TrackedExecutor("cpu", get_settings().executor_cpu_workers or os.cpu_count() or 1, _process_pool)
+		return _cpu
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+	"""Вызов в пуле потоков: запросы к БД, SMTP, HTTP и всё, что работает с сессией или
+	кэшами процесса (результаты совпадений, компоненты score)."""
+	return await io_executor().run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+	"""Вызов в пуле процессов: чистые вычисления над простыми данными. fn — функция уровня
+	модуля, аргументы и результат передаются через pickle."""
+	return await cpu_executor().run(fn, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Any]:
+	return {"io": io_executor().stats(), "cpu": cpu_executor().stats()}
+
+
+def shutdown_executors() -> None:
+	global _io, _cpu
+	with _init_lock:
+		pools, _io, _cpu = (_io, _cpu), None, None
+	for pool in pools:
+		if pool is not None:
+			pool.shutdown()
@@ -3,7 +3,7 @@ from pathlib import Path
 from typing import Iterable, List, Dict
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
 
 from app.models.listings import Listing
@@ -12,6 +12,11 @@ from sqlalchemy.orm import Session
 from decimal import Decimal
 import json
 from app.services.text_normalizer import normalize_contact
+from app.repositories.listing_features import upsert_listing_features
+from app.services.match_cache import invalidate_match_caches
+from app.services.match_store import update_matches_for_listings
+from app.services.matching import MatchPair
+from app.services.near_duplicates import DuplicateCluster
 
 
 def _translate_columns_to_russian(df: pd.DataFrame) -> pd.DataFrame:
@@ -56,7 +61,11 @@ def _translate_columns_to_russian(df: pd.DataFrame) -> pd.DataFrame:
         "payload": "Детали",
         
         # Статистика
-        "count": "Количество"
+        "count": "Количество",
+
+        # Похожие записи (диагностика)
+        "cluster": "Группа",
+        "similarity": "Сходство",
     }
     
     # Переименовываем колонки
@@ -114,7 +123,60 @@ def export_matches_to_excel(matches: List[dict], filepath: str | Path) -> str:
 	return filepath
 
 
-def export_stats_to_excel(listings: List[Listing], filepath: str | Path) -> str:
+# Столбцы выгрузки совпадений и их ширина (в потоковом режиме автоподбор невозможен)
+_MATCH_COLUMNS = [
+	("demand_id", 12),
+	("demand_title", 40),
+	("demand_location", 18),
+	("demand_price", 14),
+	("demand_contact", 22),
+	("sale_id", 12),
+	("sale_title", 40),
+	("sale_location", 18),
+	("sale_price", 14),
+	("sale_contact", 22),
+	("score", 12),
+]
+
+
+def match_row(p: MatchPair) -> dict:
+	"""Строка выгрузки для пары спрос/предложение."""
+	return {
+		"demand_id": p.Demand.id,
+		"demand_title": p.Demand.title,
+		"demand_location": p.Demand.location,
+		"demand_price": float(p.Demand.price) if p.Demand.price is not None else None,
+		"demand_contact": p.Demand.contact,
+		"sale_id": p.Sale.id,
+		"sale_title": p.Sale.title,
+		"sale_location": p.Sale.location,
+		"sale_price": float(p.Sale.price) if p.Sale.price is not None else None,
+		"sale_contact": p.Sale.contact,
+		"score": round(p.score, 3),
+	}
+
+
+def write_matches_xlsx(pairs: Iterable[MatchPair], filepath: str | Path) -> int:
+	"""Потоковая выгрузка совпадений (openpyxl write_only): пары читаются из итератора
+	и сразу пишутся строками, без списка словарей и DataFrame — память не растёт с числом пар.
+	Возвращает число записанных пар.
+	"""
+	headers = _translate_columns_to_russian(pd.DataFrame(columns=[c for c, _ in _MATCH_COLUMNS])).columns
+	wb = Workbook(write_only=True)
+	ws = wb.create_sheet("Совпадения")
+	for i, ((_, width), header) in enumerate(zip(_MATCH_COLUMNS, headers), start=1):
+		ws.column_dimensions[get_column_letter(i)].width = min(60, max(width, len(header) + 2))
+	ws.append(list(headers))
+	count = 0
+	for p in pairs:
+		row = match_row(p)
+		ws.append([row[c] for c, _ in _MATCH_COLUMNS])
+		count += 1
+	wb.save(str(filepath))
+	return count
+
+
+def export_stats_to_excel(listings: List[Listing], filepath: str | Path, duplicates: List[DuplicateCluster] | None = None) -> str:
 	# Лист 1: агрегаты по типу
 	by_type = pd.DataFrame([{ "type": l.type or "", "count": 1 } for l in listings])
 	by_type = by_type.groupby("type", as_index=False).sum()
@@ -126,6 +188,15 @@ def export_stats_to_excel(listings: List[Listing], filepath: str | Path) -> str:
 		{ "id": l.id, "type": l.type, "title": l.title, "price": float(l.price) if l.price is not None else None, "location": l.location, "created_at": l.created_at }
 		for l in listings
 	])
+	# Лист 4: группы похожих записей (если переданы)
+	similar = None
+	if duplicates is not None:
+		similar = pd.DataFrame([
+			{ "cluster": n, "similarity": c.similarity, "id": l.id, "type": l.type, "title": l.title, "price": float(l.price) if l.price is not None else None, "location": l.location }
+			for n, c in enumerate(duplicates, start=1)
+			for l in c.listings
+		], columns=["cluster", "similarity", "id", "type", "title", "price", "location"])
+		similar = _translate_columns_to_russian(similar)
 
 	# Переводим колонки на русский для каждого листа
 	by_type = _translate_columns_to_russian(by_type)
@@ -137,6 +208,8 @@ def export_stats_to_excel(listings: List[Listing], filepath: str | Path) -> str:
 		by_type.to_excel(writer, index=False, sheet_name="По типу")
 		by_city.to_excel(writer, index=False, sheet_name="По городу")
 		raw.to_excel(writer, index=False, sheet_name="Список")
+		if similar is not None:
+			similar.to_excel(writer, index=False, sheet_name="Похожие записи")
 
 	# Автоподбор для каждого листа
 	wb = load_workbook(filepath)
@@ -202,17 +275,25 @@ def _auto_fit_excel(filepath: str) -> None:
 	wb.save(filepath)
 
 
-def import_listings_from_excel(session: Session, filepath: str | Path) -> int:
+def read_listing_rows(filepath: str | Path) -> List[dict]:
+	"""Строки Excel импорта как словари (колонка → значение). Без обращения к БД —
+	годится для пула процессов."""
+	return pd.read_excel(str(filepath)).to_dict("records")
+
+
+def import_listings_from_excel(session: Session, filepath: str | Path, rows: List[dict] | None = None) -> int:
 	"""Импортирует записи из Excel того же формата, что и экспорт, и сливает с БД.
 	Правила слияния:
 	- Если указан id и запись существует — обновляем поля.
 	- Если id пуст / не найден — создаём новую запись.
+	rows — уже прочитанные строки файла (read_listing_rows), чтобы не читать его повторно.
 	Возвращает количество обработанных строк.
 	"""
-	path = str(filepath)
-	df = pd.read_excel(path)
+	if rows is None:
+		rows = read_listing_rows(filepath)
 	count = 0
-	for _, row in df.iterrows():
+	items: List[Listing] = []
+	for row in rows:
 		try:
 			rid = int(row.get("id")) if pd.notna(row.get("id")) else None
 		except Exception:
@@ -244,8 +325,6 @@ def import_listings_from_excel(session: Session, filepath: str | Path) -> int:
 				return None
 		if item is None:
 			quantity_val = _to_int(_val("quantity"))
-			print(f"DEBUG: Row {count}: title={_val('title')}, quantity={_val('quantity')}->{quantity_val}, location={_val('location')}")
-			print(f"DEBUG: All columns: {dict(row)}")
 			item = Listing(
 				title=str(_val("title") or "").strip() or "Без названия",
 				description=_val("description"),
@@ -271,5 +350,11 @@ def import_listings_from_excel(session: Session, filepath: str | Path) -> int:
 		count += 1
 		# Принудительно коммитим каждую запись отдельно, чтобы избежать проблем с bulk insert
 		session.flush()
+		upsert_listing_features(session, item, update_matches=False)
+		items.append(item)
+	session.commit()
+	# пары всех импортированных записей — одним проходом, а не по записи на строку
+	update_matches_for_listings(session, items)
 	session.commit()
+	invalidate_match_caches()
 	return count
\ No newline at end of file
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import structlog
+
+from app.config import get_settings
+
+
+logger = structlog.get_logger(__name__)
+
+
+class LemmaCache:
+	"""Ограниченный LRU-кэш токен → лемма с сохранением в JSON-файл."""
+
+	def __init__(self, maxsize: int = 100_000, path: Optional[Path] = None) -> None:
+		self.maxsize = max(1, maxsize)
+		self.path = path
+		self.hits = 0
+		self.misses = 0
+		self._data: "OrderedDict[str, str]" = OrderedDict()
+		self._dirty = False
+		self._lock = threading.Lock()
+
+	def get(self, token: str) -> Optional[str]:
+		with self._lock:
+			lemma = self._data.get(token)
+			if lemma is None:
+				self.misses += 1
+				return None
+			self._data.move_to_end(token)
+			self.hits += 1
+			return lemma
+
+	def put(self, token: str, lemma: str) -> None:
+		with self._lock:
+			self._data[token] = lemma
+			self._data.move_to_end(token)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+			self._dirty = True
+
+	def load(self) -> int:
+		"""Загружает кэш с диска. Возвращает число загруженных записей."""
+		if self.path is None or not self.path.exists():
+			return 0
+		try:
+			raw = json.loads(self.path.read_text(encoding="utf-8"))
+		except Exception as exc:
+			logger.warning("lemma_cache_load_failed", path=str(self.path), error=str(exc))
+			return 0
+		if not isinstance(raw, dict):
+			return 0
+		with self._lock:
+			for token, lemma in raw.items():
+				if isinstance(token, str) and isinstance(lemma, str):
+					self._data[token] = lemma
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+			return len(self._data)
+
+	def save(self) -> None:
+		"""Атомарно сохраняет кэш на диск (только если были изменения)."""
+		if self.path is None or not self._dirty:
+			return
+		with self._lock:
+			snapshot = dict(self._data)
+			self._dirty = False
+		try:
+			self.path.parent.mkdir(parents=True, exist_ok=True)
+			tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+			tmp.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+			os.replace(tmp, self.path)
+			logger.info("lemma_cache_saved", path=str(self.path), **self.stats())
+		except Exception as exc:
+			logger.warning("lemma_cache_save_failed", path=str(self.path), error=str(exc))
+
+	def stats(self) -> Dict[str, float]:
+		total = self.hits + self.misses
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"size": len(self._data),
+			"hit_rate": round(self.hits / total, 4) if total else 0.0,
+		}
+
+
+def _resolve_cache_path(raw_path: str | None) -> Optional[Path]:
+	if not raw_path:
+		return None
+	p = Path(raw_path)
+	if p.is_absolute():
+		return p
+	# относительный путь якорим на корень проекта, как и каталог загрузок
+	return Path(__file__).resolve().parents[2] / p
+
+
+_cache: LemmaCache | None = None
+
+
+def get_lemma_cache() -> LemmaCache:
+	"""Кэш процесса. При первом обращении читает файл и регистрирует сохранение при выходе."""
+	global _cache
+	if _cache is None:
+		settings = get_settings()
+		_cache = LemmaCache(maxsize=settings.lemma_cache_size, path=_resolve_cache_path(settings.lemma_cache_path))
+		loaded = _cache.load()
+		logger.info("lemma_cache_loaded", path=str(_cache.path), size=loaded)
+		atexit.register(_cache.save)
+	return _cache
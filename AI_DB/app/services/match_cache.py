@@ -0,0 +1,275 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+import structlog
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.services.matching import MatchPair
+
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class MatchResult:
+	"""Результат расчёта совпадений и версия данных, на которой он получен."""
+	pairs: List[MatchPair]
+	data_version: Tuple[Optional[datetime], int]
+
+	@property
+	def listings_count(self) -> int:
+		return self.data_version[1]
+
+
+class MatchResultCache:
+	"""LRU результатов find_matches по (версия данных, полный набор параметров)."""
+
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = max(1, maxsize)
+		self.hits = 0
+		self.misses = 0
+		self._data: "OrderedDict[Hashable, MatchResult]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: Hashable) -> MatchResult | None:
+		with self._lock:
+			result = self._data.get(key)
+			if result is None:
+				self.misses += 1
+				return None
+			self._data.move_to_end(key)
+			self.hits += 1
+			return result
+
+	def put(self, key: Hashable, result: MatchResult) -> None:
+		with self._lock:
+			self._data[key] = result
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		total = self.hits + self.misses
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"size": len(self._data),
+			"hit_rate": round(self.hits / total, 4) if total else 0.0,
+		}
+
+
+_cache: MatchResultCache | None = None
+
+
+def get_match_cache() -> MatchResultCache:
+	global _cache
+	if _cache is None:
+		_cache = MatchResultCache(get_settings().match_result_cache_size)
+	return _cache
+
+
+def invalidate_match_caches() -> None:
+	"""Сбрасывает кэши совпадений процесса (результаты и компоненты score) и число записей
+	для списка /web. Вызывается при создании, изменении, удалении и импорте записей; другие
+	процессы (бот/API) не получат устаревший результат за счёт версии данных в ключе.
+	"""
+	from app.repositories.listings import invalidate_listing_counts
+	from app.services.match_components import get_component_cache
+	get_match_cache().clear()
+	get_component_cache().clear()
+	invalidate_listing_counts()
+
+
+def _result_key(version: Tuple[Optional[datetime], int], *params: Any) -> Hashable:
+	# params — в порядке аргументов get_matches; 0 и None у ограничений равнозначны
+	*head, top_k_per_demand, max_pairs, engine = params
+	return (version, *head, top_k_per_demand or None, max_pairs or None, engine)
+
+
+def get_matches(
+	session: Session,
+	*,
+	threshold: float = 0.45,
+	w_title: float = 0.6,
+	w_char: float = 0.2,
+	w_loc: float = 0.15,
+	w_price: float = 0.05,
+	price_tolerance_abs: Optional[Decimal] = None,
+	price_tolerance_pct: Optional[float] = None,
+	fuzzy_token_threshold: float = 0.6,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+	workers: int | None = None,
+	engine: str = "python",
+) -> MatchResult:
+	"""Совпадения по всем записям через кэш: при неизменных данных и параметрах записи
+	не загружаются и расчёт не повторяется. Промах — чтение таблицы matches (если её
+	параметры подходят) или расчёт через кэш компонент. engine="tfidf" — расчёт движком TF-IDF
+	(своя мера сходства наименований: таблица и кэш компонент для него не годятся).
+	"""
+	from app.repositories.listings import get_all_listings, listings_data_version
+	from app.services.match_components import find_matches_reweighted
+	from app.services.matching import group_listings
+
+	version = listings_data_version(session)
+	key = _result_key(
+		version,
+		threshold,
+		w_title,
+		w_char,
+		w_loc,
+		w_price,
+		price_tolerance_abs,
+		price_tolerance_pct,
+		fuzzy_token_threshold,
+		top_k_per_demand,
+		max_pairs,
+		engine,
+	)
+	cache = get_match_cache()
+	result = cache.get(key)
+	if result is not None:
+		logger.info("match_cache_hit", pairs=len(result.pairs), listings=result.listings_count)
+		return result
+	if engine == "tfidf":
+		from app.services.matching import find_matches
+		demands, sales = group_listings(get_all_listings(session))
+		pairs = find_matches(
+			demands,
+			sales,
+			threshold=threshold,
+			w_title=w_title,
+			w_char=w_char,
+			w_loc=w_loc,
+			w_price=w_price,
+			price_tolerance_abs=price_tolerance_abs,
+			price_tolerance_pct=price_tolerance_pct,
+			fuzzy_token_threshold=fuzzy_token_threshold,
+			engine=engine,
+			top_k_per_demand=top_k_per_demand,
+			max_pairs=max_pairs,
+		)
+		result = MatchResult(pairs=pairs, data_version=version)
+		cache.put(key, result)
+		return result
+	from app.services import match_store
+	stored = match_store.covers(
+		session,
+		threshold=threshold,
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	if stored:
+		# таблица посчитана с подходящими параметрами — индексированный запрос к ней
+		pairs = match_store.read_stored_matches(session, threshold, top_k_per_demand=top_k_per_demand, max_pairs=max_pairs)
+		result = MatchResult(pairs=pairs, data_version=version)
+		cache.put(key, result)
+		return result
+	demands, sales = group_listings(get_all_listings(session))
+	if get_settings().match_candidates == "pg_trgm":
+		# кандидаты из PostgreSQL; кэш компонент считает все пары и здесь не нужен
+		from app.services.matching_pg import find_matches_pg
+		pairs = find_matches_pg(
+			session,
+			demands,
+			sales,
+			threshold=threshold,
+			w_title=w_title,
+			w_char=w_char,
+			w_loc=w_loc,
+			w_price=w_price,
+			price_tolerance_abs=price_tolerance_abs,
+			price_tolerance_pct=price_tolerance_pct,
+			fuzzy_token_threshold=fuzzy_token_threshold,
+			top_k_per_demand=top_k_per_demand,
+			max_pairs=max_pairs,
+			workers=workers,
+		)
+		result = MatchResult(pairs=pairs, data_version=version)
+		cache.put(key, result)
+		return result
+	pairs = find_matches_reweighted(
+		demands,
+		sales,
+		data_version=version,
+		threshold=threshold,
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+		top_k_per_demand=top_k_per_demand,
+		max_pairs=max_pairs,
+		workers=workers,
+	)
+	result = MatchResult(pairs=pairs, data_version=version)
+	cache.put(key, result)
+	return result
+
+
+def stream_matches(
+	session: Session,
+	*,
+	threshold: float = 0.45,
+	w_title: float = 0.6,
+	w_char: float = 0.2,
+	w_loc: float = 0.15,
+	w_price: float = 0.05,
+	price_tolerance_abs: Optional[Decimal] = None,
+	price_tolerance_pct: Optional[float] = None,
+	fuzzy_token_threshold: float = 0.6,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+	workers: int | None = None,
+	engine: str = "python",
+) -> Iterator[MatchPair]:
+	"""Пары для выгрузки без промежуточных копий (сессия должна быть открыта, пока итератор читается):
+	готовый результат из кэша, иначе таблица matches порциями, иначе iter_matches блоками спросов
+	(в последнем случае пары упорядочены по score внутри блока). С max_pairs результат и так
+	ограничен — он берётся из get_matches.
+	"""
+	params = dict(
+		threshold=threshold,
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	if max_pairs:
+		return iter(get_matches(session, top_k_per_demand=top_k_per_demand, max_pairs=max_pairs, workers=workers, engine=engine, **params).pairs)
+	from app.repositories.listings import get_all_listings, listings_data_version
+	from app.services import match_store
+	from app.services.matching import group_listings, iter_matches
+	version = listings_data_version(session)
+	cached = get_match_cache().get(_result_key(version, *params.values(), top_k_per_demand, None, engine))
+	if cached is not None:
+		return iter(cached.pairs)
+	if engine != "tfidf" and match_store.covers(session, **params):
+		return match_store.iter_stored_matches(session, threshold, top_k_per_demand=top_k_per_demand)
+	demands, sales = group_listings(get_all_listings(session))
+	shortlist = None
+	rest_max = max(w_char, 0.0) + max(w_loc, 0.0) + max(w_price, 0.0)
+	if engine != "tfidf" and get_settings().match_candidates == "pg_trgm" and rest_max < threshold:
+		from app.services.matching_pg import pg_trgm_shortlist
+		shortlist = pg_trgm_shortlist(session, demands, sales)
+	return iter_matches(demands, sales, top_k_per_demand=top_k_per_demand, workers=workers, engine=engine, shortlist=shortlist, **params)
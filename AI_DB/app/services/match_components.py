@@ -0,0 +1,268 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.config import get_settings
+from app.models.listings import Listing
+from app.services.matching import (
+	MatchPair,
+	MatchParams,
+	TokenSimilarityMemo,
+	_title_candidates,
+	_title_similarity_encoded,
+	features_of,
+	find_matches,
+)
+from app.services.matching_numpy import _CharIncidence, _location_codes, _price_matrix, _price_vector
+
+
+logger = structlog.get_logger(__name__)
+
+
+# столько ячеек спрос × предложение считается за раз при построении (временные массивы блока)
+_BUILD_BLOCK_CELLS = 262144
+
+
+@dataclass
+class ComponentMatrix:
+	"""Компоненты score пар спрос × предложение: score = w_title·title + w_char·char + w_loc·loc
+	+ w_price·price, поэтому смена весов и порога не требует повторного расчёта сходства.
+	Хранятся только пары с ненулевым сходством наименований или характеристик (rows — номер
+	спроса, cols — предложения, по возрастанию (rows, cols)); score остальных не больше
+	w_loc + w_price (см. covers_threshold). Значения — float64, чтобы score совпадал с find_matches.
+	"""
+	d_ids: Tuple[int, ...]
+	s_ids: Tuple[int, ...]
+	rows: np.ndarray
+	cols: np.ndarray
+	title: np.ndarray
+	char: np.ndarray
+	loc: np.ndarray
+	price: np.ndarray
+
+	@property
+	def nbytes(self) -> int:
+		return sum(a.nbytes for a in (self.rows, self.cols, self.title, self.char, self.loc, self.price))
+
+
+def covers_threshold(p: MatchParams) -> bool:
+	"""Можно ли ответить по ComponentMatrix: пары вне неё (title = char = 0) не проходят порог."""
+	return p.threshold > max(p.w_loc, 0.0) + max(p.w_price, 0.0)
+
+
+def build_components(
+	demands: List[Listing],
+	sales: List[Listing],
+	*,
+	fuzzy_token_threshold: float = 0.6,
+	price_tolerance_abs: Optional[Decimal] = None,
+	price_tolerance_pct: Optional[float] = None,
+) -> ComponentMatrix:
+	"""Считает четыре компоненты для пар с ненулевым сходством наименований или характеристик.
+	Сходство наименований — только для пар из индекса токенов (для остальных оно равно 0),
+	прочие компоненты — массивами, блоками спросов.
+	"""
+	p = MatchParams(
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	d_feats = [features_of(d) for d in demands]
+	s_feats = [features_of(s) for s in sales]
+	memo = TokenSimilarityMemo(fuzzy_token_threshold)
+	d_titles = [memo.vocab.encode(f.lemmas) for f in d_feats]
+	s_titles = [memo.vocab.encode(f.lemmas) for f in s_feats]
+	cands = _title_candidates(
+		[list(f.lemmas) for f in d_feats],
+		[list(f.lemmas) for f in s_feats],
+		fuzzy_token_threshold=fuzzy_token_threshold,
+		memo=memo,
+	)
+	dl, sl = _location_codes(d_feats, s_feats)
+	incidence = _CharIncidence(d_feats, s_feats)
+	dp, sp = _price_vector(d_feats), _price_vector(s_feats)
+	n_sales = len(s_feats)
+	step = max(1, _BUILD_BLOCK_CELLS // max(1, n_sales))
+	parts: List[Tuple[np.ndarray, ...]] = []
+	for d0 in range(0, len(d_feats), step):
+		d1 = min(len(d_feats), d0 + step)
+		title = np.zeros((d1 - d0, n_sales), dtype=np.float64)
+		for di in range(d0, d1):
+			cand = cands[di]
+			if cand:
+				td = d_titles[di]
+				title[di - d0, cand] = [_title_similarity_encoded(td, s_titles[si], memo) for si in cand]
+		char = incidence.block(d0, d1)
+		# np.nonzero — построчно, поэтому пары идут по возрастанию (спрос, предложение)
+		r, c = np.nonzero((title != 0) | (char != 0))
+		price = _price_matrix(dp[d0:d1], sp, p)[r, c]
+		rows = r + d0
+		loc = (dl[rows] == sl[c]) & (dl[rows] >= 0)
+		parts.append((rows.astype(np.int32), c.astype(np.int32), title[r, c], char[r, c], loc, price))
+	def _join(i: int, dtype) -> np.ndarray:
+		return np.concatenate([part[i] for part in parts]) if parts else np.zeros(0, dtype=dtype)
+	return ComponentMatrix(
+		d_ids=tuple(d.id for d in demands),
+		s_ids=tuple(s.id for s in sales),
+		rows=_join(0, np.int32),
+		cols=_join(1, np.int32),
+		title=_join(2, np.float64),
+		char=_join(3, np.float64),
+		loc=_join(4, bool),
+		price=_join(5, np.float64),
+	)
+
+
+def reweight(
+	m: ComponentMatrix,
+	p: MatchParams,
+	*,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+) -> List[Tuple[int, int, float]]:
+	"""Пары (строка, столбец, score) со score >= p.threshold по убыванию score — как find_matches
+	(при равном score — в порядке спрос, предложение; с теми же ограничениями top-K / max_pairs).
+	Только при covers_threshold(p): остальные пары в матрице не хранятся.
+	"""
+	# тот же порядок операций, что в matching._score_features
+	score = p.w_title * m.title + p.w_char * m.char + p.w_loc * m.loc + p.w_price * m.price
+	keep = np.flatnonzero(score >= p.threshold)
+	rows, cols, vals = m.rows[keep], m.cols[keep], score[keep]
+	order = np.argsort(-vals, kind="stable")
+	if top_k_per_demand and top_k_per_demand > 0 and len(order):
+		# ранг пары среди пар своего спроса (порядок по score сохраняется устойчивой сортировкой)
+		r = rows[order]
+		by_demand = np.argsort(r, kind="stable")
+		grouped = r[by_demand]
+		starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+		rank = np.arange(len(grouped)) - np.repeat(starts, np.diff(np.r_[starts, len(grouped)]))
+		keep = np.empty(len(order), dtype=bool)
+		keep[by_demand] = rank < top_k_per_demand
+		order = order[keep]
+	if max_pairs and max_pairs > 0:
+		order = order[:max_pairs]
+	return [(int(rows[i]), int(cols[i]), float(vals[i])) for i in order]
+
+
+class _ComponentCache:
+	"""LRU матриц компонент по (версия данных, параметры сходства)."""
+
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = max(1, maxsize)
+		self.hits = 0
+		self.misses = 0
+		self._data: "OrderedDict[Hashable, ComponentMatrix]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: Hashable) -> ComponentMatrix | None:
+		with self._lock:
+			m = self._data.get(key)
+			if m is None:
+				self.misses += 1
+				return None
+			self._data.move_to_end(key)
+			self.hits += 1
+			return m
+
+	def put(self, key: Hashable, m: ComponentMatrix) -> None:
+		with self._lock:
+			self._data[key] = m
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"size": len(self._data),
+				"bytes": sum(m.nbytes for m in self._data.values()),
+			}
+
+
+_cache: _ComponentCache | None = None
+
+
+def get_component_cache() -> _ComponentCache:
+	global _cache
+	if _cache is None:
+		_cache = _ComponentCache(get_settings().match_component_cache_size)
+	return _cache
+
+
+def find_matches_reweighted(
+	demands: List[Listing],
+	sales: List[Listing],
+	*,
+	data_version: Hashable,
+	threshold: float = 0.45,
+	w_title: float = 0.6,
+	w_char: float = 0.2,
+	w_loc: float = 0.15,
+	w_price: float = 0.05,
+	price_tolerance_abs: Optional[Decimal] = None,
+	price_tolerance_pct: Optional[float] = None,
+	fuzzy_token_threshold: float = 0.6,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+	workers: int | None = None,
+) -> List[MatchPair]:
+	"""То же, что find_matches, но через кэш компонент: при той же версии данных (см.
+	listings_data_version) смена весов или порога — только линейная комбинация и фильтр.
+	Для слишком больших таблиц (MATCH_COMPONENT_MAX_CELLS) и порога не выше w_loc + w_price
+	(см. covers_threshold) — обычный find_matches (с workers).
+	"""
+	params = MatchParams(
+		threshold=threshold,
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	if not demands or not sales or len(demands) * len(sales) > get_settings().match_component_max_cells or not covers_threshold(params):
+		return find_matches(
+			demands,
+			sales,
+			threshold=threshold,
+			w_title=w_title,
+			w_char=w_char,
+			w_loc=w_loc,
+			w_price=w_price,
+			price_tolerance_abs=price_tolerance_abs,
+			price_tolerance_pct=price_tolerance_pct,
+			fuzzy_token_threshold=fuzzy_token_threshold,
+			top_k_per_demand=top_k_per_demand,
+			max_pairs=max_pairs,
+			workers=workers,
+		)
+	d_ids = tuple(d.id for d in demands)
+	s_ids = tuple(s.id for s in sales)
+	cache = get_component_cache()
+	key = (data_version, fuzzy_token_threshold, price_tolerance_abs, price_tolerance_pct)
+	m = cache.get(key)
+	if m is None or m.d_ids != d_ids or m.s_ids != s_ids:
+		m = build_components(
+			demands,
+			sales,
+			fuzzy_token_threshold=fuzzy_token_threshold,
+			price_tolerance_abs=price_tolerance_abs,
+			price_tolerance_pct=price_tolerance_pct,
+		)
+		cache.put(key, m)
+		logger.info("match_components_built", demands=len(demands), sales=len(sales), bytes=m.nbytes)
+	scored = reweight(m, params, top_k_per_demand=top_k_per_demand, max_pairs=max_pairs)
+	return [MatchPair(Demand=demands[di], Sale=sales[si], score=score) for di, si, score in scored]
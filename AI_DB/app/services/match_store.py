@@ -0,0 +1,211 @@
+from __future__ import annotations
+from dataclasses import asdict
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import structlog
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.listings import Listing
+from app.models.matches import Match
+from app.repositories.matches import get_match_store_params, iter_matches_rows, list_matches, replace_all_matches, replace_listing_matches, replace_listings_matches, set_match_store_params
+from app.services.matching import MatchPair, MatchParams, find_matches, group_listings
+
+
+logger = structlog.get_logger(__name__)
+
+
+def target_params() -> MatchParams:
+	"""Параметры, с которыми должна быть посчитана таблица matches: веса по умолчанию, порог MATCH_STORE_MIN_SCORE."""
+	return MatchParams(threshold=get_settings().match_store_min_score)
+
+
+def _params_json(p: MatchParams) -> dict:
+	data = asdict(p)
+	if p.price_tolerance_abs is not None:
+		data["price_tolerance_abs"] = str(p.price_tolerance_abs)
+	return data
+
+
+def stored_params(session: Session) -> MatchParams | None:
+	"""Параметры, с которыми таблица matches посчитана на самом деле (None — не посчитана или устарела)."""
+	data = get_match_store_params(session)
+	if data is None:
+		return None
+	data = dict(data)
+	if data.get("price_tolerance_abs") is not None:
+		data["price_tolerance_abs"] = Decimal(data["price_tolerance_abs"])
+	try:
+		return MatchParams(**data)
+	except TypeError:
+		# записано другой версией MatchParams — таблицу нужно пересчитать
+		return None
+
+
+def mark_matches_stale(session: Session) -> None:
+	"""Таблица больше не соответствует записям (признаки менялись в обход приложения):
+	до пересчёта (ensure_matches) запросы её не используют."""
+	set_match_store_params(session, None)
+
+
+def covers(
+	session: Session,
+	*,
+	threshold: float,
+	w_title: float,
+	w_char: float,
+	w_loc: float,
+	w_price: float,
+	price_tolerance_abs: Optional[Decimal],
+	price_tolerance_pct: Optional[float],
+	fuzzy_token_threshold: float,
+) -> bool:
+	"""Можно ли ответить на запрос из таблицы: она посчитана с теми же весами и допусками
+	и порогом не выше запрошенного (сравнение с сохранёнными параметрами, а не с настройками)."""
+	p = stored_params(session)
+	if p is None:
+		return False
+	return (
+		threshold >= p.threshold
+		and (w_title, w_char, w_loc, w_price) == (p.w_title, p.w_char, p.w_loc, p.w_price)
+		and price_tolerance_abs == p.price_tolerance_abs
+		and price_tolerance_pct == p.price_tolerance_pct
+		and fuzzy_token_threshold == p.fuzzy_token_threshold
+	)
+
+
+def _find(session: Session, demands: List[Listing], sales: List[Listing], p: MatchParams) -> List[MatchPair]:
+	kwargs = dict(
+		threshold=p.threshold,
+		w_title=p.w_title,
+		w_char=p.w_char,
+		w_loc=p.w_loc,
+		w_price=p.w_price,
+		price_tolerance_abs=p.price_tolerance_abs,
+		price_tolerance_pct=p.price_tolerance_pct,
+		fuzzy_token_threshold=p.fuzzy_token_threshold,
+	)
+	if get_settings().match_candidates == "pg_trgm":
+		from app.services.matching_pg import find_matches_pg
+		return find_matches_pg(session, demands, sales, **kwargs)
+	return find_matches(demands, sales, **kwargs)
+
+
+def _update_params(session: Session) -> MatchParams:
+	# пары записи считаются с теми же параметрами, что и остальная таблица
+	return stored_params(session) or target_params()
+
+
+def update_listing_matches(session: Session, listing: Listing) -> List[Match]:
+	"""Пересчитывает пары одной записи против записей противоположного типа и заменяет её строки
+	в matches. Возвращает новые пары. Признаки записи должны быть уже обновлены.
+	"""
+	ltype = (listing.type or "").lower()
+	params = _update_params(session)
+	if ltype == "demand":
+		sales = session.query(Listing).filter(Listing.type == "sale").order_by(Listing.id.asc()).all()
+		pairs = _find(session, [listing], sales, params)
+	elif ltype == "sale":
+		demands = session.query(Listing).filter(Listing.type == "demand").order_by(Listing.id.asc()).all()
+		pairs = _find(session, demands, [listing], params)
+	else:
+		pairs = []
+	created = replace_listing_matches(session, listing.id, [(p.Demand.id, p.Sale.id, p.score) for p in pairs])
+	logger.info("listing_matches_updated", listing_id=listing.id, pairs=len(pairs), created=len(created))
+	return created
+
+
+def update_matches_for_listings(session: Session, listings: Iterable[Listing]) -> List[Match]:
+	"""Пересчёт пар группы записей (импорт) одним проходом: новые спросы против всех предложений,
+	новые предложения против остальных спросов. Признаки записей должны быть уже обновлены.
+	"""
+	listings = list(listings)
+	if not listings:
+		return []
+	ids = {l.id for l in listings}
+	new_demands, new_sales = group_listings(listings)
+	demands, sales = group_listings(session.query(Listing).order_by(Listing.id.asc()).all())
+	params = _update_params(session)
+	pairs: List[MatchPair] = []
+	if new_demands:
+		pairs.extend(_find(session, new_demands, sales, params))
+	if new_sales:
+		# пары «новый спрос — новое предложение» уже найдены выше
+		old_demands = [d for d in demands if d.id not in ids]
+		if old_demands:
+			pairs.extend(_find(session, old_demands, new_sales, params))
+	created = replace_listings_matches(session, ids, [(p.Demand.id, p.Sale.id, p.score) for p in pairs])
+	logger.info("listings_matches_updated", listings=len(ids), pairs=len(pairs), created=len(created))
+	return created
+
+
+def rebuild_matches(session: Session) -> int:
+	"""Полный пересчёт таблицы с target_params() (без уведомлений в админ-чат). Возвращает число пар.
+	Параметры сохраняются, только если записи не менялись за время расчёта (пересчёт идёт в фоне,
+	пары изменённых записей могли устареть) — иначе таблица остаётся устаревшей до следующего пересчёта.
+	"""
+	from app.repositories.listings import listings_data_version
+	params = target_params()
+	version = listings_data_version(session)
+	demands, sales = group_listings(session.query(Listing).order_by(Listing.id.asc()).all())
+	pairs = _find(session, demands, sales, params)
+	count = replace_all_matches(session, [(p.Demand.id, p.Sale.id, p.score) for p in pairs], notified=True)
+	current = listings_data_version(session) == version
+	set_match_store_params(session, _params_json(params) if current else None)
+	session.commit()
+	if current:
+		logger.info("matches_rebuilt", pairs=count, threshold=params.threshold)
+	else:
+		logger.warning("matches_rebuilt_stale", pairs=count, reason="listings_changed_during_rebuild")
+	return count
+
+
+def ensure_matches(session: Session, force: bool = False) -> int:
+	"""Пересчитывает таблицу, если она не посчитана, устарела (mark_matches_stale) или посчитана
+	с параметрами, отличными от target_params() (или force). Возвращает число пар после пересчёта либо -1.
+	"""
+	if not force and stored_params(session) == target_params():
+		return -1
+	return rebuild_matches(session)
+
+
+def read_stored_matches(
+	session: Session,
+	threshold: float,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+) -> List[MatchPair]:
+	"""Пары из таблицы в том же порядке и с теми же ограничениями, что у find_matches."""
+	if top_k_per_demand:
+		rows: Iterable[Match] = iter_matches_rows(session, threshold)
+	else:
+		rows = list_matches(session, threshold, limit=max_pairs)
+	return list(_stored_pairs(rows, top_k_per_demand, max_pairs))
+
+
+def iter_stored_matches(session: Session, threshold: float, top_k_per_demand: int | None = None) -> Iterator[MatchPair]:
+	"""Как read_stored_matches (без max_pairs), но строки читаются из БД порциями."""
+	return _stored_pairs(iter_matches_rows(session, threshold), top_k_per_demand, None)
+
+
+def _stored_pairs(rows: Iterable[Match], top_k_per_demand: int | None, max_pairs: int | None) -> Iterator[MatchPair]:
+	per_demand: Dict[int, int] = {}
+	count = 0
+	for row in rows:
+		if top_k_per_demand:
+			n = per_demand.get(row.demand_id, 0)
+			if n >= top_k_per_demand:
+				continue
+			per_demand[row.demand_id] = n + 1
+		yield MatchPair(Demand=row.demand, Sale=row.sale, score=row.score)
+		count += 1
+		if max_pairs and count >= max_pairs:
+			return
+
+
+def format_match_notice(rows: List[Match]) -> str:
+	lines = [f"🆕 Новые совпадения: {len(rows)}"]
+	for m in rows:
+		lines.append(f"• {m.score:.3f} — спрос #{m.demand_id} «{m.demand.title}» ↔ предложение #{m.sale_id} «{m.sale.title}»")
+	return "\n".join(lines)
@@ -1,10 +1,23 @@
 from __future__ import annotations
+import heapq
+import math
 import re
-from dataclasses import dataclass
+import sys
+import time
+from dataclasses import asdict, dataclass
 from decimal import Decimal
-from typing import List, Dict, Any, Tuple, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, FrozenSet, Iterator, Tuple, Optional
 
+import structlog
+
+from app.config import get_settings
 from app.models.listings import Listing
+from app.services.edit_distance import BoundedDistance, get_backend
+from app.services.lemma_cache import get_lemma_cache
+
+
+logger = structlog.get_logger(__name__)
 
 
 @dataclass
@@ -14,6 +27,84 @@ class MatchPair:
 	score: float
 
 
+@dataclass(frozen=True)
+class MatchFeatures:
+	"""Нормализованные признаки записи, из которых считается score_pair."""
+	lemmas: Tuple[str, ...]
+	location_key: str | None
+	# ключи как есть, значения — str(v).lower()
+	characteristics: Dict[str, str] | None
+	price: Decimal | None
+
+
+@dataclass(frozen=True)
+class MatchParams:
+	"""Параметры расчёта совпадений (порог, веса, допуски)."""
+	threshold: float = 0.45
+	w_title: float = 0.6
+	w_char: float = 0.2
+	w_loc: float = 0.15
+	w_price: float = 0.05
+	price_tolerance_abs: Optional[Decimal] = None
+	price_tolerance_pct: Optional[float] = None
+	fuzzy_token_threshold: float = 0.6
+
+
+@dataclass
+class MatchStats:
+	"""Статистика одного запуска find_matches (заполняется, если передан stats=)."""
+	demands: int = 0
+	sales: int = 0
+	candidate_pairs: int = 0
+	# пар со score >= threshold; matches — сколько из них осталось после top-K / max_pairs
+	above_threshold: int = 0
+	matches: int = 0
+	workers: int = 1
+	elapsed_ms: float = 0.0
+	token_memo_hits: int = 0
+	token_memo_misses: int = 0
+	token_memo_size: int = 0
+	# словарь лемм и закодированные наименования (байт, приблизительно)
+	vocab_size: int = 0
+	vocab_bytes: int = 0
+	title_bytes: int = 0
+	# пары, отсечённые оценкой сверху без нечёткого сравнения наименований (см. PruneCounts)
+	pruned_bound: int = 0
+	pruned_jaccard: int = 0
+	fuzzy_skipped: int = 0
+
+	@property
+	def token_memo_hit_rate(self) -> float:
+		total = self.token_memo_hits + self.token_memo_misses
+		return round(self.token_memo_hits / total, 4) if total else 0.0
+
+	def as_dict(self) -> Dict[str, Any]:
+		data = asdict(self)
+		data["token_memo_hit_rate"] = self.token_memo_hit_rate
+		return data
+
+
+@dataclass
+class PruneCounts:
+	"""Счётчики отсечения пар до нечёткого сравнения наименований (самой дорогой части score)."""
+	# дешёвые компоненты + w_title·1 ниже порога — наименование не сравнивается вовсе
+	bound: int = 0
+	# то же с оценкой по Жаккару: title <= 0.5·J + 0.5
+	jaccard: int = 0
+	# J = 1 (одинаковые множества лемм): нечёткое сходство равно 1 без расчёта
+	exact: int = 0
+
+
+# Запас на погрешность float: оценка сверху и score складываются в разном порядке
+_BOUND_EPS = 1e-9
+
+
+# Движки расчёта: "python" — попарно, "numpy" — блоками массивов (см. matching_numpy),
+# "tfidf" — сходство наименований по TF-IDF символьных n-грамм (см. matching_tfidf)
+ENGINES = ("python", "numpy", "tfidf")
+CANDIDATE_MODES = ("exhaustive", "index")
+
+
 _STOP_WORDS = {
 	"и", "или", "для", "на", "в", "из", "с", "к", "по", "от", "до",
 	"шт", "штук", "штуки", "б/у", "бу", "новый", "новые", "срочно",
@@ -32,32 +123,35 @@ def _get_morph():
 	return _morph
 
 
+def warm_up() -> None:
+	"""Загружает морфологический анализатор и кэш лемм заранее, а не на первом запросе."""
+	_get_morph()
+	get_lemma_cache()
+
+
+def _lemmatize(m, token: str) -> str:
+	cache = get_lemma_cache()
+	lemma = cache.get(token)
+	if lemma is None:
+		try:
+			lemma = m.parse(token)[0].normal_form
+		except Exception:
+			lemma = token
+		cache.put(token, lemma)
+	return lemma
+
+
 def _tokenize(text: str) -> List[str]:
 	lt = (text or "").lower()
 	tokens = re.findall(r"[\w\dа-яё]+", lt, flags=re.IGNORECASE)
-	# лемматизация
+	# лемматизация (через кэш токен → лемма)
 	m = _get_morph()
 	if m:
-		lemmas = []
-		for t in tokens:
-			if t in _STOP_WORDS:
-				continue
-			try:
-				lemmas.append(m.parse(t)[0].normal_form)
-			except Exception:
-				lemmas.append(t)
-		return lemmas
+		return [_lemmatize(m, t) for t in tokens if t not in _STOP_WORDS]
 	# без морфологии — простая фильтрация стоп-слов
 	return [t for t in tokens if t not in _STOP_WORDS]
 
 
-def _set_jaccard(a: List[str], b: List[str]) -> float:
-	sa, sb = set(a), set(b)
-	if not sa and not sb:
-		return 0.0
-	return len(sa & sb) / max(1, len(sa | sb))
-
-
 def _levenshtein(a: str, b: str) -> int:
 	if a == b:
 		return 0
@@ -87,27 +181,215 @@ def _norm_sim(a: str, b: str) -> float:
 	return 1.0 - (_levenshtein(a, b) / maxlen)
 
 
+@lru_cache(maxsize=4096)
+def _max_distance(maxlen: int, min_sim: float) -> int:
+	"""Наибольшее d, при котором 1 - d/maxlen ≥ min_sim (в той же арифметике, что _norm_sim); -1 — таких нет."""
+	d = min(maxlen, max(0, int((1.0 - min_sim) * maxlen)))
+	while d < maxlen and 1.0 - ((d + 1) / maxlen) >= min_sim:
+		d += 1
+	while d >= 0 and 1.0 - (d / maxlen) < min_sim:
+		d -= 1
+	return d
+
 
-def _fuzzy_tokens_similarity(a: List[str], b: List[str], *, min_token_similarity: float = 0.6) -> float:
+def _bounded_norm_sim(a: str, b: str, min_sim: float, distance: BoundedDistance) -> float:
+	"""То же, что _norm_sim, если результат ≥ min_sim; иначе 0.0.
+	Расстояние считается с отсечением, пары с большой разницей длин не считаются вовсе.
+	"""
+	maxlen = max(len(a), len(b)) or 1
+	k = _max_distance(maxlen, min_sim)
+	if k < 0 or abs(len(a) - len(b)) > k:
+		return 0.0
+	if a == b:
+		return 1.0
+	d = distance(a, b, k)
+	if d > k:
+		return 0.0
+	return 1.0 - (d / maxlen)
+
+
+@dataclass(frozen=True)
+class EncodedTitle:
+	"""Наименование в словаре запуска: отсортированные id различных лемм и они же множеством
+	(объём и пересечение зависят от длины наименования, а не от размера словаря)."""
+	ids: Tuple[int, ...]
+	id_set: FrozenSet[int]
+
+
+class TitleVocabulary:
+	"""Словарь лемм одного расчёта: лемма → целый id (в порядке первого появления)."""
+
+	def __init__(self, tokens: List[str] | None = None) -> None:
+		self.tokens: List[str] = []
+		self._ids: Dict[str, int] = {}
+		for t in tokens or ():
+			self.intern(t)
+
+	def __len__(self) -> int:
+		return len(self.tokens)
+
+	def intern(self, token: str) -> int:
+		i = self._ids.get(token)
+		if i is None:
+			i = len(self.tokens)
+			self._ids[token] = i
+			self.tokens.append(token)
+		return i
+
+	def encode(self, lemmas: List[str] | Tuple[str, ...]) -> EncodedTitle:
+		id_set = frozenset(self.intern(t) for t in lemmas)
+		return EncodedTitle(ids=tuple(sorted(id_set)), id_set=id_set)
+
+	def memory_bytes(self) -> int:
+		"""Приблизительный объём словаря в памяти (словарь, список и сами строки)."""
+		return sys.getsizeof(self._ids) + sys.getsizeof(self.tokens) + sum(sys.getsizeof(t) for t in self.tokens)
+
+
+def _titles_memory_bytes(titles: List[EncodedTitle]) -> int:
+	return sum(sys.getsizeof(t.id_set) + sys.getsizeof(t.ids) for t in titles)
+
+
+class TokenSimilarityMemo:
+	"""Ограниченный кэш сходства пар токенов на время одного расчёта.
+	Токены — id словаря vocab. Порог фиксирован: хранится _bounded_norm_sim(a, b, threshold),
+	т.е. точное сходство или 0.0.
+	"""
+
+	def __init__(self, threshold: float, maxsize: int | None = None, vocab: TitleVocabulary | None = None) -> None:
+		self.threshold = threshold
+		self.maxsize = max(1, get_settings().match_token_memo_size if maxsize is None else maxsize)
+		self.vocab = vocab if vocab is not None else TitleVocabulary()
+		self.hits = 0
+		self.misses = 0
+		self._data: Dict[int, float] = {}
+		self._distance = get_backend()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def similarity(self, i: int, j: int) -> float:
+		# сходство симметрично — ключ по упорядоченной паре id
+		key = (i << 32) | j if i <= j else (j << 32) | i
+		sim = self._data.get(key)
+		if sim is not None:
+			self.hits += 1
+			return sim
+		self.misses += 1
+		sim = _bounded_norm_sim(self.vocab.tokens[i], self.vocab.tokens[j], self.threshold, self._distance)
+		if len(self._data) >= self.maxsize:
+			# вытесняем самую старую запись
+			del self._data[next(iter(self._data))]
+		self._data[key] = sim
+		return sim
+
+	def token_similarity(self, a: str, b: str) -> float:
+		return self.similarity(self.vocab.intern(a), self.vocab.intern(b))
+
+
+class SalesSide:
+	"""Сторона предложений, подготовленная один раз на серию find_matches по блокам спросов
+	(см. iter_matches): признаки, наименования в словаре запуска и кэш сходства токенов.
+	Для пула процессов она же передаётся воркерам один раз (shipped, см. matching_parallel);
+	close() удаляет эту копию.
+	"""
+
+	def __init__(self, sales: List[Listing], fuzzy_token_threshold: float = 0.6) -> None:
+		self.sales = sales
+		self.memo = TokenSimilarityMemo(fuzzy_token_threshold)
+		self.feats = [features_of(s) for s in sales]
+		self.titles = [self.memo.vocab.encode(f.lemmas) for f in self.feats]
+		self.shipped = None
+
+	def close(self) -> None:
+		if self.shipped is not None:
+			self.shipped.close()
+			self.shipped = None
+
+
+def _ids_jaccard(a: EncodedTitle, b: EncodedTitle) -> float:
+	"""Jaccard по множествам лемм: пересечение множеств целых id, без хеширования строк."""
+	if not a.ids and not b.ids:
+		return 0.0
+	inter = len(a.id_set & b.id_set)
+	return inter / max(1, len(a.ids) + len(b.ids) - inter)
+
+
+def _fuzzy_ids_similarity(a: EncodedTitle, b: EncodedTitle, memo: TokenSimilarityMemo) -> float:
 	"""Жадное соответствие токенов по максимальному сходству, симметричное среднее.
-	min_token_similarity — минимальная похожесть (0..1), ниже которой совпадение токенов не учитывается.
+	Совпадения ниже memo.threshold не учитываются.
 	"""
-	if not a and not b:
+	if not a.ids and not b.ids:
 		return 0.0
-	def best_avr(x: List[str], y: List[str]) -> float:
-		if not x:
+	min_token_similarity = memo.threshold
+	def best_avr(x: EncodedTitle, y: EncodedTitle) -> float:
+		if not x.ids:
 			return 0.0
 		vals: List[float] = []
-		for tx in set(x):
-			best = 0.0
-			for ty in set(y):
-				best = max(best, _norm_sim(tx, ty))
+		for ix in x.ids:
+			if ix in y.id_set:
+				# тот же токен есть и во втором наименовании: лучше 1.0 не бывает
+				best = 1.0
+			else:
+				best = 0.0
+				for iy in y.ids:
+					sim = memo.similarity(ix, iy)
+					if sim > best:
+						best = sim
 			# порог: отбрасываем слабые соответствия
 			vals.append(best if best >= min_token_similarity else 0.0)
-		return sum(vals) / max(1, len(vals))
+		# fsum: результат не зависит от порядка слагаемых
+		return math.fsum(vals) / max(1, len(vals))
 	return 0.5 * best_avr(a, b) + 0.5 * best_avr(b, a)
 
 
+def _tokens_close(a: str, b: str, min_token_similarity: float, memo: TokenSimilarityMemo | None = None) -> bool:
+	"""Может ли пара токенов дать ненулевой вклад в нечёткое сходство наименований."""
+	if a == b:
+		return True
+	if memo is not None and memo.threshold == min_token_similarity:
+		sim = memo.token_similarity(a, b)
+	else:
+		sim = _bounded_norm_sim(a, b, min_token_similarity, get_backend())
+	return sim > 0 and sim >= min_token_similarity
+
+
+def _build_title_index(tokens_by_listing: List[List[str]]) -> Dict[str, List[int]]:
+	"""Инвертированный индекс: лемма → позиции записей, в наименовании которых она встречается."""
+	index: Dict[str, List[int]] = {}
+	for pos, toks in enumerate(tokens_by_listing):
+		for t in set(toks):
+			index.setdefault(t, []).append(pos)
+	return index
+
+
+def _title_candidates(
+	demand_tokens: List[List[str]],
+	sale_tokens: List[List[str]],
+	*,
+	fuzzy_token_threshold: float,
+	memo: TokenSimilarityMemo | None = None,
+) -> List[List[int]]:
+	"""Для каждого спроса — отсортированные позиции предложений с общим или нечётко близким токеном.
+	Для остальных пар сходство наименований заведомо равно 0.
+	"""
+	from app.services.trigram_index import TrigramIndex
+	index = _build_title_index(sale_tokens)
+	# близкие токены словаря предложений считаем один раз на каждый токен спроса;
+	# расстояние Левенштейна — только для токенов, отобранных индексом триграмм
+	trigrams = TrigramIndex(index)
+	close: Dict[str, List[str]] = {}
+	result: List[List[int]] = []
+	for toks in demand_tokens:
+		cand: set[int] = set()
+		for t in set(toks):
+			if t not in close:
+				close[t] = [v for v in trigrams.candidates(t, fuzzy_token_threshold) if _tokens_close(t, v, fuzzy_token_threshold, memo)]
+			for v in close[t]:
+				cand.update(index[v])
+		result.append(sorted(cand))
+	return result
+
+
 def _price_similarity(d_price: Decimal | None, s_price: Decimal | None, *, price_tolerance_abs: Optional[Decimal] = None, price_tolerance_pct: Optional[float] = None) -> float:
 	if d_price is None or s_price is None or d_price <= 0 or s_price <= 0:
 		return 0.0
@@ -128,7 +410,8 @@ def _price_similarity(d_price: Decimal | None, s_price: Decimal | None, *, price
 	return ratio
 
 
-def _char_similarity(d_char: dict | None, s_char: dict | None) -> float:
+def _char_similarity(d_char: Dict[str, str] | None, s_char: Dict[str, str] | None) -> float:
+	"""Сходство нормализованных характеристик (см. _normalize_characteristics)."""
 	if not d_char or not s_char:
 		return 0.0
 	d_keys = set(d_char.keys())
@@ -139,16 +422,99 @@ def _char_similarity(d_char: dict | None, s_char: dict | None) -> float:
 	val_matches = 0
 	common = d_keys & s_keys
 	for k in common:
-		if str(d_char.get(k)).lower() == str(s_char.get(k)).lower():
+		if d_char[k] == s_char[k]:
 			val_matches += 1
 	val_sim = val_matches / max(1, len(common)) if common else 0.0
 	return 0.5 * key_sim + 0.5 * val_sim
 
 
-def _location_similarity(d_loc: str | None, s_loc: str | None) -> float:
-	if not d_loc or not s_loc:
+def _location_similarity(d_key: str | None, s_key: str | None) -> float:
+	"""Сходство нормализованных городов (см. _location_key)."""
+	if d_key is None or s_key is None:
 		return 0.0
-	return 1.0 if d_loc.strip().lower() == s_loc.strip().lower() else 0.0
+	return 1.0 if d_key == s_key else 0.0
+
+
+def _location_key(location: str | None) -> str | None:
+	if not location:
+		return None
+	return location.strip().lower()
+
+
+def _normalize_characteristics(chars: Any) -> Dict[str, str] | None:
+	if not isinstance(chars, dict) or not chars:
+		return None
+	return {k: str(v).lower() for k, v in chars.items()}
+
+
+def compute_features(listing: Listing) -> MatchFeatures:
+	"""Считает признаки записи по её текущим полям."""
+	return MatchFeatures(
+		lemmas=tuple(_tokenize(listing.title or "")),
+		location_key=_location_key(listing.location),
+		characteristics=_normalize_characteristics(listing.characteristics),
+		price=listing.price,
+	)
+
+
+def features_of(listing: Listing) -> MatchFeatures:
+	"""Признаки записи: из listing_features, если они актуальны, иначе считаются на лету."""
+	# без ленивой загрузки: запись обычно уже отсоединена от сессии
+	row = listing.__dict__.get("features")
+	if row is not None and row.listing_updated_at is not None and row.listing_updated_at == listing.updated_at:
+		return MatchFeatures(
+			lemmas=tuple(row.title_lemmas or ()),
+			location_key=row.location_key,
+			characteristics=row.characteristics_norm,
+			price=row.price,
+		)
+	return compute_features(listing)
+
+
+def _title_similarity_encoded(a: EncodedTitle, b: EncodedTitle, memo: TokenSimilarityMemo) -> float:
+	# Комбинируем точечное пересечение и нечёткое сходство
+	jacc = _ids_jaccard(a, b)
+	fuzzy = _fuzzy_ids_similarity(a, b, memo)
+	return 0.5 * jacc + 0.5 * fuzzy
+
+
+def _title_similarity_lemmas(a: List[str] | Tuple[str, ...], b: List[str] | Tuple[str, ...], fuzzy_token_threshold: float, memo: TokenSimilarityMemo | None = None) -> float:
+	if memo is None or memo.threshold != fuzzy_token_threshold:
+		memo = TokenSimilarityMemo(fuzzy_token_threshold)
+	return _title_similarity_encoded(memo.vocab.encode(a), memo.vocab.encode(b), memo)
+
+
+def _pruned_title_similarity(td: EncodedTitle, ts: EncodedTitle, p: MatchParams, cheap: float, memo: TokenSimilarityMemo, prune: PruneCounts) -> float | None:
+	"""Сходство наименований (то же, что _title_similarity_encoded) или None, если пара не
+	наберёт p.threshold при любом его значении. cheap — сумма взвешенных прочих компонентов.
+	"""
+	jacc = None
+	if p.w_title > 0:
+		if cheap + p.w_title < p.threshold - _BOUND_EPS:
+			prune.bound += 1
+			return None
+		# нечёткое сходство не больше 1, значит title <= 0.5·J + 0.5
+		jacc = _ids_jaccard(td, ts)
+		if cheap + p.w_title * (0.5 * jacc + 0.5) < p.threshold - _BOUND_EPS:
+			prune.jaccard += 1
+			return None
+	if jacc is None:
+		jacc = _ids_jaccard(td, ts)
+	if jacc == 1.0 and memo.threshold <= 1.0:
+		# все леммы общие: у каждого токена лучшее соответствие 1.0
+		prune.exact += 1
+		fuzzy = 1.0
+	else:
+		fuzzy = _fuzzy_ids_similarity(td, ts, memo)
+	return 0.5 * jacc + 0.5 * fuzzy
+
+
+def _score_features(fd: MatchFeatures, fs: MatchFeatures, td: EncodedTitle, ts: EncodedTitle, p: MatchParams, memo: TokenSimilarityMemo) -> float:
+	title_sim = _title_similarity_encoded(td, ts, memo)
+	char_sim = _char_similarity(fd.characteristics, fs.characteristics)
+	loc_sim = _location_similarity(fd.location_key, fs.location_key)
+	price_sim = _price_similarity(fd.price, fs.price, price_tolerance_abs=p.price_tolerance_abs, price_tolerance_pct=p.price_tolerance_pct)
+	return p.w_title * title_sim + p.w_char * char_sim + p.w_loc * loc_sim + p.w_price * price_sim
 
 
 def score_pair(
@@ -164,16 +530,132 @@ def score_pair(
 	# Порог похожести для нечёткого сравнения токенов наименования
 	fuzzy_token_threshold: float = 0.6,
 ) -> float:
-	# Комбинируем точечное пересечение и нечёткое сходство
-	toks_d = _tokenize(demand.title or "")
-	toks_s = _tokenize(sale.title or "")
-	jacc = _set_jaccard(toks_d, toks_s)
-	fuzzy = _fuzzy_tokens_similarity(toks_d, toks_s, min_token_similarity=fuzzy_token_threshold)
-	title_sim = 0.5 * jacc + 0.5 * fuzzy
-	char_sim = _char_similarity(demand.characteristics, sale.characteristics)
-	loc_sim = _location_similarity(demand.location, sale.location)
-	price_sim = _price_similarity(demand.price, sale.price, price_tolerance_abs=price_tolerance_abs, price_tolerance_pct=price_tolerance_pct)
-	return w_title * title_sim + w_char * char_sim + w_loc * loc_sim + w_price * price_sim
+	params = MatchParams(
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	fd, fs = features_of(demand), features_of(sale)
+	memo = TokenSimilarityMemo(fuzzy_token_threshold)
+	return _score_features(fd, fs, memo.vocab.encode(fd.lemmas), memo.vocab.encode(fs.lemmas), params, memo)
+
+
+def _select_candidates(
+	d_feats: List[MatchFeatures],
+	s_feats: List[MatchFeatures],
+	p: MatchParams,
+	mode: str,
+	memo: TokenSimilarityMemo | None = None,
+) -> List[List[int]]:
+	"""Позиции предложений, которые нужно оценить для каждого спроса."""
+	all_sales = list(range(len(s_feats)))
+	if mode == "index":
+		# Без общих токенов title_sim = 0: такая пара проходит порог только за счёт прочих компонентов
+		rest_max = max(p.w_char, 0.0) + max(p.w_loc, 0.0) + max(p.w_price, 0.0)
+		if rest_max < p.threshold:
+			return _title_candidates(
+				[list(f.lemmas) for f in d_feats],
+				[list(f.lemmas) for f in s_feats],
+				fuzzy_token_threshold=p.fuzzy_token_threshold,
+				memo=memo,
+			)
+	return [all_sales] * len(d_feats)
+
+
+class PairSelector:
+	"""Отбор лучших пар ограниченными кучами: не более top_k_per_demand на спрос
+	и не более max_pairs всего. Память — O(K·D) (или O(max_pairs)), без сортировки всех пар.
+	При равном score выигрывает пара, добавленная раньше (как при устойчивой сортировке).
+	"""
+
+	def __init__(self, top_k_per_demand: int | None = None, max_pairs: int | None = None) -> None:
+		self.top_k = top_k_per_demand if top_k_per_demand and top_k_per_demand > 0 else None
+		self.max_pairs = max_pairs if max_pairs and max_pairs > 0 else None
+		# сколько пар добавлено в отбор и сколько отброшено заранее (отбором в воркерах)
+		self.pushed = 0
+		self.dropped = 0
+		self._per_demand: Dict[int, List[Tuple[float, int, int]]] = {}
+		self._global: List[Tuple[float, int, int, int]] = []
+
+	@property
+	def active(self) -> bool:
+		return self.top_k is not None or self.max_pairs is not None
+
+	def push(self, di: int, si: int, score: float) -> None:
+		# в кучах (score, -seq): минимум — худшая пара, при равном score — добавленная позже
+		seq = -self.pushed
+		self.pushed += 1
+		if self.top_k is not None:
+			heap = self._per_demand.setdefault(di, [])
+			item = (score, seq, si)
+			if len(heap) < self.top_k:
+				heapq.heappush(heap, item)
+			elif item > heap[0]:
+				heapq.heapreplace(heap, item)
+			return
+		item = (score, seq, di, si)
+		if self.max_pairs is None or len(self._global) < self.max_pairs:
+			heapq.heappush(self._global, item)
+		elif item > self._global[0]:
+			heapq.heapreplace(self._global, item)
+
+	def _items(self) -> List[Tuple[float, int, int, int]]:
+		if self.top_k is None:
+			return self._global
+		return [(score, seq, di, si) for di, heap in self._per_demand.items() for score, seq, si in heap]
+
+	def result(self) -> List[Tuple[int, int, float]]:
+		"""Отобранные пары по убыванию score."""
+		items = self._items()
+		if self.top_k is not None and self.max_pairs is not None:
+			items = heapq.nlargest(self.max_pairs, items)
+		else:
+			items = sorted(items, reverse=True)
+		return [(di, si, score) for score, _, di, si in items]
+
+	def in_order(self) -> List[Tuple[int, int, float]]:
+		"""Отобранные пары в порядке добавления (для слияния частей, посчитанных отдельно)."""
+		return [(di, si, score) for score, _, di, si in sorted(self._items(), key=lambda t: -t[1])]
+
+
+def _score_candidates(
+	d_feats: List[MatchFeatures],
+	s_feats: List[MatchFeatures],
+	d_titles: List[EncodedTitle],
+	s_titles: List[EncodedTitle],
+	cands: List[List[int]],
+	p: MatchParams,
+	memo: TokenSimilarityMemo,
+	selector: PairSelector | None = None,
+	prune: PruneCounts | None = None,
+) -> List[Tuple[int, int, float]]:
+	"""Попарный расчёт. Наименования закодированы в словаре memo.vocab.
+	Сначала считаются дешёвые компоненты (характеристики, город, цена); наименования
+	сравниваются только у пар, которые ещё могут набрать порог (счётчики — в prune).
+	Возвращает (позиция спроса, позиция предложения, score) в порядке обхода;
+	если передан selector — пары уходят в него, а возвращается пустой список.
+	"""
+	prune = prune if prune is not None else PruneCounts()
+	scored: List[Tuple[int, int, float]] = []
+	emit = selector.push if selector is not None else lambda di, si, score: scored.append((di, si, score))
+	for di, (fd, td, cand) in enumerate(zip(d_feats, d_titles, cands)):
+		for si in cand:
+			fs = s_feats[si]
+			char_sim = _char_similarity(fd.characteristics, fs.characteristics)
+			loc_sim = _location_similarity(fd.location_key, fs.location_key)
+			price_sim = _price_similarity(fd.price, fs.price, price_tolerance_abs=p.price_tolerance_abs, price_tolerance_pct=p.price_tolerance_pct)
+			title_sim = _pruned_title_similarity(td, s_titles[si], p, p.w_char * char_sim + p.w_loc * loc_sim + p.w_price * price_sim, memo, prune)
+			if title_sim is None:
+				continue
+			# тот же порядок операций, что в _score_features
+			score = p.w_title * title_sim + p.w_char * char_sim + p.w_loc * loc_sim + p.w_price * price_sim
+			if score >= p.threshold:
+				emit(di, si, score)
+	return scored
 
 
 def find_matches(
@@ -188,36 +670,243 @@ def find_matches(
 	price_tolerance_abs: Optional[Decimal] = None,
 	price_tolerance_pct: Optional[float] = None,
 	fuzzy_token_threshold: float = 0.6,
+	candidates: str = "index",
+	engine: str = "python",
+	workers: int | None = None,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+	stats: MatchStats | None = None,
+	shortlist: Dict[int, List[int]] | None = None,
+	sales_side: SalesSide | None = None,
 ) -> List[MatchPair]:
-	pairs: List[MatchPair] = []
-	for d in demands:
-		for s in sales:
-			score = score_pair(
-				d,
-				s,
-				w_title=w_title,
-				w_char=w_char,
-				w_loc=w_loc,
-				w_price=w_price,
-				price_tolerance_abs=price_tolerance_abs,
-				price_tolerance_pct=price_tolerance_pct,
-				fuzzy_token_threshold=fuzzy_token_threshold,
-			)
-			if score >= threshold:
-				pairs.append(MatchPair(Demand=d, Sale=s, score=score))
-	pairs.sort(key=lambda p: p.score, reverse=True)
+	"""Поиск пар спрос/предложение со score >= threshold.
+	candidates — способ отбора пар для полного расчёта:
+	- "exhaustive": все пары D×S;
+	- "index": только пары с общим (или нечётко близким) токеном наименования по инвертированному индексу.
+	Результат обоих режимов совпадает.
+	engine — "python" (попарно) или "numpy" (цена, город и характеристики считаются массивами;
+	совпадает с "python" с точностью до float); "tfidf" — другая мера сходства наименований:
+	косинус TF-IDF символьных n-грамм одним разреженным произведением, для каждого спроса —
+	MATCH_TFIDF_TOP_K ближайших предложений (candidates, shortlist и workers не используются).
+	workers — число процессов для расчёта (None/1 — в текущем процессе, 0 — по числу ядер);
+	при малом числе пар (MATCH_PARALLEL_MIN_PAIRS) расчёт всё равно последовательный.
+	top_k_per_demand — не более K лучших предложений на каждый спрос; max_pairs — не более N пар
+	всего (None/0 — без ограничения). Отбор идёт кучами по ходу расчёта, без хранения всех пар.
+	stats — если передан, заполняется статистикой запуска (см. MatchStats).
+	shortlist — готовые кандидаты вместо candidates: id спроса → id предложений (например,
+	из PostgreSQL, см. matching_pg); пары вне списка не оцениваются.
+	sales_side — готовая SalesSide(sales, fuzzy_token_threshold) для серии вызовов с теми же sales.
+	"""
+	if candidates not in CANDIDATE_MODES:
+		raise ValueError(f"unknown candidates mode: {candidates}")
+	if engine not in ENGINES:
+		raise ValueError(f"unknown matching engine: {engine}")
+	params = MatchParams(
+		threshold=threshold,
+		w_title=w_title,
+		w_char=w_char,
+		w_loc=w_loc,
+		w_price=w_price,
+		price_tolerance_abs=price_tolerance_abs,
+		price_tolerance_pct=price_tolerance_pct,
+		fuzzy_token_threshold=fuzzy_token_threshold,
+	)
+	if sales_side is not None and sales_side.memo.threshold != fuzzy_token_threshold:
+		raise ValueError("sales_side prepared with another fuzzy_token_threshold")
+	started = time.perf_counter()
+	run = stats if stats is not None else MatchStats()
+	side = sales_side if sales_side is not None else SalesSide(sales, fuzzy_token_threshold)
+	try:
+		return _find_matches(demands, sales, side, params, run, started, candidates, engine, workers, top_k_per_demand, max_pairs, shortlist)
+	finally:
+		if sales_side is None:
+			side.close()
+
+
+def _find_matches(
+	demands: List[Listing],
+	sales: List[Listing],
+	side: SalesSide,
+	params: MatchParams,
+	run: MatchStats,
+	started: float,
+	candidates: str,
+	engine: str,
+	workers: int | None,
+	top_k_per_demand: int | None,
+	max_pairs: int | None,
+	shortlist: Dict[int, List[int]] | None,
+) -> List[MatchPair]:
+	# кэш токенов общий на весь запуск (и на все блоки iter_matches): одни и те же пары токенов
+	# встречаются в тысячах пар записей; счётчики в stats — только за этот вызов
+	memo = side.memo
+	hits, misses = memo.hits, memo.misses
+	d_feats = [features_of(d) for d in demands]
+	s_feats = side.feats
+	# наименования — множества id лемм в словаре запуска
+	d_titles = [memo.vocab.encode(f.lemmas) for f in d_feats]
+	s_titles = side.titles
+	from app.services.matching_parallel import resolve_workers, score_candidates_parallel
+	n_workers = resolve_workers(workers)
+	selector = PairSelector(top_k_per_demand, max_pairs)
+	sink = selector if selector.active else None
+	prune = PruneCounts()
+	if engine == "tfidf":
+		# кандидаты — ненулевые элементы произведения матриц TF-IDF, процессы не нужны
+		from app.services.matching_tfidf import score_tfidf
+		n_workers = 1
+		scored, n_pairs = score_tfidf(d_feats, s_feats, params, top_k=get_settings().match_tfidf_top_k, selector=sink)
+	else:
+		if shortlist is not None:
+			s_pos = {s.id: si for si, s in enumerate(sales)}
+			cands = [sorted({s_pos[sid] for sid in shortlist.get(d.id, ()) if sid in s_pos}) for d in demands]
+		else:
+			cands = _select_candidates(d_feats, s_feats, params, candidates, memo)
+		n_pairs = sum(len(c) for c in cands)
+		if n_workers > 1 and n_pairs >= get_settings().match_parallel_min_pairs:
+			scored = score_candidates_parallel(d_feats, side, cands, params, engine=engine, workers=n_workers, selector=sink, prune=prune)
+		else:
+			n_workers = 1
+			if engine == "numpy":
+				from app.services.matching_numpy import score_candidates_numpy
+				scored = score_candidates_numpy(d_feats, s_feats, d_titles, s_titles, cands, params, memo, sink, prune)
+			else:
+				scored = _score_candidates(d_feats, s_feats, d_titles, s_titles, cands, params, memo, sink, prune)
+	if sink is not None:
+		# уже упорядочены по убыванию score
+		run.above_threshold = selector.pushed + selector.dropped
+		pairs = [MatchPair(Demand=demands[di], Sale=sales[si], score=score) for di, si, score in selector.result()]
+	else:
+		run.above_threshold = len(scored)
+		pairs = [MatchPair(Demand=demands[di], Sale=sales[si], score=score) for di, si, score in scored]
+		pairs.sort(key=lambda p: p.score, reverse=True)
+	run.demands = len(demands)
+	run.sales = len(sales)
+	run.candidate_pairs = n_pairs
+	run.matches = len(pairs)
+	run.workers = n_workers
+	run.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+	run.token_memo_hits = memo.hits - hits
+	run.token_memo_misses = memo.misses - misses
+	run.token_memo_size = len(memo)
+	run.vocab_size = len(memo.vocab)
+	run.vocab_bytes = memo.vocab.memory_bytes()
+	run.title_bytes = _titles_memory_bytes(d_titles) + _titles_memory_bytes(s_titles)
+	run.pruned_bound = prune.bound
+	run.pruned_jaccard = prune.jaccard
+	run.fuzzy_skipped = prune.exact
+	logger.info("matching_finished", engine=engine, candidates="shortlist" if shortlist is not None else candidates, **run.as_dict())
 	return pairs
 
 
-def title_similarity(a: str | None, b: str | None, *, fuzzy_token_threshold: float = 0.6) -> float:
+def iter_matches(
+	demands: List[Listing],
+	sales: List[Listing],
+	*,
+	block_size: int | None = None,
+	top_k_per_demand: int | None = None,
+	max_pairs: int | None = None,
+	stats: MatchStats | None = None,
+	**kwargs: Any,
+) -> Iterator[MatchPair]:
+	"""Генератор пар: спросы считаются блоками по block_size (MATCH_ITER_BLOCK) через find_matches,
+	пары блока отдаются по убыванию score. В памяти — только пары текущего блока, поэтому
+	общего порядка по score нет (для него — find_matches). kwargs — параметры find_matches.
+	max_pairs — остановиться после N отданных пар; это первые N в порядке блоков, а не N лучших
+	(лучшие N — find_matches(max_pairs=N)).
+	Движок "tfidf" считается одним блоком: idf зависит от всех наименований.
+	Сторона предложений (признаки, словарь, кэш токенов, копия для пула процессов) готовится
+	один раз на все блоки.
+	stats — сумма статистики по блокам.
+	"""
+	block = max(1, block_size or get_settings().match_iter_block)
+	if kwargs.get("engine") == "tfidf":
+		block = max(1, len(demands))
+	left = max_pairs or None
+	side = SalesSide(sales, kwargs.get("fuzzy_token_threshold", 0.6))
+	try:
+		for b0 in range(0, len(demands), block):
+			part = MatchStats()
+			pairs = find_matches(demands[b0:b0 + block], sales, top_k_per_demand=top_k_per_demand, max_pairs=left, stats=part, sales_side=side, **kwargs)
+			if stats is not None:
+				_add_stats(stats, part)
+			yield from pairs
+			if left is not None:
+				left -= len(pairs)
+				if left <= 0:
+					return
+	finally:
+		side.close()
+
+
+def _add_stats(total: MatchStats, part: MatchStats) -> None:
+	for name in (
+		"demands", "candidate_pairs", "above_threshold", "matches", "elapsed_ms",
+		"token_memo_hits", "token_memo_misses", "pruned_bound", "pruned_jaccard", "fuzzy_skipped",
+	):
+		setattr(total, name, getattr(total, name) + getattr(part, name))
+	total.sales = part.sales
+	total.workers = max(total.workers, part.workers)
+	for name in ("token_memo_size", "vocab_size", "vocab_bytes", "title_bytes"):
+		setattr(total, name, max(getattr(total, name), getattr(part, name)))
+
+
+def title_candidates(
+	needle: List[str] | Tuple[str, ...],
+	titles: List[List[str]] | List[Tuple[str, ...]],
+	*,
+	fuzzy_token_threshold: float = 0.6,
+	memo: TokenSimilarityMemo | None = None,
+) -> List[int]:
+	"""Позиции наименований (списков лемм) с общим или нечётко близким к needle токеном —
+	у остальных title_similarity_lemmas(needle, ...) равно 0.
+	"""
+	return _title_candidates([list(needle)], [list(t) for t in titles], fuzzy_token_threshold=fuzzy_token_threshold, memo=memo)[0]
+
+
+def rank_titles(
+	needle: List[str] | Tuple[str, ...],
+	titles: List[List[str]] | List[Tuple[str, ...]],
+	*,
+	fuzzy_token_threshold: float = 0.6,
+	min_score: float = 0.6,
+) -> List[Tuple[int, float]]:
+	"""(позиция, сходство) наименований, похожих на needle не меньше min_score, по убыванию
+	сходства. Только леммы на входе и выходе — годится для пула процессов.
+	"""
+	memo = TokenSimilarityMemo(fuzzy_token_threshold)
+	ranked: List[Tuple[int, float]] = []
+	# без общих или близких токенов сходство равно 0 — оцениваем только наименования из индекса
+	for pos in title_candidates(needle, titles, fuzzy_token_threshold=fuzzy_token_threshold, memo=memo):
+		score = _title_similarity_lemmas(needle, titles[pos], fuzzy_token_threshold, memo)
+		if score >= min_score:
+			ranked.append((pos, score))
+	ranked.sort(key=lambda t: t[1], reverse=True)
+	return ranked
+
+
+def title_lemmas(text: str | None) -> List[str]:
+	"""Леммы наименования в том виде, в каком их сравнивает title_similarity."""
+	return _tokenize(text or "")
+
+
+def title_similarity(a: str | None, b: str | None, *, fuzzy_token_threshold: float = 0.6, memo: TokenSimilarityMemo | None = None) -> float:
 	"""Публичная функция для оценки похожести наименований.
 	Возвращает значение 0..1, комбинируя Jaccard по токенам и нечёткое сопоставление.
+	memo — общий кэш сходства токенов, если сравнений много (например, поиск по списку).
 	"""
-	ad = _tokenize(a or "")
-	bd = _tokenize(b or "")
-	jacc = _set_jaccard(ad, bd)
-	fuzzy = _fuzzy_tokens_similarity(ad, bd, min_token_similarity=fuzzy_token_threshold)
-	return 0.5 * jacc + 0.5 * fuzzy
+	return _title_similarity_lemmas(title_lemmas(a), title_lemmas(b), fuzzy_token_threshold, memo)
+
+
+def title_similarity_lemmas(
+	a: List[str] | Tuple[str, ...],
+	b: List[str] | Tuple[str, ...],
+	*,
+	fuzzy_token_threshold: float = 0.6,
+	memo: TokenSimilarityMemo | None = None,
+) -> float:
+	"""То же, что title_similarity, но по готовым леммам (например, из features_of)."""
+	return _title_similarity_lemmas(a, b, fuzzy_token_threshold, memo)
 
 
 def group_listings(listings: List[Listing]) -> Tuple[List[Listing], List[Listing]]:
@@ -0,0 +1,142 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.matching import EncodedTitle, MatchFeatures, MatchParams, PairSelector, PruneCounts, TokenSimilarityMemo, _pruned_title_similarity
+
+
+# Ограничение на размер блока спрос × предложения (элементов в одной матрице float64)
+_BLOCK_CELLS = 4_000_000
+
+
+def _price_vector(feats: List[MatchFeatures]) -> np.ndarray:
+	# NaN — цена не задана или не положительна (такие пары дают 0)
+	return np.array([float(f.price) if f.price is not None and f.price > 0 else np.nan for f in feats], dtype=np.float64)
+
+
+def _price_matrix(dp: np.ndarray, sp: np.ndarray, p: MatchParams) -> np.ndarray:
+	"""Векторный аналог matching._price_similarity для блока (спрос × предложения)."""
+	d = dp[:, None]
+	s = sp[None, :]
+	valid = ~np.isnan(d) & ~np.isnan(s)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		hi = np.fmax(d, s)
+		ratio = np.fmin(d, s) / hi
+		allow = np.zeros_like(hi)
+		if p.price_tolerance_abs:
+			allow = np.maximum(allow, float(p.price_tolerance_abs))
+		if p.price_tolerance_pct:
+			allow = np.maximum(allow, (float(p.price_tolerance_pct) / 100.0) * hi)
+		within = (allow > 0) & (np.abs(d - s) <= allow)
+	return np.where(valid, np.where(within, 1.0, ratio), 0.0)
+
+
+def _location_codes(d_feats: List[MatchFeatures], s_feats: List[MatchFeatures]) -> Tuple[np.ndarray, np.ndarray]:
+	# -1 — город не задан
+	codes: Dict[str, int] = {}
+	def encode(feats: List[MatchFeatures]) -> np.ndarray:
+		return np.array([-1 if f.location_key is None else codes.setdefault(f.location_key, len(codes)) for f in feats], dtype=np.int64)
+	return encode(d_feats), encode(s_feats)
+
+
+class _CharIncidence:
+	"""Матрицы вхождения ключей и пар (ключ, значение) характеристик.
+	Столбцы — только ключи/пары, встречающиеся и у спроса, и у предложений:
+	остальные не дают пересечений и учитываются лишь в размере множества ключей.
+	"""
+
+	def __init__(self, d_feats: List[MatchFeatures], s_feats: List[MatchFeatures]) -> None:
+		d_keys = {k for f in d_feats if f.characteristics for k in f.characteristics}
+		s_keys = {k for f in s_feats if f.characteristics for k in f.characteristics}
+		d_items = {kv for f in d_feats if f.characteristics for kv in f.characteristics.items()}
+		s_items = {kv for f in s_feats if f.characteristics for kv in f.characteristics.items()}
+		self.key_cols = {k: i for i, k in enumerate(sorted(d_keys & s_keys))}
+		self.item_cols = {kv: i for i, kv in enumerate(sorted(d_items & s_items))}
+		self.d_keys, self.d_items, self.d_count = self._encode(d_feats)
+		self.s_keys, self.s_items, self.s_count = self._encode(s_feats)
+
+	def _encode(self, feats: List[MatchFeatures]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		keys = np.zeros((len(feats), len(self.key_cols)), dtype=np.float64)
+		items = np.zeros((len(feats), len(self.item_cols)), dtype=np.float64)
+		count = np.zeros(len(feats), dtype=np.float64)
+		for row, f in enumerate(feats):
+			if not f.characteristics:
+				continue
+			count[row] = len(f.characteristics)
+			for k, v in f.characteristics.items():
+				col = self.key_cols.get(k)
+				if col is not None:
+					keys[row, col] = 1.0
+				col = self.item_cols.get((k, v))
+				if col is not None:
+					items[row, col] = 1.0
+		return keys, items, count
+
+	def block(self, d0: int, d1: int) -> np.ndarray:
+		"""Векторный аналог matching._char_similarity для спросов d0..d1 × все предложения."""
+		inter = self.d_keys[d0:d1] @ self.s_keys.T
+		values = self.d_items[d0:d1] @ self.s_items.T
+		dc = self.d_count[d0:d1, None]
+		sc = self.s_count[None, :]
+		union = dc + sc - inter
+		with np.errstate(invalid="ignore", divide="ignore"):
+			key_sim = np.where(union > 0, inter / np.maximum(union, 1.0), 0.0)
+			val_sim = np.where(inter > 0, values / np.maximum(inter, 1.0), 0.0)
+		both = (dc > 0) & (sc > 0)
+		return np.where(both, 0.5 * key_sim + 0.5 * val_sim, 0.0)
+
+
+def score_candidates_numpy(
+	d_feats: List[MatchFeatures],
+	s_feats: List[MatchFeatures],
+	d_titles: List[EncodedTitle],
+	s_titles: List[EncodedTitle],
+	cands: List[List[int]],
+	p: MatchParams,
+	memo: TokenSimilarityMemo,
+	selector: PairSelector | None = None,
+	prune: PruneCounts | None = None,
+) -> List[Tuple[int, int, float]]:
+	"""Блочный расчёт: цена, город и характеристики — массивами, наименование — попарно
+	только для кандидатов, которые ещё могут набрать порог. Контракт как у
+	matching._score_candidates (включая selector и prune).
+	"""
+	prune = prune if prune is not None else PruneCounts()
+	n_sales = len(s_feats)
+	if not d_feats or not n_sales:
+		return []
+	dp, sp = _price_vector(d_feats), _price_vector(s_feats)
+	dl, sl = _location_codes(d_feats, s_feats)
+	chars = _CharIncidence(d_feats, s_feats)
+	block = max(1, _BLOCK_CELLS // n_sales)
+	scored: List[Tuple[int, int, float]] = []
+	for d0 in range(0, len(d_feats), block):
+		d1 = min(len(d_feats), d0 + block)
+		loc = ((dl[d0:d1, None] == sl[None, :]) & (dl[d0:d1, None] >= 0)).astype(np.float64)
+		price = _price_matrix(dp[d0:d1], sp, p)
+		char = chars.block(d0, d1)
+		cheap = p.w_char * char + p.w_loc * loc + p.w_price * price
+		title = np.zeros((d1 - d0, n_sales), dtype=np.float64)
+		mask = np.zeros((d1 - d0, n_sales), dtype=bool)
+		for row, di in enumerate(range(d0, d1)):
+			cand = cands[di]
+			if not cand:
+				continue
+			td = d_titles[di]
+			cheap_row = cheap[row]
+			for si in cand:
+				sim = _pruned_title_similarity(td, s_titles[si], p, float(cheap_row[si]), memo, prune)
+				if sim is not None:
+					title[row, si] = sim
+					mask[row, si] = True
+		# тот же порядок операций, что в matching._score_features
+		score = p.w_title * title + p.w_char * char + p.w_loc * loc + p.w_price * price
+		rows, cols = np.nonzero(mask & (score >= p.threshold))
+		block_pairs = ((d0 + int(r), int(c), float(score[r, c])) for r, c in zip(rows, cols))
+		if selector is not None:
+			for di, si, sc in block_pairs:
+				selector.push(di, si, sc)
+		else:
+			scored.extend(block_pairs)
+	return scored
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from math import ceil
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Tuple
+
+import structlog
+
+from app.services.matching import EncodedTitle, MatchFeatures, MatchParams, PairSelector, PruneCounts, TitleVocabulary, TokenSimilarityMemo, _score_candidates
+
+if TYPE_CHECKING:
+	from app.services.matching import SalesSide
+
+
+logger = structlog.get_logger(__name__)
+
+# Состояние процесса-воркера: сторона предложений текущего запуска (читается из файла при первой
+# части запуска), словарь лемм и кэш сходства токенов, общие для всех частей и блоков запуска
+_worker_run: str | None = None
+_worker_sales: List[MatchFeatures] = []
+_worker_titles: List[EncodedTitle] = []
+_worker_memo: TokenSimilarityMemo | None = None
+
+# Пул живёт всё время работы процесса: spawn и импорт приложения (pymorphy3) в воркерах —
+# один раз, а не на каждый find_matches (iter_matches вызывает его на каждый блок спросов)
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+class ShippedSales:
+	"""Сторона предложений запуска в файле для воркеров: pickle пишется один раз на запуск,
+	каждый воркер читает его при первой своей части. Спросы блоков кодируются воркером в его
+	копии словаря — id лемм предложений совпадают с родительскими.
+	"""
+
+	def __init__(self, side: SalesSide) -> None:
+		self.run_id = uuid.uuid4().hex
+		fd, self.path = tempfile.mkstemp(prefix="matching_sales_", suffix=".pkl")
+		with os.fdopen(fd, "wb") as f:
+			pickle.dump((side.feats, side.titles, list(side.memo.vocab.tokens), side.memo.threshold), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+	def close(self) -> None:
+		Path(self.path).unlink(missing_ok=True)
+
+
+def _load_run(run_id: str, path: str) -> None:
+	global _worker_run, _worker_sales, _worker_titles, _worker_memo
+	if _worker_run == run_id:
+		return
+	with open(path, "rb") as f:
+		sales, titles, tokens, fuzzy_token_threshold = pickle.load(f)
+	_worker_run = run_id
+	_worker_sales = sales
+	_worker_titles = titles
+	_worker_memo = TokenSimilarityMemo(fuzzy_token_threshold, vocab=TitleVocabulary(tokens))
+
+
+def _score_chunk(
+	run_id: str,
+	path: str,
+	d0: int,
+	d_feats: List[MatchFeatures],
+	cands: List[List[int]],
+	params: MatchParams,
+	engine: str,
+	top_k_per_demand: int | None,
+) -> Tuple[List[Tuple[int, int, float]], int, int, int, PruneCounts]:
+	"""Считает часть спросов. Возвращает тройки, число пар выше порога, прирост
+	попаданий/промахов кэша токенов и счётчики отсечения. При top_k_per_demand лишние пары
+	отбрасываются ещё в воркере.
+	"""
+	if engine == "numpy":
+		from app.services.matching_numpy import score_candidates_numpy as score
+	else:
+		score = _score_candidates
+	_load_run(run_id, path)
+	d_titles = [_worker_memo.vocab.encode(f.lemmas) for f in d_feats]
+	hits, misses = _worker_memo.hits, _worker_memo.misses
+	selector = PairSelector(top_k_per_demand) if top_k_per_demand else None
+	prune = PruneCounts()
+	scored = score(d_feats, _worker_sales, d_titles, _worker_titles, cands, params, _worker_memo, selector, prune)
+	above = len(scored)
+	if selector is not None:
+		above = selector.pushed
+		scored = selector.in_order()
+	scored = [(d0 + di, si, sc) for di, si, sc in scored]
+	return scored, above, _worker_memo.hits - hits, _worker_memo.misses - misses, prune
+
+
+def resolve_workers(workers: int | None) -> int:
+	"""None/1 — последовательно; 0 — по числу ядер."""
+	if workers is None:
+		return 1
+	if workers <= 0:
+		return os.cpu_count() or 1
+	return workers
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+	global _pool, _pool_workers
+	with _pool_lock:
+		if _pool is not None and _pool_workers != workers:
+			# другое число процессов — начатые расчёты дорабатывают в прежнем пуле
+			_pool.shutdown(wait=False)
+			_pool = None
+		if _pool is None:
+			# spawn, а не fork: в API-процессе работают потоки планировщика и сервера
+			_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+			_pool_workers = workers
+			logger.info("matching_pool_started", workers=workers)
+		return _pool
+
+
+def _drop_pool(pool: ProcessPoolExecutor) -> None:
+	global _pool
+	with _pool_lock:
+		if _pool is pool:
+			_pool = None
+	pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+	global _pool
+	with _pool_lock:
+		pool, _pool = _pool, None
+	if pool is not None:
+		pool.shutdown(wait=False, cancel_futures=True)
+
+
+def score_candidates_parallel(
+	d_feats: List[MatchFeatures],
+	side: SalesSide,
+	cands: List[List[int]],
+	params: MatchParams,
+	*,
+	engine: str,
+	workers: int,
+	selector: PairSelector | None = None,
+	prune: PruneCounts | None = None,
+) -> List[Tuple[int, int, float]]:
+	"""Делит спросы на части и считает их в постоянном пуле процессов. Сторона предложений
+	передаётся воркерам один раз на запуск (side.shipped, см. ShippedSales). Результат в том же
+	порядке, что у последовательного расчёта. Счётчики кэшей воркеров добавляются к side.memo,
+	счётчики отсечения — к prune.
+	Если передан selector — пары уходят в него (в том же порядке), а возвращается пустой список.
+	"""
+	if side.shipped is None:
+		side.shipped = ShippedSales(side)
+	shipped = side.shipped
+	# несколько частей на воркер — чтобы выровнять нагрузку
+	chunk = max(1, ceil(len(d_feats) / (workers * 4)))
+	logger.info("matching_parallel_started", workers=workers, demands=len(d_feats), sales=len(side.feats), chunk=chunk)
+	top_k = selector.top_k if selector is not None else None
+	scored: List[Tuple[int, int, float]] = []
+	pool = _get_pool(workers)
+	futures = [
+		pool.submit(_score_chunk, shipped.run_id, shipped.path, d0, d_feats[d0:d0 + chunk], cands[d0:d0 + chunk], params, engine, top_k)
+		for d0 in range(0, len(d_feats), chunk)
+	]
+	try:
+		for f in futures:
+			part, above, hits, misses, part_prune = f.result()
+			if selector is not None:
+				for di, si, sc in part:
+					selector.push(di, si, sc)
+				selector.dropped += above - len(part)
+			else:
+				scored.extend(part)
+			side.memo.hits += hits
+			side.memo.misses += misses
+			if prune is not None:
+				prune.bound += part_prune.bound
+				prune.jaccard += part_prune.jaccard
+				prune.exact += part_prune.exact
+	except BrokenProcessPool as exc:
+		# воркер упал (например, OOM) — следующий расчёт получит новый пул
+		logger.error("matching_pool_broken", error=str(exc))
+		_drop_pool(pool)
+		raise
+	except BaseException:
+		for f in futures:
+			f.cancel()
+		raise
+	return scored
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+
+import structlog
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.listings import Listing
+from app.repositories.listings import trigram_candidates, trigram_search_available
+from app.services.matching import MatchPair, MatchParams, find_matches
+
+
+logger = structlog.get_logger(__name__)
+
+
+def pg_trgm_shortlist(session: Session, demands: List[Listing], sales: List[Listing]) -> Dict[int, List[int]] | None:
+	"""Кандидаты id спроса → id предложений из PostgreSQL (pg_trgm) либо None, если расширения
+	нет или запрос не удался. Запрос идёт от меньшей стороны (оператор % симметричен).
+	"""
+	if not demands or not sales or not trigram_search_available(session):
+		return None
+	settings = get_settings()
+	by_demand = len(demands) <= len(sales)
+	try:
+		# точка сохранения: ошибка запроса не должна обрывать транзакцию вызывающего
+		with session.begin_nested():
+			found = trigram_candidates(
+				session,
+				[x.id for x in (demands if by_demand else sales)],
+				target_type="sale" if by_demand else "demand",
+				min_similarity=settings.match_trgm_min_similarity,
+				same_location=settings.match_trgm_same_location,
+				limit=settings.match_trgm_limit,
+			)
+	except SQLAlchemyError as exc:
+		logger.warning("pg_trgm_candidates_failed", error=str(exc))
+		return None
+	if by_demand:
+		return found
+	shortlist: Dict[int, List[int]] = {}
+	for sale_id, demand_ids in found.items():
+		for demand_id in demand_ids:
+			shortlist.setdefault(demand_id, []).append(sale_id)
+	return shortlist
+
+
+def find_matches_pg(session: Session, demands: List[Listing], sales: List[Listing], **kwargs: Any) -> List[MatchPair]:
+	"""find_matches с отбором кандидатов в PostgreSQL: приложение оценивает только пары с похожими
+	(по pg_trgm) наименованиями. Без расширения, при ошибке запроса или если прочие компоненты
+	без наименования сами набирают порог — обычный find_matches (kwargs — его параметры).
+	"""
+	p = MatchParams(**{k: v for k, v in kwargs.items() if k in MatchParams.__dataclass_fields__})
+	rest_max = max(p.w_char, 0.0) + max(p.w_loc, 0.0) + max(p.w_price, 0.0)
+	shortlist = pg_trgm_shortlist(session, demands, sales) if rest_max < p.threshold else None
+	if shortlist is None:
+		logger.info("pg_trgm_fallback", demands=len(demands), sales=len(sales))
+	return find_matches(demands, sales, shortlist=shortlist, **kwargs)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.matching import MatchFeatures, MatchParams, PairSelector
+from app.services.matching_numpy import _BLOCK_CELLS, _CharIncidence, _location_codes, _price_matrix, _price_vector
+
+try:  # scipy необязателен: без него произведение считается по спискам вхождений n-грамм
+	from scipy import sparse as _sparse
+except Exception:  # pragma: no cover
+	_sparse = None
+
+
+# Длина символьных n-грамм (лемма дополняется пробелами: " бетон " → " бе", "бет", ...)
+NGRAM = 3
+
+
+def _title_ngrams(lemmas: Tuple[str, ...], n: int = NGRAM) -> Dict[str, int]:
+	counts: Dict[str, int] = {}
+	for lemma in lemmas:
+		padded = f" {lemma} "
+		if len(padded) <= n:
+			counts[padded] = counts.get(padded, 0) + 1
+			continue
+		for i in range(len(padded) - n + 1):
+			g = padded[i:i + n]
+			counts[g] = counts.get(g, 0) + 1
+	return counts
+
+
+class TfidfTitles:
+	"""TF-IDF символьных n-грамм наименований обеих сторон (строки нормированы по L2),
+	так что сходство всех спросов со всеми предложениями — одно разреженное произведение.
+	Хранится в виде CSR: indptr/indices/data для спросов и для предложений.
+	"""
+
+	def __init__(self, d_feats: List[MatchFeatures], s_feats: List[MatchFeatures], n: int = NGRAM) -> None:
+		d_grams = [_title_ngrams(f.lemmas, n) for f in d_feats]
+		s_grams = [_title_ngrams(f.lemmas, n) for f in s_feats]
+		df: Dict[str, int] = {}
+		for grams in d_grams + s_grams:
+			for g in grams:
+				df[g] = df.get(g, 0) + 1
+		self.columns = {g: i for i, g in enumerate(sorted(df))}
+		# сглаженный idf, как в sklearn: ln((1 + N) / (1 + df)) + 1
+		n_docs = len(d_grams) + len(s_grams)
+		self.idf = np.array([math.log((1 + n_docs) / (1 + df[g])) + 1.0 for g in sorted(df)], dtype=np.float64)
+		self.d = self._encode(d_grams)
+		self.s = self._encode(s_grams)
+		self.n_sales = len(s_grams)
+		if _sparse is not None:
+			shape = (len(s_grams), len(self.columns))
+			self._s_t = _sparse.csr_matrix(self.s, shape=shape).T.tocsr()
+		else:
+			self._postings = self._build_postings()
+
+	def _encode(self, docs: List[Dict[str, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+		indices: List[int] = []
+		data: List[float] = []
+		for row, grams in enumerate(docs):
+			items = sorted((self.columns[g], count) for g, count in grams.items())
+			cols = [c for c, _ in items]
+			weights = np.array([count * self.idf[c] for c, count in items], dtype=np.float64)
+			norm = float(np.sqrt(np.dot(weights, weights))) if len(weights) else 0.0
+			if norm > 0:
+				weights /= norm
+			indices.extend(cols)
+			data.extend(weights.tolist())
+			indptr[row + 1] = len(indices)
+		return np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr
+
+	def _build_postings(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+		"""Для каждой n-граммы — (строки предложений, веса): транспонированная матрица предложений."""
+		data, indices, indptr = self.s
+		rows = np.repeat(np.arange(self.n_sales), np.diff(indptr))
+		order = np.argsort(indices, kind="stable")
+		starts = np.searchsorted(indices[order], np.arange(len(self.columns) + 1))
+		return [(rows[order[a:b]], data[order[a:b]]) for a, b in zip(starts[:-1], starts[1:])]
+
+	def similarity_block(self, d0: int, d1: int) -> np.ndarray:
+		"""Косинусное сходство наименований спросов d0..d1 со всеми предложениями."""
+		data, indices, indptr = self.d
+		lo, hi = indptr[d0], indptr[d1]
+		if _sparse is not None:
+			block = _sparse.csr_matrix(
+				(data[lo:hi], indices[lo:hi], indptr[d0:d1 + 1] - lo),
+				shape=(d1 - d0, len(self.columns)),
+			)
+			sim = (block @ self._s_t).toarray()
+		else:
+			sim = np.zeros((d1 - d0, self.n_sales), dtype=np.float64)
+			for row in range(d1 - d0):
+				for k in range(indptr[d0 + row], indptr[d0 + row + 1]):
+					s_rows, s_weights = self._postings[indices[k]]
+					sim[row, s_rows] += data[k] * s_weights
+		# погрешность суммирования не должна давать сходство больше 1
+		return np.minimum(sim, 1.0)
+
+
+def _keep_top_k(sim: np.ndarray, k: int) -> np.ndarray:
+	"""Оставляет в каждой строке k наибольших значений (при равенстве на границе — все равные)."""
+	if k <= 0 or sim.shape[1] <= k:
+		return sim
+	kth = np.partition(sim, sim.shape[1] - k, axis=1)[:, sim.shape[1] - k][:, None]
+	return np.where(sim >= kth, sim, 0.0)
+
+
+def score_tfidf(
+	d_feats: List[MatchFeatures],
+	s_feats: List[MatchFeatures],
+	p: MatchParams,
+	*,
+	top_k: int = 0,
+	selector: PairSelector | None = None,
+) -> Tuple[List[Tuple[int, int, float]], int]:
+	"""Движок "tfidf": сходство наименований — косинус TF-IDF символьных n-грамм (вместо
+	Жаккара и нечёткого сравнения лемм), прочие компоненты — как в движке "numpy".
+	top_k — для каждого спроса учитывается сходство только с top_k ближайшими по наименованию
+	предложениями (0 — со всеми). Возвращает тройки в порядке (спрос, предложение) —
+	или пустой список, если передан selector, — и число оценённых пар.
+	"""
+	n_sales = len(s_feats)
+	if not d_feats or not n_sales:
+		return [], 0
+	titles = TfidfTitles(d_feats, s_feats)
+	dp, sp = _price_vector(d_feats), _price_vector(s_feats)
+	dl, sl = _location_codes(d_feats, s_feats)
+	chars = _CharIncidence(d_feats, s_feats)
+	# без сходства наименований пара проходит порог только за счёт прочих компонентов
+	rest_max = max(p.w_char, 0.0) + max(p.w_loc, 0.0) + max(p.w_price, 0.0)
+	title_only = rest_max < p.threshold
+	block = max(1, _BLOCK_CELLS // n_sales)
+	scored: List[Tuple[int, int, float]] = []
+	n_pairs = 0
+	for d0 in range(0, len(d_feats), block):
+		d1 = min(len(d_feats), d0 + block)
+		title = _keep_top_k(titles.similarity_block(d0, d1), top_k)
+		loc = ((dl[d0:d1, None] == sl[None, :]) & (dl[d0:d1, None] >= 0)).astype(np.float64)
+		price = _price_matrix(dp[d0:d1], sp, p)
+		score = p.w_title * title + p.w_char * chars.block(d0, d1) + p.w_loc * loc + p.w_price * price
+		ok = score >= p.threshold
+		if title_only:
+			ok &= title > 0
+			n_pairs += int(np.count_nonzero(title))
+		else:
+			n_pairs += title.size
+		rows, cols = np.nonzero(ok)
+		block_pairs = ((d0 + int(r), int(c), float(score[r, c])) for r, c in zip(rows, cols))
+		if selector is not None:
+			for di, si, sc in block_pairs:
+				selector.push(di, si, sc)
+		else:
+			scored.extend(block_pairs)
+	return scored, n_pairs
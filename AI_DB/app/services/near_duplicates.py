@@ -0,0 +1,149 @@
+from __future__ import annotations
+import random
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+import structlog
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.listings import Listing
+from app.repositories.listing_signatures import delete_signatures, get_signatures, save_signature
+from app.services.matching import MatchFeatures, features_of
+
+
+logger = structlog.get_logger(__name__)
+
+# Длина подписи и число полос LSH: 16 полос по 4 значения — пара с оценкой Жаккара s становится
+# кандидатом с вероятностью 1 - (1 - s^4)^16 (≈0.9998 при s = 0.8, ≈0.64 при s = 0.5)
+NUM_PERM = 64
+BANDS = 16
+_ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+# хэш-функции (a·x + b) mod p фиксированы: подписи хранятся в БД между запусками
+_rng = random.Random(0x5EED)
+_A = np.array([_rng.randrange(1, _PRIME) for _ in range(NUM_PERM)], dtype=np.uint64)
+_B = np.array([_rng.randrange(0, _PRIME) for _ in range(NUM_PERM)], dtype=np.uint64)
+# корзина LSH больше этого размера проверяется не попарно, а цепочкой (линейно)
+_MAX_PAIRWISE_BUCKET = 50
+
+
+@dataclass
+class DuplicateCluster:
+	"""Группа похожих записей одного типа; similarity — наименьшая оценка сходства среди связей группы."""
+	listings: List[Listing]
+	similarity: float
+
+
+def _shingles(f: MatchFeatures) -> Set[str]:
+	"""Символьные 3-граммы наименования (по леммам) и пары характеристика=значение."""
+	text = " ".join(f.lemmas)
+	grams = {text[i:i + 3] for i in range(len(text) - 2)} if len(text) >= 3 else ({text} if text else set())
+	grams |= {f"{k}={v}" for k, v in (f.characteristics or {}).items()}
+	return grams
+
+
+def minhash_signature(shingles: Set[str]) -> List[int]:
+	if not shingles:
+		return []
+	# crc32 — стабильный между процессами хэш (в отличие от hash())
+	h = np.array([zlib.crc32(s.encode("utf-8")) & _PRIME for s in shingles], dtype=np.uint64)
+	return ((_A[:, None] * h[None, :] + _B[:, None]) % _PRIME).min(axis=1).tolist()
+
+
+def listing_signatures(session: Session, listings: List[Listing]) -> Dict[int, List[int]]:
+	"""Подписи записей: сохранённые, если updated_at не менялся, иначе пересчитанные и сохранённые."""
+	stored = get_signatures(session)
+	result: Dict[int, List[int]] = {}
+	recomputed = 0
+	for l in listings:
+		row = stored.get(l.id)
+		if row is not None and row.listing_updated_at == l.updated_at and len(row.minhash) in (0, NUM_PERM):
+			result[l.id] = row.minhash
+			continue
+		sig = minhash_signature(_shingles(features_of(l)))
+		save_signature(session, l.id, sig, l.updated_at, existing=row)
+		result[l.id] = sig
+		recomputed += 1
+	orphans = set(stored) - set(result)
+	delete_signatures(session, orphans)
+	session.flush()
+	logger.info("minhash_signatures", listings=len(listings), recomputed=recomputed, deleted=len(orphans))
+	return result
+
+
+def cluster_near_duplicates(listings: List[Listing], signatures: Dict[int, List[int]], min_similarity: float) -> List[DuplicateCluster]:
+	"""Группы записей одного типа с оценкой сходства подписей не ниже min_similarity.
+	Сравниваются только записи с общей полосой подписи (LSH), а не все пары.
+	"""
+	sigs: List[np.ndarray | None] = []
+	buckets: Dict[Tuple[str, int, Tuple[int, ...]], List[int]] = {}
+	for pos, l in enumerate(listings):
+		sig = signatures.get(l.id) or []
+		if len(sig) != NUM_PERM:
+			sigs.append(None)
+			continue
+		sigs.append(np.array(sig, dtype=np.int64))
+		kind = (l.type or "").strip().lower()
+		for band in range(BANDS):
+			buckets.setdefault((kind, band, tuple(sig[band * _ROWS:(band + 1) * _ROWS])), []).append(pos)
+
+	parent = list(range(len(listings)))
+
+	def find(x: int) -> int:
+		while parent[x] != x:
+			parent[x] = parent[parent[x]]
+			x = parent[x]
+		return x
+
+	checked: Set[Tuple[int, int]] = set()
+	edges: List[Tuple[int, int, float]] = []
+
+	def link(i: int, j: int) -> None:
+		key = (i, j) if i < j else (j, i)
+		if key in checked:
+			return
+		checked.add(key)
+		sim = float(np.count_nonzero(sigs[i] == sigs[j])) / NUM_PERM
+		if sim >= min_similarity:
+			edges.append((i, j, sim))
+			ri, rj = find(i), find(j)
+			if ri != rj:
+				parent[rj] = ri
+
+	for members in buckets.values():
+		if len(members) < 2:
+			continue
+		if len(members) <= _MAX_PAIRWISE_BUCKET:
+			for a in range(len(members)):
+				for b in range(a + 1, len(members)):
+					link(members[a], members[b])
+		else:
+			for a in range(1, len(members)):
+				link(members[0], members[a])
+				link(members[a - 1], members[a])
+
+	# у каждой записи группы есть хотя бы одна связь
+	groups: Dict[int, List[int]] = {}
+	for pos in sorted({p for i, j, _ in edges for p in (i, j)}):
+		groups.setdefault(find(pos), []).append(pos)
+	weakest: Dict[int, float] = {}
+	for i, _, sim in edges:
+		root = find(i)
+		weakest[root] = min(weakest.get(root, 1.0), sim)
+	clusters = [
+		DuplicateCluster(listings=[listings[p] for p in sorted(members, key=lambda p: listings[p].id)], similarity=round(weakest[root], 2))
+		for root, members in groups.items()
+	]
+	clusters.sort(key=lambda c: (-len(c.listings), c.listings[0].id))
+	logger.info("near_duplicates_found", listings=len(listings), buckets=len(buckets), compared=len(checked), clusters=len(clusters))
+	return clusters
+
+
+def find_near_duplicates(session: Session, listings: List[Listing], *, min_similarity: float | None = None) -> List[DuplicateCluster]:
+	"""Группы похожих записей (наименование и характеристики) за время, близкое к линейному."""
+	if min_similarity is None:
+		min_similarity = get_settings().diag_duplicate_min_similarity
+	return cluster_near_duplicates(listings, listing_signatures(session, listings), min_similarity)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+from typing import List, Optional
+
+import structlog
+
+from app.config import get_settings
+from app.db import session_scope
+from app.repositories.listings import fulltext_candidates, fulltext_search_available, listing_title_lemmas
+from app.services.executor import run_cpu, run_io
+from app.services.matching import rank_titles, title_lemmas
+
+
+logger = structlog.get_logger(__name__)
+
+
+def _candidates(q: str, city: Optional[str], listing_type: Optional[str]):
+	with session_scope() as session:
+		if fulltext_search_available(session):
+			return True, fulltext_candidates(session, q, city=city, listing_type=listing_type, limit=get_settings().search_fulltext_candidates)
+		# без search_vector (SQLite, нет прав на ALTER) — все наименования по фильтру
+		return False, [(lid, lemmas, False) for lid, lemmas in listing_title_lemmas(session, city=city, listing_type=listing_type)]
+
+
+async def search_listing_ids(
+	q: str,
+	*,
+	city: Optional[str] = None,
+	listing_type: Optional[str] = None,
+	fuzzy_token_threshold: float = 0.6,
+	min_score: float = 0.6,
+) -> List[int]:
+	"""id записей по запросу q. Кандидаты отбирает полнотекстовый поиск PostgreSQL (не более
+	SEARCH_FULLTEXT_CANDIDATES по ts_rank), нечёткое сходство наименований (Левенштейн) считается
+	только для них: сначала записи со сходством не ниже min_score — по убыванию сходства, затем
+	записи, где все слова запроса нашлись в описании или характеристиках.
+	"""
+	needle = title_lemmas((q or "").strip())
+	if not needle:
+		return []
+	fulltext, rows = await run_io(_candidates, q, city, listing_type)
+	ranked = await run_cpu(rank_titles, needle, [lemmas for _, lemmas, _ in rows], fuzzy_token_threshold=fuzzy_token_threshold, min_score=min_score)
+	ids = [rows[pos][0] for pos, _ in ranked]
+	seen = set(ids)
+	ids += [lid for lid, _, all_matched in rows if all_matched and lid not in seen]
+	logger.info("listings_search", fulltext=fulltext, candidates=len(rows), fuzzy=len(ranked), found=len(ids))
+	return ids
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import hashlib
+import json
+import mimetypes
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import structlog
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.services.compression import BROTLI_AVAILABLE, accepted_encodings, compress
+
+
+logger = structlog.get_logger(__name__)
+
+STATIC_DIR = Path("app/static")
+# каталог сборки: файлы с хэшем содержимого в имени, их .gz/.br и manifest.json
+DIST_DIR_NAME = "dist"
+MANIFEST_NAME = "manifest.json"
+_PRECOMPRESS_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_SUFFIX_BY_ENCODING = {"br": ".br", "gzip": ".gz"}
+
+
+def build_static(src: Path = STATIC_DIR) -> Dict[str, str]:
+	"""Сборка статики: копии файлов с именем name.<хэш>.ext в src/dist, заранее сжатые
+	варианты (.gz, .br — если они меньше исходника) и manifest.json: путь → путь с хэшем.
+	"""
+	out = src / DIST_DIR_NAME
+	if out.exists():
+		shutil.rmtree(out)
+	out.mkdir(parents=True)
+	manifest: Dict[str, str] = {}
+	for path in sorted(src.rglob("*")):
+		if not path.is_file() or out in path.parents:
+			continue
+		data = path.read_bytes()
+		rel = path.relative_to(src)
+		digest = hashlib.sha256(data).hexdigest()[:12]
+		hashed = rel.with_name(f"{rel.stem}.{digest}{rel.suffix}")
+		target = out / hashed
+		target.parent.mkdir(parents=True, exist_ok=True)
+		target.write_bytes(data)
+		if rel.suffix.lower() in _PRECOMPRESS_SUFFIXES:
+			for encoding in ("gzip", "br") if BROTLI_AVAILABLE else ("gzip",):
+				packed = compress(data, encoding, best=True)
+				if len(packed) < len(data):
+					target.with_name(target.name + _SUFFIX_BY_ENCODING[encoding]).write_bytes(packed)
+		manifest[rel.as_posix()] = hashed.as_posix()
+	(out / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+	logger.info("static_built", files=len(manifest), brotli=BROTLI_AVAILABLE, path=str(out))
+	return manifest
+
+
+_manifest: Tuple[float, Dict[str, str]] = (-1.0, {})
+_file_digests: Dict[Tuple[str, float], str] = {}
+_lock = threading.Lock()
+
+
+def _load_manifest() -> Dict[str, str]:
+	global _manifest
+	path = STATIC_DIR / DIST_DIR_NAME / MANIFEST_NAME
+	try:
+		mtime = path.stat().st_mtime
+	except OSError:
+		return {}
+	with _lock:
+		if _manifest[0] != mtime:
+			_manifest = (mtime, json.loads(path.read_text(encoding="utf-8")))
+		return _manifest[1]
+
+
+def assets_mtime() -> float:
+	"""Время изменения статики — для ETag и Last-Modified страниц, ссылающихся на неё: после сборки
+	это manifest.json (пишется заново вместе с файлами), без сборки — самый поздний исходный файл."""
+	try:
+		return (STATIC_DIR / DIST_DIR_NAME / MANIFEST_NAME).stat().st_mtime
+	except OSError:
+		pass
+	return max((p.stat().st_mtime for p in STATIC_DIR.rglob("*") if p.is_file()), default=0.0)
+
+
+def static_url(path: str) -> str:
+	"""URL файла статики для шаблонов: /static/dist/<имя с хэшем> после сборки. Без сборки
+	(разработка) — /static/<path>?v=<хэш>, чтобы браузер не показывал устаревший файл."""
+	path = path.lstrip("/")
+	hashed = _load_manifest().get(path)
+	if hashed:
+		return f"/static/{DIST_DIR_NAME}/{hashed}"
+	source = STATIC_DIR / path
+	try:
+		key = (path, source.stat().st_mtime)
+	except OSError:
+		return f"/static/{path}"
+	with _lock:
+		digest = _file_digests.get(key)
+	if digest is None:
+		digest = hashlib.sha256(source.read_bytes()).hexdigest()[:12]
+		with _lock:
+			_file_digests[key] = digest
+	return f"/static/{path}?v={digest}"
+
+
+class AssetStaticFiles(StaticFiles):
+	"""StaticFiles для /static: файлы сборки (dist/) кэшируются навсегда (имя меняется вместе с
+	содержимым) и отдаются заранее сжатыми по Accept-Encoding; остальные — с перепроверкой."""
+
+	async def get_response(self, path: str, scope: Scope) -> Response:
+		parts = Path(path).parts
+		if not parts or parts[0] != DIST_DIR_NAME or path.endswith(MANIFEST_NAME):
+			response = await super().get_response(path, scope)
+			response.headers["Cache-Control"] = "no-cache"
+			return response
+		for encoding in accepted_encodings(Headers(scope=scope).get("accept-encoding", "")):
+			packed = path + _SUFFIX_BY_ENCODING[encoding]
+			_, stat_result = self.lookup_path(packed)
+			if stat_result is None:
+				continue
+			response = await super().get_response(packed, scope)
+			response.headers["Content-Encoding"] = encoding
+			media_type = mimetypes.guess_type(path)[0]
+			if media_type:
+				response.headers["Content-Type"] = media_type + ("; charset=utf-8" if media_type.startswith("text/") else "")
+			break
+		else:
+			response = await super().get_response(path, scope)
+		response.headers["Cache-Control"] = _IMMUTABLE
+		response.headers["Vary"] = "Accept-Encoding"
+		return response
+
+
+if __name__ == "__main__":
+	build_static()
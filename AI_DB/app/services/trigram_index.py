@@ -0,0 +1,83 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Tuple
+
+from app.services.matching import _max_distance
+
+
+# Длина n-грамм; токен дополняется (Q - 1) символами с каждой стороны: у токена длины L — L + Q - 1 n-грамм
+Q = 3
+_PAD = "\x00" * (Q - 1)
+
+
+def _qgrams(token: str) -> Dict[str, int]:
+	padded = f"{_PAD}{token}{_PAD}"
+	counts: Dict[str, int] = {}
+	for i in range(len(padded) - Q + 1):
+		g = padded[i:i + Q]
+		counts[g] = counts.get(g, 0) + 1
+	return counts
+
+
+class TrigramIndex:
+	"""Индекс символьных триграмм по словарю лемм.
+	candidates() возвращает токены, которые могут иметь нормированное сходство Левенштейна
+	не ниже min_sim, — без перебора всего словаря. Фильтр по числу общих триграмм: при
+	расстоянии не больше k у токенов не меньше max(len) + Q - 1 - Q·k общих n-грамм
+	(каждая правка портит не более Q из них). Кандидатов остаётся проверить _bounded_norm_sim.
+	"""
+
+	def __init__(self, tokens: Iterable[str] = ()) -> None:
+		self.tokens: List[str] = []
+		self._ids: Dict[str, int] = {}
+		# n-грамма → (id токена, сколько раз она в нём встречается)
+		self._postings: Dict[str, List[Tuple[int, int]]] = {}
+		self._by_len: Dict[int, List[int]] = {}
+		for t in tokens:
+			self.add(t)
+
+	def __len__(self) -> int:
+		return len(self.tokens)
+
+	def __contains__(self, token: str) -> bool:
+		return token in self._ids
+
+	def add(self, token: str) -> int:
+		tid = self._ids.get(token)
+		if tid is not None:
+			return tid
+		tid = len(self.tokens)
+		self.tokens.append(token)
+		self._ids[token] = tid
+		for g, n in _qgrams(token).items():
+			self._postings.setdefault(g, []).append((tid, n))
+		self._by_len.setdefault(len(token), []).append(tid)
+		return tid
+
+	def candidates(self, token: str, min_sim: float) -> List[str]:
+		"""Токены словаря, для которых 1 - d/max(len) >= min_sim не исключено (и сам token, если он есть)."""
+		la = len(token)
+		# сколько общих n-грамм нужно кандидату каждой длины; 0 — фильтр не работает, берём всю длину
+		need: Dict[int, int] = {}
+		for lb in self._by_len:
+			maxlen = max(la, lb) or 1
+			k = _max_distance(maxlen, min_sim)
+			if k < 0 or abs(la - lb) > k:
+				continue
+			need[lb] = max(la, lb) + Q - 1 - Q * k
+		result: List[int] = []
+		if any(n > 0 for n in need.values()):
+			common: Dict[int, int] = {}
+			for g, n in _qgrams(token).items():
+				for tid, m in self._postings.get(g, ()):
+					common[tid] = common.get(tid, 0) + min(n, m)
+			for tid, c in common.items():
+				n = need.get(len(self.tokens[tid]))
+				if n is not None and n > 0 and c >= n:
+					result.append(tid)
+		for lb, n in need.items():
+			if n <= 0:
+				result.extend(self._by_len[lb])
+		own = self._ids.get(token)
+		if own is not None and own not in result:
+			result.append(own)
+		return [self.tokens[tid] for tid in sorted(result)]
@@ -12,24 +12,28 @@ from aiogram.filters import Command
 from aiogram.types import Message, FSInputFile
 
 from app.services.strict_parse import parse_strict_listing, ParseError
-from app.db import session_scope
-from app.repositories.listings import create_listing_from_parsed, list_recent_listings, delete_listing_by_id, get_all_listings, get_listings_filtered
-from app.repositories.reminders import create_reminder, list_active_reminders, cancel_reminder
+from app.db import async_session_scope, session_scope
+from app.repositories.listings import create_listing_from_parsed, delete_listing_by_id_async, get_listing_async, get_listings_by_ids_async, get_listings_filtered, list_recent_listings_async
+from app.repositories.listing_features import upsert_listing_features
+from app.services.match_cache import invalidate_match_caches
+from app.services.match_store import update_matches_for_listings
+from app.repositories.reminders import create_reminder_async, list_active_reminders_async, cancel_reminder_async
 from app.services.export import export_listings_to_excel
 from app.services.storage import save_bytes
 from app.models.photos import Photo
 from app.models.listings import Listing
 from bot.state import set_attach_target, get_attach_target, pop_attach_target
 import structlog
-from app.repositories.audit import list_audit, log_event
-from app.repositories.chat import add_message as chat_add, get_last_messages as chat_get_last
+from app.repositories.audit import list_audit, log_event, log_event_async
+from app.repositories.chat import add_message_async as chat_add, get_last_messages_async as chat_get_last
 from app.services.ai_router import route_text_to_command
 from app.schemas.listing_parse import ParsedListing, ListingType
-from app.services.export import export_listings_to_excel, export_audit_to_excel, export_matches_to_excel
-from app.services.export import import_listings_from_excel
+from app.services.export import export_listings_to_excel, export_audit_to_excel, write_matches_xlsx
+from app.services.export import import_listings_from_excel, read_listing_rows
+from app.services.executor import run_cpu, run_io
 from app.services.text_normalizer import normalize_contact
 from app.config import get_settings
-from app.repositories.access import create_token as access_create, revoke_token as access_revoke, list_tokens as access_list
+from app.repositories.access import create_token_async as access_create, revoke_token_async as access_revoke, list_tokens_async as access_list
 
 
 logger = structlog.get_logger(__name__)
@@ -41,6 +45,73 @@ def _is_admin(user_id: int) -> bool:
 	return bool(settings.admin_chat_id) and settings.admin_chat_id == user_id
 
 
+def _listing_updates(updates: dict) -> tuple[dict, list[str]]:
+	"""Значения полей записи из key=value (команда или ИИ). ValueError — с текстом для пользователя."""
+	values: dict = {}
+	changed: list[str] = []
+	if "title" in updates:
+		values["title"] = updates["title"]
+		changed.append("title")
+	if "description" in updates:
+		values["description"] = updates["description"]
+		changed.append("description")
+	if "characteristics" in updates:
+		import json as _json
+		try:
+			values["characteristics"] = _json.loads(updates["characteristics"]) if updates["characteristics"] else None
+		except Exception:
+			raise ValueError("characteristics: ожидается JSON")
+		changed.append("characteristics")
+	if "quantity" in updates:
+		try:
+			values["quantity"] = int(updates["quantity"]) if updates["quantity"] != "" else None
+		except Exception:
+			raise ValueError("quantity: ожидается целое число")
+		changed.append("quantity")
+	if "price" in updates:
+		try:
+			val = str(updates["price"]).replace(" ", "")
+			values["price"] = Decimal(val) if val != "" else None
+		except Exception:
+			raise ValueError("price: ожидается число")
+		changed.append("price")
+	if "location" in updates:
+		values["location"] = updates["location"] or None
+		changed.append("location")
+	if "contact" in updates:
+		values["contact"] = normalize_contact(updates["contact"]) if updates["contact"] else None
+		changed.append("contact")
+	if "type" in updates:
+		if updates["type"]:
+			values["type"] = updates["type"]
+		changed.append("type")
+	return values, changed
+
+
+def _save_listing_updates(listing_id: int, values: dict, changed: list[str], actor: str) -> bool:
+	# пересчёт признаков и пар записи — вычисления, вызывается через run_io
+	with session_scope() as session:
+		item = session.get(Listing, listing_id)
+		if not item:
+			return False
+		for key, value in values.items():
+			setattr(item, key, value)
+		upsert_listing_features(session, item, update_matches=False)
+		update_matches_for_listings(session, [item])
+		log_event(session, action="update", resource="listing", actor=actor, payload={"listing_id": item.id, "changed": changed})
+	# кэши сбрасываются после фиксации транзакции, один раз
+	invalidate_match_caches()
+	return True
+
+
+def _create_listing(parsed: ParsedListing, actor: str) -> Listing:
+	# создание с расчётом признаков и пар — через run_io
+	with session_scope() as session:
+		listing = create_listing_from_parsed(session, parsed)
+		log_event(session, action="create", resource="listing", actor=actor, payload={"listing_id": listing.id, "title": listing.title, "type": listing.type})
+	return listing
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message) -> None:
 	await message.answer(
@@ -49,6 +120,7 @@ async def cmd_start(message: Message) -> None:
 		"/добавить <текст> — распознать и сохранить запись\n"
 		"/прикрепить <id> — прикрепить фото к записи\n"
 		"/список — последние записи\n"
+		"/найти <запрос> — поиск по наименованию, описанию и характеристикам\n"
 		"/удалить <id> — удалить запись\n"
 		"/экспорт [город] [тип] [мин_цена] [макс_цена] — экспорт в Excel\n"
 		"/напомнить <дата время> <текст> — создать напоминание\n"
@@ -74,13 +146,14 @@ async def cmd_help(message: Message) -> None:
 		"/прикрепить <id> — выбрать запись, затем отправьте одно/несколько фото сообщениями\n\n"
 		"3) Управление\n"
 		"/список — последние записи\n"
+		"/найти <запрос> — поиск записей\n"
 		"/удалить <id> — удалить запись\n"
 		"/изменить <id> key=value [key=value ...] — обновить поля записи\n\n"
 		"4) Экспорт\n"
 		"/экспорт [город] [тип] [мин_цена] [макс_цена] — Excel в чат\n\n"
 		"5) Совпадения\n"
 		"/совпадения — расчёт совпадений и Excel-отчёт (по умолчанию: порог 0.45; веса — наименование 0.60, характеристики 0.20, город 0.15, цена 0.05; допуски цены — не заданы; порог нечёткого совпадения названия 0.60).\n"
-		"Можно задать параметры: /совпадения <порог> <w_title> <w_char> <w_loc> <w_price> <абс_допуск_₽> <допуск_%> <fuzzy_порог>\n\n"
+		"Можно задать параметры: /совпадения <порог> <w_title> <w_char> <w_loc> <w_price> <абс_допуск_₽> <допуск_%> <fuzzy_порог> <лучших_на_спрос> <всего_пар>\n\n"
 		"6) Напоминания\n"
 		"/напомнить <дата время> <текст> — создать\n"
 		"Форматы: HH:MM | dd.mm HH:MM | dd.mm.yy HH:MM | YYYY-MM-DD HH:MM | YYYY-MM-DDTHH:MM\n"
@@ -372,8 +445,10 @@ async def cmd_audit(message: Message) -> None:
 			date_to = datetime.strptime(parts[2], "%Y-%m-%d")
 		except Exception:
 			date_to = None
-	with session_scope() as session:
-		rows = list_audit(session, date_from=date_from, date_to=date_to)
+	def _load():
+		with session_scope() as session:
+			return list_audit(session, date_from=date_from, date_to=date_to)
+	rows = await run_io(_load)
 	if not rows:
 		await message.answer("Журнал пуст за указанный период.")
 		return
@@ -381,7 +456,7 @@ async def cmd_audit(message: Message) -> None:
 	from pathlib import Path
 	stamp = _dt.now(ZoneInfo("Asia/Tashkent")).strftime("%Y%m%d_%H%M%S")
 	out_path = Path.cwd() / f"audit_{stamp}.xlsx"
-	export_audit_to_excel(rows, out_path)
+	await run_io(export_audit_to_excel, rows, out_path)
 	try:
 		await message.answer_document(FSInputFile(path=out_path), caption=f"Журнал: {len(rows)} записей")
 	finally:
@@ -479,55 +554,14 @@ async def cmd_edit(message: Message) -> None:
 	if not updates:
 		await message.answer("Нет полей для обновления. Разрешены: title, description, characteristics, quantity, price, location, contact, type")
 		return
-	allowed = {"title", "description", "characteristics", "quantity", "price", "location", "contact", "type"}
-	with session_scope() as session:
-		item = session.get(Listing, listing_id)
-		if not item:
-			await message.answer("Запись не найдена")
-			return
-		changed: list[str] = []
-		if "title" in updates:
-			item.title = updates["title"]
-			changed.append("title")
-		if "description" in updates:
-			item.description = updates["description"]
-			changed.append("description")
-		if "characteristics" in updates:
-			import json as _json
-			try:
-				item.characteristics = _json.loads(updates["characteristics"]) if updates["characteristics"] else None
-			except Exception:
-				await message.answer("characteristics: ожидается JSON")
-				return
-			changed.append("characteristics")
-		if "quantity" in updates:
-			try:
-				item.quantity = int(updates["quantity"]) if updates["quantity"] != "" else None
-			except Exception:
-				await message.answer("quantity: ожидается целое число")
-				return
-			changed.append("quantity")
-		if "price" in updates:
-			from decimal import Decimal as _Dec
-			try:
-				val = updates["price"].replace(" ", "")
-				item.price = _Dec(val) if val != "" else None
-			except Exception:
-				await message.answer("price: ожидается число")
-				return
-			changed.append("price")
-		if "location" in updates:
-			item.location = updates["location"] or None
-			changed.append("location")
-		if "contact" in updates:
-			item.contact = normalize_contact(updates["contact"]) if updates["contact"] else None
-			changed.append("contact")
-		if "type" in updates:
-			item.type = updates["type"] or item.type
-			changed.append("type")
-		# аудит
-		from app.repositories.audit import log_event as _log
-		_log(session, action="update", resource="listing", actor=str(message.from_user.id), payload={"listing_id": item.id, "changed": changed})
+	try:
+		values, changed = _listing_updates(updates)
+	except ValueError as exc:
+		await message.answer(str(exc))
+		return
+	if not await run_io(_save_listing_updates, listing_id, values, changed, str(message.from_user.id)):
+		await message.answer("Запись не найдена")
+		return
 	await message.answer(f"Обновлено #{listing_id}: {', '.join(changed) if changed else 'без изменений'}")
 
 
@@ -579,8 +613,8 @@ async def cmd_grant(message: Message) -> None:
 	expires_at = None
 	if expire_minutes and expire_minutes > 0:
 		expires_at = datetime.now(ZoneInfo("Asia/Tashkent")) + timedelta(minutes=expire_minutes)
-	with session_scope() as session:
-		t = access_create(session, expires_at)
+	async with async_session_scope() as session:
+		t = await access_create(session, expires_at)
 	settings = get_settings()
 	base = settings.web_base_url.strip() if settings.web_base_url else f"http://localhost:{settings.app_port}"
 	await message.answer(f"Токен создан:\n{t.token}\n\nСсылка: {base}/web/?token={t.token}\nИстекает: {t.expires_at or 'без срока'}")
@@ -618,8 +652,8 @@ async def cmd_revoke(message: Message) -> None:
 		await message.answer("Использование: /revoke <token>")
 		return
 	value = parts[1].strip()
-	with session_scope() as session:
-		ok = access_revoke(session, value)
+	async with async_session_scope() as session:
+		ok = await access_revoke(session, value)
 	await message.answer("Отозвано" if ok else "Токен не найден")
 
 
@@ -668,10 +702,7 @@ async def cmd_add(message: Message) -> None:
 	logger.info("cmd_add_received", user_id=message.from_user.id, text=payload)
 	try:
 		parsed = parse_strict_listing(payload)
-		with session_scope() as session:
-			listing = create_listing_from_parsed(session, parsed)
-			# audit
-			log_event(session, action="create", resource="listing", actor=str(message.from_user.id), payload={"listing_id": listing.id, "title": listing.title, "type": listing.type})
+		listing = await run_io(_create_listing, parsed, str(message.from_user.id))
 		logger.info("listing_created", listing_id=listing.id, title=listing.title, type=listing.type)
 		await message.answer(
 			f"Сохранено: id={listing.id}\n"
@@ -719,8 +750,8 @@ async def cmd_attach_ru_slash_with_params(message: Message) -> None:
 @router.message(Command("list"))
 async def cmd_list(message: Message) -> None:
 	limit = 10
-	with session_scope() as session:
-		items = list_recent_listings(session, limit=limit)
+	async with async_session_scope() as session:
+		items = await list_recent_listings_async(session, limit=limit)
 	if not items:
 		await message.answer("Записей пока нет.")
 		return
@@ -746,6 +777,37 @@ async def cmd_list_ru3(message: Message) -> None:
 	await cmd_list(message)
 
 
+@router.message(Command("search"))
+async def cmd_search(message: Message) -> None:
+	parts = (message.text or "").strip().split(maxsplit=1)
+	if len(parts) < 2 or not parts[1].strip():
+		await message.answer("Использование: /найти <запрос>")
+		return
+	from app.services.search import search_listing_ids
+	limit = 10
+	found = await search_listing_ids(parts[1])
+	if not found:
+		await message.answer("Ничего не найдено.")
+		return
+	async with async_session_scope() as session:
+		items = await get_listings_by_ids_async(session, found[:limit])
+	lines = [f"Найдено: {len(found)}" + (f", показаны первые {limit}" if len(found) > limit else "")]
+	for it in items:
+		lines.append(f"#{it.id}: {it.title} | {it.type} | {it.location or '-'} | {it.price or '-'}")
+	await message.answer("\n".join(lines))
+
+
+# Алиасы для команды поиска
+@router.message(F.text.casefold().startswith("/найти"))
+async def cmd_search_ru_slash(message: Message) -> None:
+	await cmd_search(message)
+
+
+@router.message(F.text.casefold().startswith("найти "))
+async def cmd_search_ru(message: Message) -> None:
+	await cmd_search(message)
+
+
 @router.message(Command("delete"))
 async def cmd_delete(message: Message) -> None:
 	text = (message.text or "").strip()
@@ -758,10 +820,10 @@ async def cmd_delete(message: Message) -> None:
 	except Exception:
 		await message.answer("ID должен быть числом.")
 		return
-	with session_scope() as session:
-		ok = delete_listing_by_id(session, listing_id)
+	async with async_session_scope() as session:
+		ok = await delete_listing_by_id_async(session, listing_id)
 		if ok:
-			log_event(session, action="delete", resource="listing", actor=str(message.from_user.id), payload={"listing_id": listing_id})
+			await log_event_async(session, action="delete", resource="listing", actor=str(message.from_user.id), payload={"listing_id": listing_id})
 	logger.info("listing_deleted", listing_id=listing_id, deleted=ok)
 	await message.answer("Удалено" if ok else "Запись не найдена")
 
@@ -800,13 +862,16 @@ async def cmd_export(message: Message) -> None:
 		except Exception:
 			price_max = None
 
-	with session_scope() as session:
-		items = get_listings_filtered(session, city=city, listing_type=listing_type, price_min=price_min, price_max=price_max)
-		ids = [it.id for it in items]
-		photos_map = {}
-		if ids:
-			for p in session.query(Photo).filter(Photo.listing_id.in_(ids)).all():
-				photos_map.setdefault(p.listing_id, []).append(p.url)
+	def _load():
+		with session_scope() as session:
+			items = get_listings_filtered(session, city=city, listing_type=listing_type, price_min=price_min, price_max=price_max)
+			ids = [it.id for it in items]
+			photos_map = {}
+			if ids:
+				for p in session.query(Photo).filter(Photo.listing_id.in_(ids)).all():
+					photos_map.setdefault(p.listing_id, []).append(p.url)
+			return items, photos_map
+	items, photos_map = await run_io(_load)
 	if not items:
 		await message.answer("Нет данных по заданным фильтрам.")
 		return
@@ -814,7 +879,7 @@ async def cmd_export(message: Message) -> None:
 	filename = f"export_{stamp}.xlsx"
 	out_path = Path.cwd() / filename
 	logger.info("export_started", count=len(items), city=city, type=listing_type, price_min=str(price_min) if price_min else None, price_max=str(price_max) if price_max else None)
-	export_listings_to_excel(items, out_path, listing_id_to_photos=photos_map)
+	await run_io(export_listings_to_excel, items, out_path, listing_id_to_photos=photos_map)
 	try:
 		await message.answer_document(FSInputFile(path=out_path), caption=f"Экспорт: {len(items)} записей")
 	finally:
@@ -838,7 +903,7 @@ async def cmd_export_ru_slash_with_params(message: Message) -> None:
 
 @router.message(Command("matches"))
 async def cmd_matches(message: Message) -> None:
-    # Формат: /matches [порог] [w_title] [w_char] [w_loc] [w_price] [abs] [pct] [fuzzy]
+    # Формат: /matches [порог] [w_title] [w_char] [w_loc] [w_price] [abs] [pct] [fuzzy] [top_k] [max_pairs]
     # Русские алиасы перехватываются ниже
     parts = (message.text or "").strip().split()
     def _f(i: int, default: float | None) -> float | None:
@@ -854,48 +919,39 @@ async def cmd_matches(message: Message) -> None:
     abs_tol = _f(6, None)
     pct_tol = _f(7, None)
     fuzzy_thr = _f(8, 0.60) or 0.60
+    # 0 или не задано — без ограничения
+    top_k = int(_f(9, 0) or 0)
+    max_pairs = int(_f(10, 0) or 0)
 
-    from app.services.matching import group_listings, find_matches
-    with session_scope() as session:
-        items = get_all_listings(session)
-    demands, sales = group_listings(items)
+    from app.services.match_cache import stream_matches
     from decimal import Decimal as _Dec
-    pairs = find_matches(
-        demands,
-        sales,
-        threshold=threshold,
-        w_title=w_title,
-        w_char=w_char,
-        w_loc=w_loc,
-        w_price=w_price,
-        price_tolerance_abs=_Dec(abs_tol) if abs_tol is not None else None,
-        price_tolerance_pct=pct_tol,
-        fuzzy_token_threshold=fuzzy_thr,
-    )
-    if not pairs:
-        await message.answer("Совпадений не найдено по заданным параметрам.")
-        return
     from datetime import datetime as _dt
     from pathlib import Path as _Path
-    rows = []
-    for p in pairs:
-        rows.append({
-            "demand_id": p.Demand.id,
-            "demand_title": p.Demand.title,
-            "demand_location": p.Demand.location,
-            "demand_price": float(p.Demand.price) if p.Demand.price is not None else None,
-            "demand_contact": p.Demand.contact,
-            "sale_id": p.Sale.id,
-            "sale_title": p.Sale.title,
-            "sale_location": p.Sale.location,
-            "sale_price": float(p.Sale.price) if p.Sale.price is not None else None,
-            "sale_contact": p.Sale.contact,
-            "score": round(p.score, 3),
-        })
     out = _Path.cwd() / f"matches_{_dt.now(ZoneInfo('Asia/Tashkent')).strftime('%Y%m%d_%H%M%S')}.xlsx"
-    export_matches_to_excel(rows, out)
+    # пары пишутся в файл потоком (из кэша, таблицы matches или расчёта блоками) — в пуле потоков
+    def _export() -> int:
+        with session_scope() as session:
+            pairs = stream_matches(
+                session,
+                threshold=threshold,
+                w_title=w_title,
+                w_char=w_char,
+                w_loc=w_loc,
+                w_price=w_price,
+                price_tolerance_abs=_Dec(abs_tol) if abs_tol is not None else None,
+                price_tolerance_pct=pct_tol,
+                fuzzy_token_threshold=fuzzy_thr,
+                top_k_per_demand=top_k,
+                max_pairs=max_pairs,
+            )
+            return write_matches_xlsx(pairs, out)
+    count = await run_io(_export)
+    if not count:
+        out.unlink(missing_ok=True)
+        await message.answer("Совпадений не найдено по заданным параметрам.")
+        return
     try:
-        await message.answer_document(FSInputFile(path=out), caption=f"Совпадения: {len(rows)} пар")
+        await message.answer_document(FSInputFile(path=out), caption=f"Совпадения: {count} пар")
     finally:
         try:
             out.unlink(missing_ok=True)
@@ -979,8 +1035,8 @@ async def cmd_remind(message: Message) -> None:
     if not msg_text:
         await message.answer("Добавьте текст напоминания после даты и времени")
         return
-    with session_scope() as session:
-        rem = create_reminder(session, text=msg_text, remind_at=when, user_id=message.from_user.id)
+    async with async_session_scope() as session:
+        rem = await create_reminder_async(session, text=msg_text, remind_at=when, user_id=message.from_user.id)
     await message.answer(f"Напоминание создано: id={rem.id}, на {when.strftime('%Y-%m-%d %H:%M')}")
 
 
@@ -997,8 +1053,8 @@ async def cmd_remind_ru_slash_with_params(message: Message) -> None:
 
 @router.message(Command("reminders"))
 async def cmd_reminders(message: Message) -> None:
-    with session_scope() as session:
-        items = list_active_reminders(session)
+    async with async_session_scope() as session:
+        items = await list_active_reminders_async(session)
     if not items:
         await message.answer("Активных напоминаний нет.")
         return
@@ -1036,8 +1092,8 @@ async def cmd_cancel_reminder(message: Message) -> None:
     except Exception:
         await message.answer("ID должен быть числом.")
         return
-    with session_scope() as session:
-        ok = cancel_reminder(session, rid)
+    async with async_session_scope() as session:
+        ok = await cancel_reminder_async(session, rid)
     await message.answer("Отменено" if ok else "Не найдено или уже отправлено")
 
 
@@ -1065,8 +1121,10 @@ async def cmd_cancel_reminder_ru2_slash_with_params(message: Message) -> None:
 @router.message(Command("diagnose"))
 async def cmd_diagnose(message: Message) -> None:
     from app.services.diagnostics import run_diagnostics
-    with session_scope() as session:
-        text, issues = run_diagnostics(session)
+    def _diagnose() -> str:
+        with session_scope() as session:
+            return run_diagnostics(session)[0]
+    text = await run_io(_diagnose)
     # Телеграм ограничивает длину сообщения ~4К — порежем при необходимости
     if len(text) > 3500:
         text = text[:3500] + "\n... (обрезано)"
@@ -1104,8 +1162,8 @@ async def cmd_tokens(message: Message) -> None:
 	if not _is_admin(message.from_user.id):
 		await message.answer("Команда доступна только администратору.")
 		return
-	with session_scope() as session:
-		items = access_list(session)
+	async with async_session_scope() as session:
+		items = await access_list(session)
 	if not items:
 		await message.answer("Токенов нет")
 		return
@@ -1152,18 +1210,22 @@ async def on_photo(message: Message) -> None:
 	content = file_bytes.getvalue()
 	filename = f"{target_id}_{photo.file_unique_id}.jpg"
 	key, url = save_bytes(filename, content)
-	with session_scope() as session:
+	async with async_session_scope() as session:
 		p = Photo(listing_id=target_id, s3_key=key, url=url, size_bytes=len(content))
 		session.add(p)
-		listing = session.get(Listing, target_id)
+		listing = await get_listing_async(session, target_id)
 		if listing is not None:
 			links = list(listing.photo_links or [])
 			if url not in links:
 				links.append(url)
 			listing.photo_links = links
+			await session.flush()
+			# фото на признаки не влияет: отмечаем их актуальными для нового updated_at, иначе при
+			# старте refresh_stale_features сочтёт запись устаревшей и matches пересчитаются целиком
+			if listing.features is not None:
+				listing.features.listing_updated_at = listing.updated_at
 			# audit
-			log_event(session, action="attach_photo", resource="listing", actor=str(user_id), payload={"listing_id": target_id, "url": url})
-		session.commit()
+			await log_event_async(session, action="attach_photo", resource="listing", actor=str(user_id), payload={"listing_id": target_id, "url": url})
 	logger.info("photo_attached", listing_id=target_id, url=url)
 	await message.answer(f"Фото сохранено и привязано к записи #{target_id}. Ссылка: {url}")
 
@@ -1181,8 +1243,12 @@ async def on_document(message: Message) -> None:
 		tmp = _Path.cwd() / f"import_{doc.file_unique_id}.xlsx"
 		tmp.write_bytes(file_bytes.getvalue())
 		try:
-			with session_scope() as session:
-				n = import_listings_from_excel(session, tmp)
+			# разбор файла — в пуле процессов, запись в БД — в пуле потоков
+			rows = await run_cpu(read_listing_rows, tmp)
+			def _import() -> int:
+				with session_scope() as session:
+					return import_listings_from_excel(session, tmp, rows=rows)
+			n = await run_io(_import)
 			await message.answer(f"Импорт завершён: обработано {n} строк.")
 		finally:
 			try:
@@ -1197,13 +1263,13 @@ async def on_document(message: Message) -> None:
 @router.message(F.text & ~F.text.startswith("/"))
 async def ai_fallback(message: Message) -> None:
 	# Сохраняем сообщение пользователя
-	with session_scope() as session:
-		chat_add(session, message.from_user.id, "user", message.text or "")
-		history = chat_get_last(session, message.from_user.id, limit=10)
+	async with async_session_scope() as session:
+		await chat_add(session, message.from_user.id, "user", message.text or "")
+		history = await chat_get_last(session, message.from_user.id, limit=10)
 
 	# Вызов LLM для выбора команды/аргументов/уточнения
 	packed_history = [(m.role, m.text) for m in history]
-	result = route_text_to_command(packed_history, message.text or "")
+	result = await run_io(route_text_to_command, packed_history, message.text or "")
 	if "error" in result:
 		await message.answer("Не удалось обработать запрос ИИ. Попробуйте переформулировать.")
 		return
@@ -1211,8 +1277,8 @@ async def ai_fallback(message: Message) -> None:
 	raw = (result.get("raw") or "").strip()
 	if not raw:
 		await message.answer("Не удалось понять запрос. Уточните, пожалуйста.")
-		with session_scope() as s2:
-			chat_add(s2, message.from_user.id, "assistant", "Не удалось понять запрос. Уточните, пожалуйста.")
+		async with async_session_scope() as s2:
+			await chat_add(s2, message.from_user.id, "assistant", "Не удалось понять запрос. Уточните, пожалуйста.")
 		return
 
 	# Пытаемся извлечь JSON (срезаем возможные код-блоки ```)
@@ -1230,8 +1296,8 @@ async def ai_fallback(message: Message) -> None:
 		data = _json.loads(jtxt)
 	except Exception:
 		await message.answer(raw[:1000])
-		with session_scope() as s2:
-			chat_add(s2, message.from_user.id, "assistant", raw[:1000])
+		async with async_session_scope() as s2:
+			await chat_add(s2, message.from_user.id, "assistant", raw[:1000])
 		return
 
 	command = (data.get("command") or "").strip().lower()
@@ -1240,8 +1306,8 @@ async def ai_fallback(message: Message) -> None:
 	clarify = (data.get("clarify_question") or "").strip()
 	if need_clarify and clarify:
 		await message.answer(clarify)
-		with session_scope() as s2:
-			chat_add(s2, message.from_user.id, "assistant", clarify)
+		async with async_session_scope() as s2:
+			await chat_add(s2, message.from_user.id, "assistant", clarify)
 		return
 
 	# Выполняем команду без модификации message.text
@@ -1258,9 +1324,8 @@ async def ai_fallback(message: Message) -> None:
 			await message.answer("Чтобы импортировать, отправьте Excel-файл (.xlsx) в чат — я его загружу и объединю с базой.")
 		elif command == "delete":
 			listing_id = int(args.get("id"))
-			from app.repositories.listings import delete_listing_by_id
-			with session_scope() as s2:
-				ok = delete_listing_by_id(s2, listing_id)
+			async with async_session_scope() as s2:
+				ok = await delete_listing_by_id_async(s2, listing_id)
 			await message.answer("Удалено" if ok else "Запись не найдена")
 		elif command == "attach":
 			listing_id = int(args.get("id"))
@@ -1282,20 +1347,23 @@ async def ai_fallback(message: Message) -> None:
 			ltype = args.get("type") or None
 			pmin_d = _to_dec(args.get("price_min"))
 			pmax_d = _to_dec(args.get("price_max"))
-			with session_scope() as s2:
-				items = _flt(s2, city=city, listing_type=ltype, price_min=pmin_d, price_max=pmax_d)
-				ids = [it.id for it in items]
-				photos_map = {}
-				if ids:
-					for p in s2.query(_Photo).filter(_Photo.listing_id.in_(ids)).all():
-						photos_map.setdefault(p.listing_id, []).append(p.url)
+			def _load():
+				with session_scope() as s2:
+					items = _flt(s2, city=city, listing_type=ltype, price_min=pmin_d, price_max=pmax_d)
+					ids = [it.id for it in items]
+					photos_map = {}
+					if ids:
+						for p in s2.query(_Photo).filter(_Photo.listing_id.in_(ids)).all():
+							photos_map.setdefault(p.listing_id, []).append(p.url)
+					return items, photos_map
+			items, photos_map = await run_io(_load)
 			if not items:
 				await message.answer("Нет данных по заданным фильтрам.")
 			else:
 				from datetime import datetime as _dt
 				from pathlib import Path as _Path
 				out = _Path.cwd() / f"export_{_dt.now(ZoneInfo('Asia/Tashkent')).strftime('%Y%m%d_%H%M%S')}.xlsx"
-				_xlsx(items, out, listing_id_to_photos=photos_map)
+				await run_io(_xlsx, items, out, listing_id_to_photos=photos_map)
 				try:
 					await message.answer_document(FSInputFile(path=out), caption=f"Экспорт: {len(items)} записей")
 				finally:
@@ -1399,68 +1467,26 @@ async def ai_fallback(message: Message) -> None:
 				if when_dt is None:
 					await message.answer("Не удалось разобрать дату/время. Пример: сегодня 14:30, завтра 09:00, среда 10:15, 21.08 10:00, через 5 минут")
 				else:
-					with session_scope() as s2:
-						rem = create_reminder(s2, text=text_body, remind_at=when_dt, user_id=message.from_user.id)
+					async with async_session_scope() as s2:
+						rem = await create_reminder_async(s2, text=text_body, remind_at=when_dt, user_id=message.from_user.id)
 					await message.answer(f"Напоминание создано: id={rem.id}, на {when_dt.strftime('%Y-%m-%d %H:%M')}")
 		elif command == "cancel_reminder":
 			rid = int(args.get("id"))
-			with session_scope() as s2:
-				ok = cancel_reminder(s2, rid)
+			async with async_session_scope() as s2:
+				ok = await cancel_reminder_async(s2, rid)
 			await message.answer("Отменено" if ok else "Не найдено или уже отправлено")
 		elif command == "edit":
 			listing_id = int(args.get("id"))
 			updates = args.get("updates") or {}
-			with session_scope() as s2:
-				item = s2.get(Listing, listing_id)
-				if not item:
-					await message.answer("Запись не найдена")
-				else:
-					changed = []
-					if "title" in updates:
-						item.title = updates["title"]
-						changed.append("title")
-					if "description" in updates:
-						item.description = updates["description"]
-						changed.append("description")
-					if "characteristics" in updates:
-						import json as _json2
-						try:
-							item.characteristics = _json2.loads(updates["characteristics"]) if updates["characteristics"] else None
-						except Exception:
-							await message.answer("characteristics: ожидается JSON")
-							s2.rollback()
-							return
-						changed.append("characteristics")
-					if "quantity" in updates:
-						try:
-							item.quantity = int(updates["quantity"]) if updates["quantity"] != "" else None
-						except Exception:
-							await message.answer("quantity: ожидается целое число")
-							s2.rollback()
-							return
-						changed.append("quantity")
-					if "price" in updates:
-						from decimal import Decimal as _Dec2
-						try:
-							val = str(updates["price"]).replace(" ", "")
-							item.price = _Dec2(val) if val != "" else None
-						except Exception:
-							await message.answer("price: ожидается число")
-							s2.rollback()
-							return
-						changed.append("price")
-					if "location" in updates:
-						item.location = updates["location"] or None
-						changed.append("location")
-					if "contact" in updates:
-						item.contact = normalize_contact(updates["contact"]) if updates["contact"] else None
-						changed.append("contact")
-					if "type" in updates:
-						item.type = updates["type"] or item.type
-						changed.append("type")
-					from app.repositories.audit import log_event as _log
-					_log(s2, action="update", resource="listing", actor=str(message.from_user.id), payload={"listing_id": item.id, "changed": changed})
-					await message.answer(f"Обновлено #{listing_id}: {', '.join(changed) if changed else 'без изменений'}")
+			try:
+				values, changed = _listing_updates(updates)
+			except ValueError as exc:
+				await message.answer(str(exc))
+				return
+			if not await run_io(_save_listing_updates, listing_id, values, changed, str(message.from_user.id)):
+				await message.answer("Запись не найдена")
+			else:
+				await message.answer(f"Обновлено #{listing_id}: {', '.join(changed) if changed else 'без изменений'}")
 		elif command == "add":
 			# Нормализация аргументов ИИ (русские синонимы и форматирование)
 			def _map_type(v: str | None) -> ListingType | None:
@@ -1519,8 +1545,8 @@ async def ai_fallback(message: Message) -> None:
 			ptype = _map_type(args.get("type"))
 			if ptype is None:
 				await message.answer("Уточните тип: продажа/покупка/контракт")
-				with session_scope() as s2:
-					chat_add(s2, message.from_user.id, "assistant", "Уточните тип: продажа/покупка/контракт")
+				async with async_session_scope() as s2:
+					await chat_add(s2, message.from_user.id, "assistant", "Уточните тип: продажа/покупка/контракт")
 				return
 
 			# Подстраховка извлечения из исходного текста
@@ -1533,8 +1559,8 @@ async def ai_fallback(message: Message) -> None:
 					title_val = hdr
 				else:
 					await message.answer("Уточните наименование (что именно?): например, \"Фонарик\"")
-					with session_scope() as s2:
-						chat_add(s2, message.from_user.id, "assistant", "Уточните наименование (что именно?)")
+					async with async_session_scope() as s2:
+						await chat_add(s2, message.from_user.id, "assistant", "Уточните наименование (что именно?)")
 					return
 
 			# Извлечение города, если отсутствует
@@ -1556,9 +1582,7 @@ async def ai_fallback(message: Message) -> None:
 				photo_links=args.get("photo_links"),
 				type=ptype,
 			)
-			with session_scope() as s2:
-				listing = create_listing_from_parsed(s2, pl)
-				log_event(s2, action="create", resource="listing", actor=str(message.from_user.id), payload={"listing_id": listing.id, "title": listing.title, "type": listing.type})
+			listing = await run_io(_create_listing, pl, str(message.from_user.id))
 			await message.answer(
 				f"Сохранено: id={listing.id}\n"
 				f"Наименование: {listing.title}\n"
@@ -1573,8 +1597,8 @@ async def ai_fallback(message: Message) -> None:
 		await message.answer(f"Ошибка выполнения: {exc}")
 
 	# Сохраняем ответ ассистента в историю
-	with session_scope() as session:
-		chat_add(session, message.from_user.id, "assistant", "(команда выполнена)")
+	async with async_session_scope() as session:
+		await chat_add(session, message.from_user.id, "assistant", "(команда выполнена)")
 
 
 # Алиасы для команды идентификации
@@ -7,6 +7,9 @@ from aiogram.client.default import DefaultBotProperties
 from app.config import get_settings
 from bot.handlers import router as bot_router
 from app.logging_config import setup_logging
+from app.services.matching import warm_up as matching_warm_up
+from app.services.executor import cpu_executor, shutdown_executors
+from app.db import dispose_async_engine
 import structlog
 
 
@@ -22,10 +25,16 @@ async def main() -> None:
 	bot = Bot(token=settings.telegram_bot_token, default=DefaultBotProperties(parse_mode=None))
 	dp = Dispatcher()
 	dp.include_router(bot_router)
+	matching_warm_up()
+	cpu_executor().warm_up()
 
 	await bot.delete_webhook(drop_pending_updates=True)
 	logger.info("bot_starting", mode="polling")
-	await dp.start_polling(bot)
+	try:
+		await dp.start_polling(bot)
+	finally:
+		shutdown_executors()
+		await dispose_async_engine()
 
 
 if __name__ == "__main__":
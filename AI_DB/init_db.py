@@ -10,9 +10,9 @@ from pathlib import Path
 # Добавляем корневую директорию в путь
 sys.path.insert(0, str(Path(__file__).parent))
 
-from app.db import Base, engine
+from app.db import Base, engine, ensure_search_index, ensure_trigram_index
 from app.models import (
-    User, Listing, Photo, Reminder, ChatMessage, 
+    User, Listing, ListingFeatures, ListingSignature, Match, MatchStoreState, Photo, Reminder, ChatMessage, 
     AuditLog, AccessToken
 )
 
@@ -24,6 +24,14 @@ def init_database():
         # Создаем все таблицы
         Base.metadata.create_all(bind=engine)
         print("✅ Таблицы успешно созданы!")
+        if ensure_trigram_index():
+            print("✅ pg_trgm и индекс по наименованиям готовы")
+        else:
+            print("⚠️ pg_trgm недоступен — кандидаты совпадений будут отбираться в приложении")
+        if ensure_search_index():
+            print("✅ Полнотекстовый индекс записей (tsvector, GIN) готов")
+        else:
+            print("⚠️ Полнотекстовый поиск недоступен — поиск будет идти полным перебором в приложении")
         
         # Проверяем созданные таблицы
         from sqlalchemy import inspect
@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# шаблоны и статика в приложении указаны относительными путями — от корня проекта
+os.chdir(ROOT)
+
+
+@pytest.fixture
+def session():
+	"""Сессия на пустой SQLite в памяти со схемой приложения."""
+	import app.models  # noqa: F401
+	from app.db import Base
+	engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+	Base.metadata.create_all(engine)
+	s = sessionmaker(bind=engine, expire_on_commit=False)()
+	try:
+		yield s
+	finally:
+		s.close()
+		engine.dispose()
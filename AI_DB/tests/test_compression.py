@@ -0,0 +1,85 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.testclient import TestClient
+
+from app.services.compression import BROTLI_AVAILABLE, CompressionMiddleware, accepted_encodings
+
+
+PAGE = "<p>привет</p>" * 200
+
+
+@pytest.fixture
+def client():
+	a = FastAPI()
+	a.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+	@a.api_route("/page", methods=["GET", "HEAD"])
+	def page():
+		return HTMLResponse(PAGE)
+
+	@a.get("/small")
+	def small():
+		return HTMLResponse("<p>hi</p>")
+
+	@a.get("/json")
+	def data():
+		return JSONResponse({"x": list(range(1000))})
+
+	@a.get("/text")
+	def text():
+		return Response("x" * 5000, media_type="text/plain")
+
+	@a.get("/not-modified")
+	def not_modified():
+		return Response(status_code=304, headers={"ETag": 'W/"1"'})
+
+	return TestClient(a)
+
+
+def test_accepted_encodings():
+	assert accepted_encodings("gzip, deflate") == ["gzip"]
+	assert accepted_encodings("br;q=0, gzip") == ["gzip"]
+	assert accepted_encodings("identity") == []
+	assert accepted_encodings("gzip;q=0") == []
+	assert accepted_encodings("*") == (["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"])
+
+
+@pytest.mark.skipif(not BROTLI_AVAILABLE, reason="brotli не установлен")
+def test_brotli_preferred(client):
+	r = client.get("/page", headers={"Accept-Encoding": "gzip, br"})
+	assert r.headers["content-encoding"] == "br"
+	assert r.headers["vary"] == "Accept-Encoding"
+	# тело раскодировано клиентом; Content-Length — длина сжатого
+	assert r.text == PAGE
+	assert int(r.headers["content-length"]) < len(PAGE.encode())
+
+
+def test_gzip(client):
+	r = client.get("/json", headers={"Accept-Encoding": "br;q=0, gzip"})
+	assert r.headers["content-encoding"] == "gzip"
+	assert r.json() == {"x": list(range(1000))}
+	r = client.get("/page", headers={"Accept-Encoding": "gzip"})
+	assert r.headers["content-encoding"] == "gzip"
+	assert int(r.headers["content-length"]) < len(PAGE.encode())
+	assert r.text == PAGE
+
+
+def test_not_compressed(client):
+	r = client.get("/page", headers={"Accept-Encoding": "identity"})
+	assert "content-encoding" not in r.headers
+	assert r.headers["vary"] == "Accept-Encoding"
+	assert int(r.headers["content-length"]) == len(PAGE.encode())
+	r = client.get("/small", headers={"Accept-Encoding": "gzip"})
+	assert "content-encoding" not in r.headers
+	r = client.get("/text", headers={"Accept-Encoding": "gzip"})
+	assert "content-encoding" not in r.headers
+	r = client.get("/not-modified", headers={"Accept-Encoding": "gzip"})
+	assert r.status_code == 304 and "content-encoding" not in r.headers
+
+
+def test_head_keeps_content_length(client):
+	r = client.head("/page", headers={"Accept-Encoding": "gzip"})
+	assert r.status_code == 200
+	assert "content-encoding" not in r.headers
+	assert int(r.headers["content-length"]) == len(PAGE.encode())
@@ -0,0 +1,153 @@
+from dataclasses import asdict
+from decimal import Decimal
+
+from app.config import Settings
+from app.models.listings import Listing
+from app.models.matches import Match
+from app.repositories.listing_features import refresh_stale_features, upsert_listing_features
+from app.services import match_store
+from app.services.export import import_listings_from_excel
+from app.services.match_store import covers, ensure_matches, rebuild_matches, stored_params, update_matches_for_listings
+from app.services.matching import MatchParams
+
+
+LISTINGS = [
+	("demand", "Форма для бетонного кольца", "Москва", 20000, {"размер": "1"}),
+	("sale", "Форма кольца бетонного КС-10", "Москва", 21000, {"размер": "1"}),
+	("sale", "Форма для кольца", "Пенза", 15000, None),
+	("demand", "Труба стальная 57 мм", "Казань", 5000, None),
+	("sale", "Труба 57 сталь", "Казань", 5200, None),
+	("sale", "Труба пластиковая", "Москва", 900, None),
+	("demand", "Кирпич красный", "Пенза", None, None),
+	("sale", "Кирпич красный облицовочный", "Пенза", 30, {"марка": "М200"}),
+	("demand", "Плита перекрытия", "Москва", 100000, None),
+	("sale", "Плита дорожная", "Москва", 90000, None),
+]
+
+
+def _listing(ltype, title, city, price, chars):
+	return Listing(type=ltype, title=title, location=city, price=Decimal(price) if price is not None else None, characteristics=chars)
+
+
+def _pairs(session):
+	return sorted((m.demand_id, m.sale_id, round(m.score, 9)) for m in session.query(Match))
+
+
+def _rebuilt(session):
+	rebuild_matches(session)
+	return _pairs(session)
+
+
+def test_incremental_updates_equal_rebuild(session):
+	for row in LISTINGS:
+		item = _listing(*row)
+		session.add(item)
+		upsert_listing_features(session, item)
+	session.commit()
+	incremental = _pairs(session)
+	assert incremental
+	assert incremental == _rebuilt(session)
+
+
+def test_edit_updates_equal_rebuild(session):
+	items = [_listing(*row) for row in LISTINGS]
+	session.add_all(items)
+	for item in items:
+		upsert_listing_features(session, item)
+	session.commit()
+	items[3].title = "Кирпич красный"
+	items[7].type = "demand"
+	for item in (items[3], items[7]):
+		upsert_listing_features(session, item)
+	session.commit()
+	assert _pairs(session) == _rebuilt(session)
+
+
+def test_batch_update_equals_rebuild(session):
+	first = [_listing(*row) for row in LISTINGS[:4]]
+	session.add_all(first)
+	for item in first:
+		upsert_listing_features(session, item)
+	session.commit()
+	# новые записи обоих типов и изменённая старая — одним пересчётом
+	batch = [_listing(*row) for row in LISTINGS[4:]]
+	session.add_all(batch)
+	first[2].title = "Плита перекрытия пустотная"
+	batch.append(first[2])
+	for item in batch:
+		upsert_listing_features(session, item, update_matches=False)
+	update_matches_for_listings(session, batch)
+	session.commit()
+	assert _pairs(session) == _rebuilt(session)
+
+
+def test_import_matches_in_one_pass(session, monkeypatch):
+	calls = []
+	find = match_store._find
+	monkeypatch.setattr(match_store, "_find", lambda *a, **kw: calls.append(1) or find(*a, **kw))
+	rows = [
+		{"id": None, "type": ltype, "title": title, "location": city, "price": price, "characteristics": None}
+		for ltype, title, city, price, _ in LISTINGS
+	]
+	assert import_listings_from_excel(session, "import.xlsx", rows=rows) == len(LISTINGS)
+	# спросы против всех предложений; новых предложений против старых спросов нет
+	assert len(calls) == 1
+	assert _pairs(session) == _rebuilt(session)
+
+
+def _covers(session, threshold):
+	return covers(session, **asdict(MatchParams(threshold=threshold)))
+
+
+def _store_min_score(monkeypatch, value):
+	monkeypatch.setattr(match_store, "get_settings", lambda: Settings(match_store_min_score=value))
+
+
+def test_covers_uses_stored_params(session, monkeypatch):
+	session.add_all([_listing(*row) for row in LISTINGS])
+	session.commit()
+	assert not _covers(session, 0.45)
+	_store_min_score(monkeypatch, 0.3)
+	assert ensure_matches(session) >= 0
+	assert ensure_matches(session) == -1
+	assert _covers(session, 0.45) and not _covers(session, 0.25)
+	built = _pairs(session)
+	# порог в настройках снижен — таблица по-прежнему посчитана с 0.3 и запросу 0.25 не годится
+	_store_min_score(monkeypatch, 0.2)
+	assert not _covers(session, 0.25)
+	assert ensure_matches(session) >= 0
+	assert stored_params(session).threshold == 0.2
+	assert _covers(session, 0.25)
+	assert set(built) <= set(_pairs(session))
+
+
+def test_refreshed_features_make_table_stale(session):
+	items = [_listing(*row) for row in LISTINGS]
+	session.add_all(items)
+	session.commit()
+	rebuild_matches(session)
+	assert _covers(session, 0.45)
+	assert refresh_stale_features(session) == len(items)
+	assert stored_params(session) is None and not _covers(session, 0.45)
+	assert ensure_matches(session) >= 0
+	assert _covers(session, 0.45)
+
+
+def test_rebuild_during_edit_stays_stale(session, monkeypatch):
+	items = [_listing(*row) for row in LISTINGS]
+	session.add_all(items)
+	session.commit()
+	find = match_store._find
+
+	def edit_while_computing(*args, **kwargs):
+		pairs = find(*args, **kwargs)
+		session.add(_listing("sale", "Форма для кольца новая", "Москва", 100, None))
+		session.flush()
+		return pairs
+
+	monkeypatch.setattr(match_store, "_find", edit_while_computing)
+	rebuild_matches(session)
+	assert stored_params(session) is None
+	monkeypatch.setattr(match_store, "_find", find)
+	assert ensure_matches(session) >= 0
+	assert stored_params(session) is not None
@@ -0,0 +1,74 @@
+import os
+from decimal import Decimal
+
+from app.models.listings import Listing
+from app.services.matching import find_matches, group_listings, iter_matches
+
+
+TITLES = [
+	"Форма для бетонного кольца", "Форма кольца бетонного", "Форма для кольца КС",
+	"Труба стальная 57 мм", "Труба 57 сталь", "Труба стальная",
+	"Кирпич красный", "Кирпич красный облицовочный", "Плита перекрытия", "Плита перекрытия пустотная",
+]
+
+
+def _listings():
+	result = []
+	for i, title in enumerate(TITLES * 3):
+		result.append(Listing(id=i + 1, type="demand" if i % 2 else "sale", title=title, location="Москва", price=Decimal(1000 + i)))
+	return group_listings(result)
+
+
+def _ids(pairs):
+	return [(p.Demand.id, p.Sale.id) for p in pairs]
+
+
+def test_iter_matches_equals_find_matches():
+	demands, sales = _listings()
+	streamed = list(iter_matches(demands, sales, block_size=4, threshold=0.3))
+	assert streamed
+	assert sorted(_ids(streamed)) == sorted(_ids(find_matches(demands, sales, threshold=0.3)))
+
+
+def test_iter_matches_max_pairs():
+	demands, sales = _listings()
+	streamed = list(iter_matches(demands, sales, block_size=4, threshold=0.3))
+	for n in (1, 3, len(streamed), len(streamed) + 5):
+		assert _ids(iter_matches(demands, sales, block_size=4, threshold=0.3, max_pairs=n)) == _ids(streamed)[:n]
+
+
+def test_reweighted_equals_find_matches(monkeypatch):
+	from app.services import match_components
+	from app.services.match_components import find_matches_reweighted, get_component_cache
+	demands, sales = _listings()
+	# построение несколькими блоками спросов
+	monkeypatch.setattr(match_components, "_BUILD_BLOCK_CELLS", 2 * len(sales))
+	get_component_cache().clear()
+	for kw in (dict(threshold=0.3), dict(threshold=0.45, w_loc=0.3), dict(threshold=0.25, top_k_per_demand=1), dict(threshold=0.1)):
+		expected = [(p.Demand.id, p.Sale.id, p.score) for p in find_matches(demands, sales, **kw)]
+		got = [(p.Demand.id, p.Sale.id, p.score) for p in find_matches_reweighted(demands, sales, data_version=1, **kw)]
+		assert got == expected, kw
+	get_component_cache().clear()
+
+
+def test_parallel_blocks_share_pool_and_sales(monkeypatch):
+	from app.config import Settings
+	from app.services import matching, matching_parallel
+	demands, sales = _listings()
+	monkeypatch.setattr(matching, "get_settings", lambda: Settings(match_parallel_min_pairs=0))
+	shipped = []
+	init = matching_parallel.ShippedSales.__init__
+	monkeypatch.setattr(matching_parallel.ShippedSales, "__init__", lambda self, side: shipped.append(self) or init(self, side))
+	expected = [(p.Demand.id, p.Sale.id, p.score) for p in iter_matches(demands, sales, block_size=4, threshold=0.3)]
+	try:
+		got = [(p.Demand.id, p.Sale.id, p.score) for p in iter_matches(demands, sales, block_size=4, threshold=0.3, workers=2)]
+		pool = matching_parallel._pool
+		again = [(p.Demand.id, p.Sale.id, p.score) for p in iter_matches(demands, sales, block_size=4, threshold=0.3, workers=2)]
+		# второй запуск — тот же пул
+		assert pool is not None and matching_parallel._pool is pool
+	finally:
+		matching_parallel.shutdown_pool()
+	assert got == expected == again
+	# предложения уходят воркерам один раз на запуск, а не на каждый блок; файл удаляется
+	assert len(shipped) == 2
+	assert not any(os.path.exists(s.path) for s in shipped)
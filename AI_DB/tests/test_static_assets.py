@@ -0,0 +1,76 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import web
+from app.services import static_assets
+from app.services.static_assets import AssetStaticFiles, BROTLI_AVAILABLE, build_static, static_url
+
+
+CSS = "body { color: #333; }\n" * 200
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+	src = tmp_path / "static"
+	src.mkdir()
+	(src / "styles.css").write_text(CSS, encoding="utf-8")
+	monkeypatch.setattr(static_assets, "STATIC_DIR", src)
+	monkeypatch.setattr(static_assets, "_manifest", (-1.0, {}))
+	return src
+
+
+def test_static_url_without_manifest(static_dir):
+	digest = hashlib.sha256(CSS.encode()).hexdigest()[:12]
+	assert static_url("styles.css") == f"/static/styles.css?v={digest}"
+	assert static_url("/styles.css") == f"/static/styles.css?v={digest}"
+	assert static_url("missing.css") == "/static/missing.css"
+
+
+def test_static_url_with_manifest(static_dir):
+	manifest = build_static(static_dir)
+	hashed = manifest["styles.css"]
+	assert hashed.startswith("styles.") and hashed.endswith(".css")
+	assert static_url("styles.css") == f"/static/dist/{hashed}"
+	dist = static_dir / "dist"
+	assert (dist / hashed).read_text(encoding="utf-8") == CSS
+	assert (dist / (hashed + ".gz")).exists()
+	assert (dist / (hashed + ".br")).exists() == BROTLI_AVAILABLE
+
+
+def test_page_etag_changes_with_manifest(static_dir):
+	build_static(static_dir)
+	etag = web._etag("list", 1)
+	modified = web._last_modified()
+	(static_dir / "styles.css").write_text(CSS + "a { color: red; }\n", encoding="utf-8")
+	build_static(static_dir)
+	manifest = static_dir / "dist" / "manifest.json"
+	# время изменения — заведомо позже прежней сборки
+	stamp = manifest.stat().st_mtime + 10
+	os.utime(manifest, (stamp, stamp))
+	assert web._etag("list", 1) != etag
+	assert web._last_modified() > modified
+
+
+def test_precompressed_assets_served(static_dir):
+	hashed = build_static(static_dir)["styles.css"]
+	a = FastAPI()
+	a.mount("/static", AssetStaticFiles(directory=str(static_dir)), name="static")
+	client = TestClient(a)
+	url = static_url("styles.css")
+	r = client.get(url, headers={"Accept-Encoding": "gzip"})
+	assert r.status_code == 200
+	assert r.headers["content-encoding"] == "gzip"
+	assert r.headers["content-type"] == "text/css; charset=utf-8"
+	assert r.headers["cache-control"] == "public, max-age=31536000, immutable"
+	assert int(r.headers["content-length"]) == (static_dir / "dist" / (hashed + ".gz")).stat().st_size
+	assert r.text == CSS
+	r = client.get(url, headers={"Accept-Encoding": "identity"})
+	assert "content-encoding" not in r.headers
+	assert r.text == CSS
+	r = client.get("/static/styles.css")
+	assert r.headers["cache-control"] == "no-cache"
+	assert client.get("/static/dist/missing.css").status_code == 404
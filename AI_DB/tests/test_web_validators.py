@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from fastapi.responses import HTMLResponse
+from starlette.requests import Request
+
+from app.routers import web
+
+
+def _request(**headers):
+	return Request({"type": "http", "method": "GET", "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_matching_if_none_match_gives_304():
+	etag = web._etag("list", 1, 2)
+	for header in (etag, etag.removeprefix("W/"), '"other", ' + etag, "*"):
+		response = web._not_modified(_request(if_none_match=header), etag)
+		assert response is not None and response.status_code == 304
+		assert response.headers["etag"] == etag
+	assert web._not_modified(_request(if_none_match='W/"other"'), etag) is None
+	assert web._not_modified(_request(), etag) is None
+
+
+def test_etag_depends_on_parts():
+	assert web._etag("list", 1, 2) == web._etag("list", 1, 2)
+	assert web._etag("list", 1, 2) != web._etag("list", 1, 3)
+
+
+def test_if_modified_since():
+	etag = web._etag("detail", 5)
+	modified = web._last_modified(datetime(2030, 1, 1, 12, 0, 0, 500000))
+	assert modified == datetime(2030, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+	same = format_datetime(modified, usegmt=True)
+	older = format_datetime(modified - timedelta(seconds=1), usegmt=True)
+	response = web._not_modified(_request(if_modified_since=same), etag, modified)
+	assert response is not None and response.status_code == 304
+	assert response.headers["last-modified"] == same
+	assert web._not_modified(_request(if_modified_since=older), etag, modified) is None
+	assert web._not_modified(_request(if_modified_since="garbage"), etag, modified) is None
+	# без Last-Modified (список /web) дата не проверяется
+	assert web._not_modified(_request(if_modified_since=same), etag) is None
+	# If-None-Match важнее If-Modified-Since
+	assert web._not_modified(_request(if_modified_since=same, if_none_match='W/"other"'), etag, modified) is None
+
+
+def test_with_etag_headers():
+	modified = datetime(2030, 1, 1, tzinfo=timezone.utc)
+	response = web._with_etag(HTMLResponse("ok"), 'W/"x"', modified)
+	assert response.headers["etag"] == 'W/"x"'
+	assert response.headers["last-modified"] == "Tue, 01 Jan 2030 00:00:00 GMT"
+	assert response.headers["cache-control"] == "private, no-cache"